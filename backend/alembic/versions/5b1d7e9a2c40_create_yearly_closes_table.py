@@ -0,0 +1,48 @@
+"""create yearly_closes table
+
+Revision ID: 5b1d7e9a2c40
+Revises: 34cdd836ac18
+Create Date: 2026-10-19 10:12:41.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1d7e9a2c40'
+down_revision: Union[str, Sequence[str], None] = '34cdd836ac18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('yearly_closes',
+    sa.Column('ticker', sa.Text(), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('trade_date', sa.Date(), nullable=False),
+    sa.Column('close', sa.Numeric(), nullable=True),
+    sa.Column('adjusted_close', sa.Numeric(), nullable=True),
+    sa.PrimaryKeyConstraint('ticker', 'year')
+    )
+
+    # Backfill: último pregão de cada (ticker, ano) já presente em b3_prices
+    op.execute("""
+        INSERT INTO yearly_closes (ticker, year, trade_date, close, adjusted_close)
+        SELECT DISTINCT ON (ticker, EXTRACT(YEAR FROM trade_date))
+               ticker,
+               EXTRACT(YEAR FROM trade_date)::int,
+               trade_date,
+               close,
+               adjusted_close
+        FROM b3_prices
+        ORDER BY ticker, EXTRACT(YEAR FROM trade_date), trade_date DESC
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('yearly_closes')
@@ -0,0 +1,36 @@
+"""create wallet_history table
+
+Revision ID: 8c3f0a6d4e17
+Revises: 5b1d7e9a2c40
+Create Date: 2026-10-19 11:02:07.493551
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c3f0a6d4e17'
+down_revision: Union[str, Sequence[str], None] = '5b1d7e9a2c40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('wallet_history',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('trade_date', sa.Date(), nullable=False),
+    sa.Column('portfolio_value', sa.Float(), nullable=False),
+    sa.Column('invested_value', sa.Float(), nullable=False),
+    sa.Column('benchmark_value', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('user_id', 'trade_date')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('wallet_history')
@@ -0,0 +1,64 @@
+"""create wallet_positions table
+
+Revision ID: a4e2c9b17f53
+Revises: 8c3f0a6d4e17
+Create Date: 2026-10-19 11:48:55.302114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4e2c9b17f53'
+down_revision: Union[str, Sequence[str], None] = '8c3f0a6d4e17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('asset_purchases', sa.Column('price_adjusted', sa.Numeric(), nullable=True))
+    op.create_table('wallet_positions',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('ticker', sa.String(), nullable=False),
+    sa.Column('type', sa.String(), nullable=False),
+    sa.Column('qty', sa.Float(), nullable=False),
+    sa.Column('cost_raw', sa.Float(), nullable=False),
+    sa.Column('cost_adjusted', sa.Float(), nullable=False),
+    sa.Column('min_date', sa.Date(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('user_id', 'ticker')
+    )
+
+    # Backfill: preço ajustado do dia de cada compra (fallback: preço pago)
+    op.execute("""
+        UPDATE asset_purchases ap
+        SET price_adjusted = bp.adjusted_close
+        FROM b3_prices bp
+        WHERE bp.ticker = ap.ticker
+          AND bp.trade_date = ap.trade_date
+          AND bp.adjusted_close > 0
+    """)
+    op.execute("UPDATE asset_purchases SET price_adjusted = price WHERE price_adjusted IS NULL")
+
+    op.execute("""
+        INSERT INTO wallet_positions (user_id, ticker, type, qty, cost_raw, cost_adjusted, min_date)
+        SELECT user_id,
+               ticker,
+               MIN(type),
+               SUM(qty),
+               SUM(qty * price),
+               SUM(qty * price_adjusted),
+               MIN(trade_date)
+        FROM asset_purchases
+        GROUP BY user_id, ticker
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('wallet_positions')
+    op.drop_column('asset_purchases', 'price_adjusted')
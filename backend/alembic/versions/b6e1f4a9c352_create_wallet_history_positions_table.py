@@ -0,0 +1,37 @@
+"""create wallet_history_positions table
+
+Revision ID: b6e1f4a9c352
+Revises: f5c0d2e8b934
+Create Date: 2026-10-19 18:12:41.207314
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6e1f4a9c352'
+down_revision: Union[str, Sequence[str], None] = 'f5c0d2e8b934'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('wallet_history_positions',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('trade_date', sa.Date(), nullable=False),
+    sa.Column('ticker', sa.String(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    sa.Column('invested', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'trade_date', 'ticker')
+    )
+    # A série salva é recalculada na próxima leitura, já gravando as posições junto
+    op.execute("DELETE FROM wallet_history")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('wallet_history_positions')
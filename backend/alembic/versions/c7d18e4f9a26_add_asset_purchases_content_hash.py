@@ -0,0 +1,45 @@
+"""add asset_purchases content_hash
+
+Revision ID: c7d18e4f9a26
+Revises: a4e2c9b17f53
+Create Date: 2026-10-19 14:05:12.417390
+
+"""
+import hashlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d18e4f9a26'
+down_revision: Union[str, Sequence[str], None] = 'a4e2c9b17f53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _content_hash(ticker, asset_type, trade_date, qty, price) -> str:
+    # Mesmo formato de wallet_import.purchase_content_hash (congelado aqui para a migração)
+    key = f"{ticker.upper()}|{asset_type.lower()}|{trade_date.isoformat()}|{float(qty):.6f}|{float(price):.2f}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('asset_purchases', sa.Column('content_hash', sa.String(), nullable=True))
+
+    # Backfill das compras existentes
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT id, ticker, type, trade_date, qty, price FROM asset_purchases")).fetchall()
+    updates = [{"id": r.id, "h": _content_hash(r.ticker, r.type, r.trade_date, r.qty, r.price)} for r in rows]
+    if updates:
+        conn.execute(sa.text("UPDATE asset_purchases SET content_hash = :h WHERE id = :id"), updates)
+
+    op.create_index('ix_asset_purchases_user_content_hash', 'asset_purchases', ['user_id', 'content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_asset_purchases_user_content_hash', table_name='asset_purchases')
+    op.drop_column('asset_purchases', 'content_hash')
@@ -0,0 +1,28 @@
+"""add asset_purchases keyset index
+
+Revision ID: e3a9b5c2d718
+Revises: c7d18e4f9a26
+Create Date: 2026-10-19 15:22:47.903615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a9b5c2d718'
+down_revision: Union[str, Sequence[str], None] = 'c7d18e4f9a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_asset_purchases_user_date_id', 'asset_purchases', ['user_id', 'trade_date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_asset_purchases_user_date_id', table_name='asset_purchases')
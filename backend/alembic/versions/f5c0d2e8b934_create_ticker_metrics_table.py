@@ -0,0 +1,55 @@
+"""create ticker_metrics table
+
+Revision ID: f5c0d2e8b934
+Revises: e3a9b5c2d718
+Create Date: 2026-10-19 16:40:03.558120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5c0d2e8b934'
+down_revision: Union[str, Sequence[str], None] = 'e3a9b5c2d718'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ticker_metrics',
+    sa.Column('ticker', sa.Text(), nullable=False),
+    sa.Column('type', sa.Text(), nullable=False),
+    sa.Column('price', sa.Float(), nullable=True),
+    sa.Column('adjusted_price', sa.Float(), nullable=True),
+    sa.Column('mm200', sa.Float(), nullable=True),
+    sa.Column('cagr', sa.Float(), nullable=True),
+    sa.Column('adjusted_cagr', sa.Float(), nullable=True),
+    sa.Column('sharpe', sa.Float(), nullable=True),
+    sa.Column('zscore', sa.Float(), nullable=True),
+    sa.Column('data_points', sa.Integer(), nullable=False),
+    sa.Column('tag', sa.Text(), nullable=False),
+    sa.Column('last_date', sa.Date(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('ticker')
+    )
+
+    # Backfill: indicadores de todo o universo já presente em b3_prices, com o mesmo cálculo do
+    # screener. Depois disso a tabela é mantida ticker a ticker pelo /sync e pela rotina noturna
+    # (.github/workflows/screener-refresh.yml -> POST /analysis/screener/refresh).
+    from sqlalchemy.orm import Session
+    from backend.source.features.analysis.analysis_screener import refresh_ticker_metrics
+
+    session = Session(bind=op.get_bind())
+    try:
+        refresh_ticker_metrics(session)
+    finally:
+        session.close()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ticker_metrics')
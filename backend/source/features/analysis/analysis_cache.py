@@ -0,0 +1,123 @@
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+from sqlalchemy import bindparam, func, text
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import B3Price, IpcaHistory
+
+# Limites do cache em memória (por processo)
+ANALYSIS_CACHE_MAX_ENTRIES = 1024
+ANALYSIS_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+class ResultCache:
+    """
+    LRU de resultados prontos, limitado por número de entradas e por bytes. Guarda o resultado
+    serializado (pickle), então o limite conta o que fica de fato em memória e cada leitura
+    recebe uma cópia própria. A chave deve incluir a marca d'água dos dados de entrada, então um
+    sync que traz pregão novo gera chave nova e a entrada antiga sai pelo LRU.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, frozenset]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], tags: Iterable[str] = ()) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                payload = entry[0]
+            else:
+                payload = None
+                self.misses += 1
+        if payload is not None:
+            return pickle.loads(payload)
+
+        # Calcula fora do lock; duas requisições simultâneas podem calcular a mesma chave
+        value = compute()
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return value
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (payload, frozenset(tags))
+            self._bytes += len(payload)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def invalidate(self, tag: str) -> int:
+        """Remove as entradas marcadas com `tag` (ex.: ticker ressincronizado no mesmo dia)."""
+        with self._lock:
+            keys = [k for k, (_, tags) in self._entries.items() if tag in tags]
+            for key in keys:
+                self._drop(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total * 100, 1) if total else 0.0
+            }
+
+    def _drop(self, key: Hashable) -> None:
+        payload, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+
+analysis_cache = ResultCache(ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_BYTES)
+
+
+# ==========================================
+#  MARCAS D'ÁGUA (ÚLTIMO DADO DE CADA ENTRADA)
+# ==========================================
+
+def price_watermarks(db: Session, tickers: List[str]) -> Tuple:
+    """Último pregão de cada ticker na b3_prices, numa consulta: ((ticker, data), ...)."""
+    rows = db.query(B3Price.ticker, func.max(B3Price.trade_date)) \
+        .filter(B3Price.ticker.in_(tickers)).group_by(B3Price.ticker).all()
+    return tuple(sorted((t, d.isoformat()) for t, d in rows))
+
+
+def dividend_watermark(db: Session, ticker: str):
+    return db.execute(text("SELECT max(trade_date) FROM b3_fiis_dividends WHERE ticker = :ticker"),
+                      {"ticker": ticker}).scalar()
+
+
+def dividend_watermarks(db: Session, tickers: List[str]) -> Tuple:
+    """Último mês com provento de cada FII: ((ticker, data), ...)."""
+    stmt = text("SELECT ticker, max(trade_date) FROM b3_fiis_dividends WHERE ticker IN :tickers GROUP BY ticker") \
+        .bindparams(bindparam("tickers", expanding=True))
+    rows = db.execute(stmt, {"tickers": tickers}).fetchall()
+    return tuple(sorted((t, str(d)) for t, d in rows))
+
+
+def ipca_watermark(db: Session):
+    return db.query(func.max(IpcaHistory.ref_date)).scalar()
@@ -0,0 +1,44 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+MAX_CORRELATION_TICKERS = 60
+MAX_CORRELATION_WINDOW = 1260
+CORRELATION_METHODS = ("pearson", "spearman")
+
+
+def daily_returns(close: pd.DataFrame, adjusted: pd.DataFrame) -> pd.DataFrame:
+    """
+    Retornos diários data x ticker pelo preço ajustado (fechamento quando o ajustado falta).
+    Dia sem pregão de um ticker fica NaN, assim como o retorno do pregão seguinte.
+    """
+    prices = adjusted.where(adjusted > 0, close)
+    return prices.pct_change(fill_method=None).iloc[1:]
+
+
+def _matrix(frame: pd.DataFrame, decimals: int) -> List[List]:
+    values = frame.to_numpy(dtype=float).round(decimals)
+    return [[None if np.isnan(v) else v for v in row] for row in values.tolist()]
+
+
+def compute_correlation(returns: pd.DataFrame, windows: List[int], method: str, min_periods: int) -> Dict:
+    """
+    Correlação (pearson/spearman), covariância diária e nº de observações por par, nos últimos
+    `window` pregões de cada janela. Pares com menos de `min_periods` dias em comum ficam None.
+    Tudo pairwise-complete: cada par usa os dias em que os dois têm retorno.
+    """
+    result = {}
+    for window in windows:
+        frame = returns.iloc[-window:]
+        present = frame.notna().to_numpy(dtype=float)
+        observations = present.T @ present
+
+        result[str(window)] = {
+            "start": frame.index[0].strftime('%Y-%m-%d') if len(frame) else None,
+            "end": frame.index[-1].strftime('%Y-%m-%d') if len(frame) else None,
+            "correlation": _matrix(frame.corr(method=method, min_periods=min_periods), 4),
+            "covariance": _matrix(frame.cov(min_periods=min_periods), 8),
+            "observations": observations.astype(int).tolist()
+        }
+    return result
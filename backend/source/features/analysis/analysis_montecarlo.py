@@ -0,0 +1,166 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend.source.features.analysis.analysis_simulation import share_paths
+
+MAX_MONTE_CARLO_PATHS = 200_000
+MAX_MONTE_CARLO_HORIZON = 600
+# Células (mês x caminho) por lote vetorizado: o nº de caminhos do lote sai do horizonte, então cada
+# matriz do lote fica em ~4 MB e o pico do lote (~10 matrizes vivas) em ~40 MB, qualquer que seja o horizonte
+MONTE_CARLO_BATCH_CELLS = 500_000
+# Pico de um worker: lote em andamento + interpretador com numpy/pandas importados
+MONTE_CARLO_WORKER_BYTES = 10 * MONTE_CARLO_BATCH_CELLS * 8 + 80 * 1024 * 1024
+# Fração da memória da máquina/container que o pool pode ocupar
+MONTE_CARLO_POOL_MEMORY_SHARE = 0.5
+# Abaixo disso roda no próprio processo; acima, os lotes vão para o pool (se houver 2+ CPUs livres)
+MONTE_CARLO_POOL_MIN_PATHS = 20_000
+# Máquinas de CPU compartilhada: poucos workers, mesmo com mais núcleos visíveis
+MONTE_CARLO_MAX_WORKERS = 4
+MONTE_CARLO_PERCENTILES = (5, 25, 50, 75, 95)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _memory_limit() -> Optional[int]:
+    # Limite do container (cgroup v2/v1); sem ele, a memória física da máquina
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < 1 << 60:
+                return int(value)
+        except OSError:
+            continue
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _pool_workers() -> int:
+    # CPUs que o processo pode usar de fato (cgroup/affinity), deixando uma para o servidor,
+    # e só quantos workers cabem na fatia de memória do pool
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    workers = min(MONTE_CARLO_MAX_WORKERS, cpus - 1)
+    memory = _memory_limit()
+    if memory is not None:
+        workers = min(workers, int(memory * MONTE_CARLO_POOL_MEMORY_SHARE) // MONTE_CARLO_WORKER_BYTES)
+    return workers
+
+
+def batch_paths(horizon: int) -> int:
+    """Caminhos por lote para que a matriz (horizonte + 1) x caminhos caiba em MONTE_CARLO_BATCH_CELLS."""
+    return max(1, MONTE_CARLO_BATCH_CELLS // (horizon + 1))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Pool criado na primeira simulação grande e reaproveitado; spawn evita fork de um processo com threads
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_pool_workers(),
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def monthly_samples(df: pd.DataFrame):
+    """Pares (retorno mensal do preço, dividend yield do mês) da série do FII, na ordem do tempo."""
+    prices = df['price_close'].to_numpy(dtype=float)
+    dividends = df['dividend_value'].to_numpy(dtype=float)
+    returns = prices[1:] / prices[:-1] - 1
+    yields = dividends[1:] / prices[1:]
+    return returns, yields
+
+
+def _run_batch(task: Dict) -> Dict[str, np.ndarray]:
+    """
+    Um lote de caminhos: block bootstrap dos pares (retorno, yield), preço e provento de cada mês
+    e as cotas dos dois cenários em matriz (mês x caminho). Roda no worker ou no próprio processo.
+    """
+    rng = np.random.default_rng(task["seed"])
+    returns, yields = task["returns"], task["yields"]
+    n_paths, horizon, block = task["paths"], task["horizon"], task["block"]
+
+    # Blocos contíguos de `block` meses sorteados com reposição, concatenados até o horizonte
+    n_blocks = -(-horizon // block)
+    starts = rng.integers(0, len(returns) - block + 1, size=(n_paths, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :horizon].T
+
+    prices = np.empty((horizon + 1, n_paths))
+    prices[0] = task["start_price"]
+    prices[1:] = task["start_price"] * np.cumprod(1 + returns[idx], axis=0)
+    dividends = np.zeros_like(prices)
+    dividends[1:] = yields[idx] * prices[1:]
+
+    reinvest, no_reinvest = share_paths(prices, dividends, task["initial"], task["monthly"])
+    return {
+        "reinvest_final": reinvest[-1] * prices[-1],
+        "no_reinvest_final": no_reinvest[-1] * prices[-1],
+        "withdrawn": (no_reinvest[:-1] * dividends[1:]).sum(axis=0),
+        "final_income": reinvest[-2] * dividends[-1],
+    }
+
+
+def run_monte_carlo(df: pd.DataFrame, initial: float, monthly: float, horizon: int, paths: int,
+                    block: int, seed: int) -> Dict:
+    """
+    Simulação estocástica do /simulation/fii: `paths` caminhos de `horizon` meses partindo do último
+    preço, com retornos e yields reamostrados em blocos do histórico. Os lotes têm sementes filhas
+    fixas da `seed`, então o resultado é o mesmo rodando no pool ou no próprio processo.
+    """
+    returns, yields = monthly_samples(df)
+    block = min(block, len(returns))
+
+    per_batch = batch_paths(horizon)
+    batch_sizes = [per_batch] * (paths // per_batch)
+    if paths % per_batch:
+        batch_sizes.append(paths % per_batch)
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+
+    tasks = [{
+        "seed": s, "paths": size, "horizon": horizon, "block": block,
+        "returns": returns, "yields": yields, "start_price": float(df['price_close'].iloc[-1]),
+        "initial": initial, "monthly": monthly,
+    } for s, size in zip(seeds, batch_sizes)]
+
+    if paths >= MONTE_CARLO_POOL_MIN_PATHS and _pool_workers() >= 2:
+        batches: List[Dict] = list(_get_pool().map(_run_batch, tasks))
+    else:
+        batches = [_run_batch(t) for t in tasks]
+
+    results = {k: np.concatenate([b[k] for b in batches]) for k in batches[0]}
+    invested = initial + monthly * horizon
+
+    def bands(values: np.ndarray) -> Dict:
+        pct = np.percentile(values, MONTE_CARLO_PERCENTILES)
+        out = {f"p{p}": round(float(v), 2) for p, v in zip(MONTE_CARLO_PERCENTILES, pct)}
+        out["mean"] = round(float(values.mean()), 2)
+        return out
+
+    return {
+        "seed": seed,
+        "paths": paths,
+        "horizon_months": horizon,
+        "block_months": block,
+        "history": {
+            "start": df['trade_date'].iloc[0].strftime('%Y-%m-%d'),
+            "end": df['trade_date'].iloc[-1].strftime('%Y-%m-%d'),
+            "months": len(returns)
+        },
+        "totalInvested": round(invested, 2),
+        "reinvestFinalValue": bands(results["reinvest_final"]),
+        "noReinvestFinalValue": bands(results["no_reinvest_final"]),
+        "totalDividendsWithdrawn": bands(results["withdrawn"]),
+        "finalMonthlyIncome": bands(results["final_income"]),
+        "probabilityOfLoss": {
+            "reinvest": round(float((results["reinvest_final"] < invested).mean() * 100), 2),
+            "noReinvest": round(float((results["no_reinvest_final"] + results["withdrawn"] < invested).mean() * 100), 2)
+        }
+    }
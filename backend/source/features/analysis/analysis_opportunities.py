@@ -0,0 +1,125 @@
+from datetime import date
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import B3Price
+
+# Janela de preços buscada (dias corridos) e parâmetros dos indicadores (pregões)
+OPPORTUNITY_WINDOW_DAYS = 540
+MM_WINDOW = 200
+CAGR_LOOKBACK = 252
+
+KNOWN_ETFS = ("IVVB11", "QQQQ11", "BOVA11", "SMAL11", "XINA11", "HASH11", "GOLD11")
+
+
+def classify_asset_type(ticker: str) -> str:
+    t_upper = ticker.upper()
+    if t_upper.endswith("11"):
+        return "ETF" if t_upper in KNOWN_ETFS else "FII"
+    if t_upper.endswith("34") or t_upper.endswith("33"):
+        return "BDR"
+    return "STOCK"
+
+
+def load_price_panel(db: Session, tickers: List[str], start: date) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Fechamento e ajustado em matrizes data x ticker, numa única consulta (sem ffill: NaN = sem pregão)."""
+    rows = db.query(B3Price.ticker, B3Price.trade_date, B3Price.close, B3Price.adjusted_close) \
+        .filter(B3Price.ticker.in_(tickers), B3Price.trade_date >= start).all()
+    if not rows:
+        return pd.DataFrame(), pd.DataFrame()
+
+    df = pd.DataFrame(rows, columns=['ticker', 'trade_date', 'close', 'adjusted_close'])
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    df['close'] = pd.to_numeric(df['close']).astype(float)
+    df['adjusted_close'] = pd.to_numeric(df['adjusted_close']).astype(float)
+
+    close = df.pivot(index='trade_date', columns='ticker', values='close').sort_index()
+    adjusted = df.pivot(index='trade_date', columns='ticker', values='adjusted_close').reindex_like(close)
+    return close, adjusted
+
+
+def _bottom_align(matrix: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """
+    Empurra os valores válidos de cada coluna para o fim, mantendo a ordem: a linha -k passa a ser
+    o k-ésimo pregão mais recente de cada ticker (o iloc[-k] da série individual).
+    """
+    order = np.argsort(valid, axis=0, kind='stable')
+    return np.take_along_axis(matrix, order, axis=0)
+
+
+def compute_opportunities(close: pd.DataFrame, adjusted: pd.DataFrame) -> List[Dict]:
+    """
+    MM200, CAGR de 1 ano (bruto e ajustado) e Sharpe de todos os tickers de uma vez.
+    Cada ticker conta os próprios pregões (linhas sem preço são ignoradas), como numa série por ticker.
+    """
+    if close.empty:
+        return []
+
+    valid = close.notna().to_numpy()
+    n_rows = valid.shape[0]
+    columns = np.arange(valid.shape[1])
+    data_points = valid.sum(axis=0)
+
+    prices = _bottom_align(close.to_numpy(dtype=float), valid)
+    adj = _bottom_align(adjusted.to_numpy(dtype=float), valid)
+    dates = _bottom_align(np.broadcast_to(close.index.to_numpy()[:, None], valid.shape), valid)
+
+    current = prices[-1]
+
+    # MM200: média dos últimos 200 pregões de cada ticker (só com histórico suficiente)
+    enough = data_points >= MM_WINDOW
+    mm200 = np.where(enough, prices[-MM_WINDOW:].mean(axis=0) if n_rows >= MM_WINDOW else current, current)
+
+    # Sharpe anualizado dos retornos diários da janela inteira
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = prices[1:] / prices[:-1] - 1
+    finite = np.isfinite(returns)
+    n_returns = finite.sum(axis=0)
+    returns = np.where(finite, returns, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = returns.sum(axis=0) / n_returns
+        deviations = np.where(finite, returns - mean, 0.0)
+        std = np.sqrt((deviations ** 2).sum(axis=0) / (n_returns - 1))
+        sharpe = np.where(enough & (n_returns > 1) & (std > 0), mean / std * np.sqrt(252), 0.0)
+
+    # Janela do CAGR: iloc[-252] de cada ticker (ou desde o 2º pregão com menos histórico)
+    lookback = np.where(data_points >= CAGR_LOOKBACK, CAGR_LOOKBACK, data_points - 1)
+    start_pos = np.where(lookback > 0, n_rows - lookback, n_rows - data_points)
+    price_start = prices[start_pos, columns]
+    adj_start = adj[start_pos, columns]
+    adj_end = adj[-1]
+    adj_start = np.where(adj_start > 0, adj_start, price_start)
+    adj_end = np.where(adj_end > 0, adj_end, current)
+
+    cagr = (current / price_start - 1) * 100
+    adjusted_cagr = (adj_end / adj_start - 1) * 100
+    start_dates = pd.to_datetime(dates[start_pos, columns])
+    end_dates = pd.to_datetime(dates[-1])
+
+    results = []
+    for i, ticker in enumerate(close.columns):
+        results.append({
+            "ticker": ticker,
+            "type": classify_asset_type(ticker),
+            "price": round(float(current[i]), 2),
+            "adjusted_price": round(float(adj_end[i]), 2),
+            "mm200": round(float(mm200[i]), 2),
+            "cagr": round(float(cagr[i]), 2),
+            "adjusted_cagr": round(float(adjusted_cagr[i]), 2),
+            "sharpe": round(float(sharpe[i]), 2),
+            "tag": "OK" if enough[i] else "INCOMPLETE",
+            "data_points": int(data_points[i]),
+            "calc_window": {
+                "start": start_dates[i].strftime('%Y-%m-%d'),
+                "end": end_dates[i].strftime('%Y-%m-%d'),
+                "days": int(lookback[i])
+            }
+        })
+
+    # Ordena: Primeiro os "OK" por CAGR, depois os "INCOMPLETE" no final
+    results.sort(key=lambda x: (x['tag'] == 'OK', x['cagr']), reverse=True)
+    return results
+
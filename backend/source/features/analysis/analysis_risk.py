@@ -0,0 +1,176 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import IbovHistory
+from backend.source.features.wallet.wallet_history import load_purchases_frame, build_value_matrices
+from backend.source.features.wallet.wallet_benchmarks import load_benchmark_levels
+
+TRADING_DAYS = 252
+RISK_BENCHMARKS = ("ibov", "ifix")
+VAR_LEVELS = (95, 99)
+DEFAULT_VOL_WINDOW = 21
+
+
+def _trading_days(db: Session, index: pd.DatetimeIndex) -> np.ndarray:
+    # Pregões da B3 pelo calendário do IBOV; sem dados do índice, dias úteis
+    rows = db.query(IbovHistory.trade_date) \
+        .filter(IbovHistory.trade_date >= index[0].date(), IbovHistory.trade_date <= index[-1].date()).all()
+    if rows:
+        return index.isin(pd.to_datetime([d for (d,) in rows]))
+    return index.dayofweek < 5
+
+
+def holdings_returns(price_matrix: pd.DataFrame, holdings_matrix: pd.DataFrame) -> pd.DataFrame:
+    """
+    Retornos diários de cada posição (só nos dias em que estava na carteira no pregão anterior)
+    e da carteira ("__wallet__"): variação de valor das quantidades do dia anterior, sem os aportes.
+    """
+    prev_holdings = holdings_matrix.shift(1)
+    prev_prices = price_matrix.shift(1)
+
+    positions = (price_matrix / prev_prices - 1).where(prev_holdings > 0)
+
+    prev_value = (prev_holdings * prev_prices).fillna(0.0).sum(axis=1)
+    pnl = (prev_holdings * (price_matrix - prev_prices)).fillna(0.0).sum(axis=1)
+    wallet = (pnl / prev_value).where(prev_value > 0)
+
+    returns = positions.copy()
+    returns["__wallet__"] = wallet
+    return returns.iloc[1:]
+
+
+def _max_drawdowns(returns: np.ndarray, valid: np.ndarray, dates: pd.DatetimeIndex) -> list:
+    # Índice de retorno acumulado (dias sem retorno = parado), pico corrente e pior queda de cada coluna
+    level = np.cumprod(1 + np.where(valid, returns, 0.0), axis=0)
+    peak = np.maximum.accumulate(level, axis=0)
+    drawdown = level / peak - 1
+
+    rows = np.arange(level.shape[0])[:, None]
+    trough = drawdown.argmin(axis=0)
+    peak_row = np.where(rows <= trough, level, -np.inf).argmax(axis=0)
+    peak_value = level[peak_row, np.arange(level.shape[1])]
+    recovered = (rows > trough) & (level >= peak_value)
+    recovery_row = np.where(recovered.any(axis=0), recovered.argmax(axis=0), -1)
+
+    result = []
+    for j in range(level.shape[1]):
+        depth = drawdown[trough[j], j]
+        result.append({
+            "value": round(float(depth * 100), 2),
+            "peak": dates[peak_row[j]].strftime('%Y-%m-%d') if depth < 0 else None,
+            "trough": dates[trough[j]].strftime('%Y-%m-%d') if depth < 0 else None,
+            "recovery": dates[recovery_row[j]].strftime('%Y-%m-%d') if depth < 0 and recovery_row[j] >= 0 else None
+        })
+    return result
+
+
+def _column_quantiles(values: np.ndarray, count: np.ndarray, q: float) -> np.ndarray:
+    # Quantil (interpolação linear, como np.quantile) de cada coluna ignorando NaN: o sort joga os NaN para o fim
+    ordered = np.sort(values, axis=0)
+    position = np.maximum(count - 1, 0) * q
+    low = np.floor(position).astype(int)
+    high = np.ceil(position).astype(int)
+    columns = np.arange(values.shape[1])
+    low_values, high_values = ordered[low, columns], ordered[high, columns]
+    return np.where(count > 0, low_values + (high_values - low_values) * (position - low), np.nan)
+
+
+def compute_risk_metrics(returns: pd.DataFrame, bench_returns: pd.DataFrame,
+                         vol_window: int) -> Tuple[Dict[str, Dict], pd.DataFrame]:
+    """
+    Volatilidade (anualizada), drawdown máximo com datas, VaR/CVaR históricos e beta contra cada
+    benchmark para todas as colunas de uma vez. Cada coluna usa só os dias em que tem retorno.
+    Retorna (métricas por coluna, volatilidade móvel anualizada).
+    """
+    values = returns.to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    filled = np.where(valid, values, 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = filled.sum(axis=0) / count
+        deviations = np.where(valid, values - mean, 0.0)
+        volatility = np.sqrt((deviations ** 2).sum(axis=0) / (count - 1)) * np.sqrt(TRADING_DAYS)
+
+        # VaR/CVaR históricos: perda no quantil e perda média além dele
+        var, cvar = {}, {}
+        for level in VAR_LEVELS:
+            quantile = _column_quantiles(values, count, 1 - level / 100)
+            tail = valid & (values <= quantile)
+            var[level] = -quantile
+            cvar[level] = -np.where(tail, values, 0.0).sum(axis=0) / tail.sum(axis=0)
+
+        # Beta: cov(ativo, índice) / var(índice) nos dias em que os dois têm retorno
+        betas = {}
+        for name in bench_returns.columns:
+            bench = bench_returns[name].to_numpy(dtype=float)[:, None]
+            both = valid & ~np.isnan(bench)
+            n = both.sum(axis=0)
+            x_mean = np.where(both, values, 0.0).sum(axis=0) / n
+            y_mean = np.where(both, bench, 0.0).sum(axis=0) / n
+            cov = np.where(both, (values - x_mean) * (bench - y_mean), 0.0).sum(axis=0)
+            var_bench = np.where(both, (bench - y_mean) ** 2, 0.0).sum(axis=0)
+            betas[name] = np.where((n > 1) & (var_bench > 0), cov / var_bench, np.nan)
+
+    rolling = returns.rolling(vol_window, min_periods=vol_window).std() * np.sqrt(TRADING_DAYS)
+    drawdowns = _max_drawdowns(values, valid, returns.index)
+
+    def pct(v) -> Optional[float]:
+        return round(float(v) * 100, 2) if np.isfinite(v) else None
+
+    metrics = {}
+    for j, column in enumerate(returns.columns):
+        last_rolling = rolling[column].dropna()
+        metrics[column] = {
+            "observations": int(count[j]),
+            "volatility": pct(volatility[j]),
+            "rolling_volatility": pct(last_rolling.iloc[-1]) if len(last_rolling) else None,
+            "max_drawdown": drawdowns[j],
+            "var": {str(level): pct(var[level][j]) for level in VAR_LEVELS},
+            "cvar": {str(level): pct(cvar[level][j]) for level in VAR_LEVELS},
+            "beta": {name: round(float(b[j]), 3) if np.isfinite(b[j]) else None for name, b in betas.items()},
+        }
+    return metrics, rolling
+
+
+def compute_wallet_risk(db: Session, user_id: str, vol_window: int = DEFAULT_VOL_WINDOW) -> Optional[Dict]:
+    """Métricas de risco da carteira e de cada posição sobre a matriz holdings x preço do histórico."""
+    df_purchases = load_purchases_frame(db, user_id)
+    if df_purchases.empty:
+        return None
+
+    price_matrix, holdings_matrix = build_value_matrices(db, df_purchases)
+    if price_matrix is None:
+        return None
+
+    # Mesma matriz diária do histórico, restrita aos pregões (fim de semana/feriado não é retorno zero)
+    trading = _trading_days(db, price_matrix.index)
+    price_matrix, holdings_matrix = price_matrix[trading], holdings_matrix[trading]
+    if len(price_matrix) < 3:
+        return None
+
+    returns = holdings_returns(price_matrix, holdings_matrix)
+    levels = load_benchmark_levels(db, list(RISK_BENCHMARKS), price_matrix.index)
+    bench_returns = (levels / levels.shift(1) - 1).iloc[1:].dropna(axis=1, how='all')
+
+    metrics, rolling = compute_risk_metrics(returns, bench_returns, vol_window)
+    rolling = rolling["__wallet__"].dropna()
+    wallet = metrics.pop("__wallet__")
+    wallet["rolling_volatility_series"] = [
+        {"trade_date": ts.strftime('%Y-%m-%d'), "value": round(float(v) * 100, 2)} for ts, v in rolling.items()
+    ]
+
+    return {
+        "period": {
+            "start": returns.index[0].strftime('%Y-%m-%d'),
+            "end": returns.index[-1].strftime('%Y-%m-%d'),
+            "trading_days": len(returns)
+        },
+        "vol_window": vol_window,
+        "benchmarks": bench_returns.columns.tolist(),
+        "wallet": wallet,
+        "positions": metrics
+    }
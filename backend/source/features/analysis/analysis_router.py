@@ -1,14 +1,52 @@
+import os
+import secrets
+from typing import Optional
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from fastapi import APIRouter, HTTPException, Depends, Header
+from sqlalchemy.orm import Session
 from backend.source.core.db import get_supabase
-from backend.source.features.analysis.analysis_schema import SimulationRequest
+from backend.source.core.database import get_db
+from backend.source.models.sql_models import AssetPurchase
+from backend.source.features.analysis.analysis_opportunities import (
+    OPPORTUNITY_WINDOW_DAYS, load_price_panel, compute_opportunities
+)
+from backend.source.features.analysis.analysis_screener import (
+    SCREENER_SORT_FIELDS, SCREENER_RANGE_FIELDS, query_screener, refresh_ticker_metrics
+)
+from backend.source.features.analysis.analysis_zscore import (
+    MAX_ZSCORE_TICKERS, ZSCORE_BATCH_WINDOWS, zscore_status, load_close_matrix, compute_zscore_batch
+)
+from backend.source.features.analysis.analysis_simulation import (
+    MAX_SWEEP_CELLS, MAX_PORTFOLIO_ASSETS, load_fii_dividends, load_ipca_factors, load_fii_dividend_panel,
+    simulate_reinvestment, sweep_reinvestment, simulate_portfolio, fill_panel_gaps
+)
+from backend.source.features.analysis.analysis_montecarlo import (
+    MAX_MONTE_CARLO_PATHS, MAX_MONTE_CARLO_HORIZON, run_monte_carlo
+)
+from backend.source.features.analysis.analysis_correlation import (
+    MAX_CORRELATION_TICKERS, MAX_CORRELATION_WINDOW, CORRELATION_METHODS, daily_returns, compute_correlation
+)
+from backend.source.features.analysis.analysis_risk import DEFAULT_VOL_WINDOW, compute_wallet_risk
+from backend.source.features.analysis.analysis_cache import (
+    analysis_cache, price_watermarks, dividend_watermark, dividend_watermarks, ipca_watermark
+)
+from backend.source.features.analysis.analysis_schema import (
+    SimulationRequest, SimulationSweepRequest, PortfolioSimulationRequest, MonteCarloRequest,
+    ScreenerFilters, ZScoreBatchRequest, CorrelationParams
+)
 from backend.source.features.auth.jwt_identity_extraction import get_current_user
 
 analysis_bp = APIRouter(prefix="/analysis", tags=["Analysis"])
 
 @analysis_bp.get("/zscore/{ticker}")
-def calculate_zscore(ticker: str, window_months: int = 12):
+def calculate_zscore(ticker: str, window_months: int = 12, db: Session = Depends(get_db)):
+    key = ("zscore", ticker.upper(), window_months, price_watermarks(db, [ticker.upper()]))
+    return analysis_cache.get_or_compute(key, lambda: _compute_zscore(ticker, window_months),
+                                         tags=[ticker.upper()])
+
+def _compute_zscore(ticker: str, window_months: int):
     supabase = get_supabase()
 
     # 1. Fetch Price History
@@ -56,13 +94,7 @@ def calculate_zscore(ticker: str, window_months: int = 12):
     percentile = (days_below / total_days) * 100 if total_days > 0 else 0
 
     # Status Logic
-    status = "Neutro"
-    if std_dev == 0: status = "Sem variação"
-    elif z_score <= -2: status = "🔥 Muito barato (Z ≤ -2)"
-    elif z_score <= -1: status = "✅ Barato (−2 < Z ≤ −1)"
-    elif z_score < 1: status = "➖ Zona neutra (−1 < Z < 1)"
-    elif z_score < 2: status = "⚠️ Caro (1 ≤ Z < 2)"
-    else: status = "❌ Muito caro (Z ≥ 2)"
+    status = zscore_status(z_score, std_dev)
 
     # Format chart data
     chart_data = df_window[['trade_date', 'close']].rename(columns={'trade_date': 'date'}).to_dict(orient='records')
@@ -87,328 +119,306 @@ def calculate_zscore(ticker: str, window_months: int = 12):
         "chart_data": chart_data
     }
 
+@analysis_bp.post("/zscore/batch")
+def calculate_zscore_batch(payload: ZScoreBatchRequest, db: Session = Depends(get_db)):
+    """
+    Z-score de vários tickers em várias janelas (meses) numa chamada: o histórico de todos vem
+    numa única consulta e as estatísticas de cada janela saem numa passada vetorizada.
+    Mesmas contas e formato de "stats" do GET /zscore/{ticker}.
+    """
+    tickers = list(dict.fromkeys(t.strip().upper() for t in payload.tickers if t.strip()))
+    windows = sorted(set(payload.windows))
+    if not tickers or len(tickers) > MAX_ZSCORE_TICKERS:
+        raise HTTPException(status_code=400, detail=f"Informe de 1 a {MAX_ZSCORE_TICKERS} tickers")
+    if not windows or any(w not in ZSCORE_BATCH_WINDOWS for w in windows):
+        raise HTTPException(status_code=400,
+                            detail=f"Janelas aceitas: {', '.join(map(str, ZSCORE_BATCH_WINDOWS))}")
+    if payload.series_window is not None and payload.series_window not in ZSCORE_BATCH_WINDOWS:
+        raise HTTPException(status_code=400, detail="series_window inválida")
+
+    close = load_close_matrix(db, tickers, max(windows))
+    results = compute_zscore_batch(close, windows, payload.include_series, payload.series_window) \
+        if not close.empty else {}
+
+    return {
+        "windows": windows,
+        "results": results,
+        "missing": [t for t in tickers if t not in results]
+    }
+
 @analysis_bp.post("/simulation/fii")
-def simulate_fii(payload: SimulationRequest):
-    supabase = get_supabase()
+def simulate_fii(payload: SimulationRequest, db: Session = Depends(get_db)):
     ticker = payload.ticker.upper()
+    last_date = dividend_watermark(db, ticker)
+    if last_date is None:
+        raise HTTPException(status_code=404, detail="No dividend history found for this ticker")
 
-    # 1. Fetch Data
+    key = ("simulate_fii", ticker, payload.initial_investment, payload.monthly_deposit, payload.months,
+           last_date, ipca_watermark(db))
+    return analysis_cache.get_or_compute(key, lambda: _simulate_fii(db, payload, last_date), tags=[ticker])
 
-    # A. Dividends
-    div_resp = supabase.table("b3_fiis_dividends") \
-        .select("trade_date,price_close,dividend_value") \
-        .eq("ticker", ticker) \
-        .order("trade_date", desc=False) \
-        .execute()
+def _simulate_fii(db: Session, payload: SimulationRequest, last_date):
+    # 1. Fetch Data: só os meses da janela pedida, contada a partir do último provento
+    min_date = pd.Timestamp(last_date) - pd.DateOffset(months=payload.months)
+    df_sim = load_fii_dividends(db, payload.ticker.upper(), min_date.date())
 
-    if not div_resp.data:
-        raise HTTPException(status_code=404, detail="No dividend history found for this ticker")
+    if df_sim.empty:
+        raise HTTPException(status_code=400, detail="Requested period exceeds available history")
 
-    df_div = pd.DataFrame(div_resp.data)
-    df_div['trade_date'] = pd.to_datetime(df_div['trade_date'])
-    df_div['price_close'] = pd.to_numeric(df_div['price_close'])
-    df_div['dividend_value'] = pd.to_numeric(df_div['dividend_value'])
+    ipca_map = load_ipca_factors(db, df_sim['trade_date'].min(), df_sim['trade_date'].max())
 
-    # Filter by requested months
-    max_date = df_div['trade_date'].max()
-    min_date = max_date - pd.DateOffset(months=payload.months)
+    # 2. Simulation Logic (vetorizada)
+    return simulate_reinvestment(df_sim, ipca_map, payload.initial_investment, payload.monthly_deposit)
 
-    df_sim = df_div[df_div['trade_date'] >= min_date].copy()
 
-    if df_sim.empty:
-        raise HTTPException(status_code=400, detail="Requested period exceeds available history")
+@analysis_bp.post("/simulation/fii/sweep")
+def simulate_fii_sweep(payload: SimulationSweepRequest, db: Session = Depends(get_db)):
+    """
+    Resumo do /simulation/fii para cada combinação de aporte inicial, aporte mensal e meses,
+    sobre uma única leitura da série do FII. Matrizes indexadas [meses][inicial][mensal].
+    """
+    ticker = payload.ticker.upper()
+    cells = len(payload.initial_investments) * len(payload.monthly_deposits) * len(payload.months)
+    if cells == 0 or cells > MAX_SWEEP_CELLS:
+        raise HTTPException(status_code=400, detail=f"A grade deve ter de 1 a {MAX_SWEEP_CELLS} combinações")
+    if min(payload.months) < 0:
+        raise HTTPException(status_code=400, detail="months deve ser positivo")
+
+    last_date = dividend_watermark(db, ticker)
+    if last_date is None:
+        raise HTTPException(status_code=404, detail="No dividend history found for this ticker")
 
-    start_sim_date = df_sim['trade_date'].min()
-    end_sim_date = df_sim['trade_date'].max()
+    key = ("simulate_fii_sweep", ticker, tuple(payload.initial_investments), tuple(payload.monthly_deposits),
+           tuple(payload.months), last_date)
+
+    def compute():
+        min_date = pd.Timestamp(last_date) - pd.DateOffset(months=max(payload.months))
+        df = load_fii_dividends(db, ticker, min_date.date())
+        return sweep_reinvestment(df, np.array(payload.initial_investments, dtype=float),
+                                  np.array(payload.monthly_deposits, dtype=float), np.array(payload.months))
+
+    return analysis_cache.get_or_compute(key, compute, tags=[ticker])
+
+
+@analysis_bp.post("/simulation/fii/portfolio")
+def simulate_fii_portfolio(payload: PortfolioSimulationRequest, db: Session = Depends(get_db)):
+    """
+    Simulação de uma cesta de FIIs: séries de todos numa consulta, alinhadas pelos meses em que
+    todos têm dados, e os dois cenários calculados em matriz. Timeline por ativo e agregada.
+    """
+    weights = {}
+    for asset in payload.assets:
+        ticker = asset.ticker.strip().upper()
+        weights[ticker] = weights.get(ticker, 0.0) + asset.weight
+    if not weights or len(weights) > MAX_PORTFOLIO_ASSETS:
+        raise HTTPException(status_code=400, detail=f"Informe de 1 a {MAX_PORTFOLIO_ASSETS} FIIs")
+    tickers = list(weights)
+
+    watermarks = dividend_watermarks(db, tickers)
+    missing = sorted(set(tickers) - {t for t, _ in watermarks})
+    if missing:
+        raise HTTPException(status_code=404, detail=f"No dividend history found for: {', '.join(missing)}")
+
+    key = ("simulate_fii_portfolio", tuple(weights.items()), payload.initial_investment,
+           payload.monthly_deposit, payload.months, watermarks, ipca_watermark(db))
+    return analysis_cache.get_or_compute(key, lambda: _simulate_fii_portfolio(db, payload, weights, watermarks),
+                                         tags=tickers)
+
+def _simulate_fii_portfolio(db: Session, payload: PortfolioSimulationRequest, weights: dict, watermarks):
+    tickers = list(weights)
+
+    # Janela termina no último mês comum a todos (o FII com provento mais antigo manda)
+    last_common = pd.Timestamp(min(d for _, d in watermarks))
+    start = (last_common - pd.DateOffset(months=payload.months + 1)).replace(day=1)
+    prices, dividends = load_fii_dividend_panel(db, tickers, start.date())
+
+    # Meses faltando de um FII no meio do período são preenchidos e informados por ativo
+    end_month = last_common.to_period('M')
+    panel = fill_panel_gaps(prices, dividends, end_month - payload.months, end_month)
+    if panel is None:
+        raise HTTPException(status_code=400, detail="Os FIIs não têm meses em comum no período")
+    prices, dividends, gaps = panel
+
+    ipca_map = load_ipca_factors(db, prices.index[0].to_timestamp(), prices.index[-1].to_timestamp())
+    w = np.array([weights[t] for t in tickers], dtype=float)
+    result = simulate_portfolio(prices, dividends, w / w.sum(), ipca_map,
+                                payload.initial_investment, payload.monthly_deposit)
+    for asset in result["assets"]:
+        asset["filledMonths"] = gaps.get(asset["ticker"], [])
+    return result
+
+
+@analysis_bp.post("/simulation/fii/montecarlo")
+def simulate_fii_montecarlo(payload: MonteCarloRequest, db: Session = Depends(get_db)):
+    """
+    Modo estocástico do simulador: block bootstrap dos retornos mensais e dividend yields do
+    histórico do FII, com faixas de percentis do valor final e da renda. Sem `seed`, uma é
+    sorteada e devolvida na resposta para reproduzir o resultado.
+    """
+    ticker = payload.ticker.upper()
+    if payload.paths > MAX_MONTE_CARLO_PATHS:
+        raise HTTPException(status_code=400, detail=f"paths deve ser no máximo {MAX_MONTE_CARLO_PATHS}")
+    if not 1 <= payload.months <= MAX_MONTE_CARLO_HORIZON:
+        raise HTTPException(status_code=400, detail=f"months deve estar entre 1 e {MAX_MONTE_CARLO_HORIZON}")
 
-    # B. IPCA (Fetch range)
-    ipca_resp = supabase.table("ipca_history") \
-        .select("ref_date,ipca") \
-        .gte("ref_date", start_sim_date.strftime('%Y-%m-01')) \
-        .lte("ref_date", end_sim_date.strftime('%Y-%m-28')) \
-        .execute()
+    last_date = dividend_watermark(db, ticker)
+    if last_date is None:
+        raise HTTPException(status_code=404, detail="No dividend history found for this ticker")
 
-    ipca_map = {}
-    if ipca_resp.data:
-        for row in ipca_resp.data:
-            key = row['ref_date'][:7]
-            val = float(row['ipca'])
-            ipca_map[key] = 1 + (val / 100)
-
-    # 2. Simulation Logic
-    initial_inv = payload.initial_investment
-    monthly_dep = payload.monthly_deposit
-
-    first_row = df_sim.iloc[0]
-    start_price = first_row['price_close']
-
-    shares_reinvest = initial_inv / start_price
-    shares_no_reinvest = initial_inv / start_price
-
-    total_invested = initial_inv
-    total_divs_withdrawn = 0.0
-    inflation_corrected_value = initial_inv
-
-    timeline = []
-
-    # Initial Record
-    timeline.append({
-        "month": first_row['trade_date'].strftime('%b/%y'),
-        "deposit": initial_inv,
-        "reinvestStart": 0,
-        "reinvestDividends": 0,
-        "reinvestEnd": initial_inv,
-        "noReinvestStart": 0,
-        "noReinvestDividends": 0,
-        "noReinvestEnd": initial_inv,
-        "difference": 0,
-        "currentPrice": start_price,
-        "totalInvested": initial_inv,
-        "inflationCorrected": initial_inv
-    })
-
-    # Iterate subsequent rows
-    for i in range(1, len(df_sim)):
-        row = df_sim.iloc[i]
-        curr_price = row['price_close']
-        div_yield_val = row['dividend_value']
-
-        curr_date = row['trade_date']
-        prev_date = df_sim.iloc[i-1]['trade_date']
-
-        # IPCA Correction
-        prev_month_key = prev_date.strftime('%Y-%m')
-        inflation_factor = ipca_map.get(prev_month_key, 1.0)
-
-        inflation_corrected_value = (inflation_corrected_value * inflation_factor) + monthly_dep
-        total_invested += monthly_dep
-
-        # --- Scenario 1: Reinvest ---
-        start_val_reinvest = shares_reinvest * curr_price
-        divs_reinvest = shares_reinvest * div_yield_val
-
-        total_cash_reinvest = monthly_dep + divs_reinvest
-        new_shares_reinvest = total_cash_reinvest / curr_price
-        shares_reinvest += new_shares_reinvest
-
-        end_val_reinvest = shares_reinvest * curr_price
-
-        # --- Scenario 2: No Reinvest ---
-        start_val_no_reinvest = shares_no_reinvest * curr_price
-        divs_no_reinvest = shares_no_reinvest * div_yield_val
-        total_divs_withdrawn += divs_no_reinvest
-
-        new_shares_no_reinvest = monthly_dep / curr_price
-        shares_no_reinvest += new_shares_no_reinvest
-
-        end_val_no_reinvest = shares_no_reinvest * curr_price
-
-        timeline.append({
-            "month": curr_date.strftime('%d/%m/%Y'),
-            "deposit": monthly_dep,
-            "reinvestStart": round(start_val_reinvest, 2),
-            "reinvestDividends": round(divs_reinvest, 2),
-            "reinvestEnd": round(end_val_reinvest, 2),
-            "noReinvestStart": round(start_val_no_reinvest, 2),
-            "noReinvestDividends": round(divs_no_reinvest, 2),
-            "noReinvestEnd": round(end_val_no_reinvest, 2),
-            "difference": round(end_val_reinvest - end_val_no_reinvest, 2),
-            "currentPrice": curr_price,
-            "totalInvested": round(total_invested, 2),
-            "inflationCorrected": round(inflation_corrected_value, 2)
-        })
-
-    # Summary Stats
-    reinvest_final = shares_reinvest * df_sim.iloc[-1]['price_close']
-    no_reinvest_final = shares_no_reinvest * df_sim.iloc[-1]['price_close']
-
-    summary = {
-        "totalInvested": round(total_invested, 2),
-        "reinvestFinalValue": round(reinvest_final, 2),
-        "reinvestTotalGain": round(reinvest_final - total_invested, 2),
-        "noReinvestFinalValue": round(no_reinvest_final, 2),
-        "totalDividendsWithdrawn": round(total_divs_withdrawn, 2),
-        "noReinvestTotalGain": round((no_reinvest_final + total_divs_withdrawn) - total_invested, 2)
-    }
+    seed = payload.seed if payload.seed is not None else secrets.randbelow(2 ** 31)
+    key = ("simulate_fii_montecarlo", ticker, payload.initial_investment, payload.monthly_deposit,
+           payload.months, payload.paths, payload.block_months, payload.lookback_months, seed, last_date)
 
-    return {
-        "summary": summary,
-        "timeline": timeline,
-        "period_text": f"({len(df_sim)} meses: {start_sim_date.strftime('%d/%m/%Y')} a {end_sim_date.strftime('%d/%m/%Y')})"
-    }
+    def compute():
+        start = pd.Timestamp(last_date) - pd.DateOffset(months=payload.lookback_months) \
+            if payload.lookback_months else pd.Timestamp.min
+        df = load_fii_dividends(db, ticker, start.date())
+        if len(df) < 13:
+            raise HTTPException(status_code=400, detail="Histórico insuficiente (mínimo de 12 meses)")
+        return run_monte_carlo(df, payload.initial_investment, payload.monthly_deposit, payload.months,
+                               payload.paths, payload.block_months, seed)
+
+    # Só resultados reproduzíveis (seed informada) vão para o cache
+    if payload.seed is None:
+        return compute()
+    return analysis_cache.get_or_compute(key, compute, tags=[ticker])
 
 
 @analysis_bp.get("/opportunities")
-def get_investment_opportunities(user_id: str = Depends(get_current_user)):
+def get_investment_opportunities(user_id: str = Depends(get_current_user), db: Session = Depends(get_db)):
     print(f"\n--- DEBUG: Analysis for Authenticated User {user_id} ---")
-    supabase = get_supabase()
 
-    # 1. Fetch User's Wallet Tickers
-    wallet_response = supabase.table("asset_purchases") \
-        .select("ticker") \
-        .eq("user_id", user_id) \
-        .execute()
+    # 1. Tickers da carteira do usuário
+    my_tickers = [t for (t,) in db.query(AssetPurchase.ticker)
+                  .filter(AssetPurchase.user_id == user_id).distinct().all()]
 
-    if not wallet_response.data:
+    if not my_tickers:
         print("DEBUG: User has no assets.")
         return []
 
-    my_tickers = list(set([row['ticker'] for row in wallet_response.data]))
     print(f"DEBUG: Analyzing {len(my_tickers)} assets: {my_tickers}")
 
-    # 2. Fetch Price History
-    start_date = (datetime.now() - timedelta(days=540)).strftime('%Y-%m-%d')
-
-    all_data = []
-    offset = 0
-    batch_size = 1000
-
-    while True:
-        try:
-            response = supabase.table("b3_prices") \
-                .select("ticker,trade_date,close,adjusted_close") \
-                .gte("trade_date", start_date) \
-                .in_("ticker", my_tickers) \
-                .range(offset, offset + batch_size - 1) \
-                .execute()
-
-            rows = response.data
-            if not rows:
-                break
-
-            all_data.extend(rows)
-            count_received = len(rows)
-            offset += count_received
+    # 2. Resultado em cache enquanto nenhum ticker da carteira ganhar pregão novo
+    start_date = (datetime.now() - timedelta(days=OPPORTUNITY_WINDOW_DAYS)).date()
+    key = ("opportunities", start_date, price_watermarks(db, my_tickers))
+    return analysis_cache.get_or_compute(key, lambda: _compute_opportunities(db, my_tickers, start_date),
+                                         tags=my_tickers)
 
-            if count_received < batch_size:
-                break
+def _compute_opportunities(db: Session, tickers, start_date):
+    # Histórico de preços numa única consulta, já como matriz data x ticker
+    close, adjusted = load_price_panel(db, tickers, start_date)
 
-        except Exception as e:
-            print(f"CRITICAL ERROR: {str(e)}")
-            break
-
-    if not all_data:
-        # Retorna lista vazia se não houver dados de preço,
-        # mas idealmente poderia retornar os tickers com status de erro.
-        return []
-
-        # 3. Process Metrics
+    # Indicadores de todos os tickers de uma vez
     try:
-        df = pd.DataFrame(all_data)
-        df['close'] = pd.to_numeric(df['close'])
-        df['trade_date'] = pd.to_datetime(df['trade_date'])
-
-        results = []
-
-        for ticker, df_ticker in df.groupby('ticker'):
-            df_ticker = df_ticker.sort_values('trade_date')
-
-            # --- LÓGICA ALTERADA AQUI ---
-
-            current_price = float(df_ticker.iloc[-1]['close'])
-            data_points = len(df_ticker)
-
-            # Valores padrão
-            mm200 = current_price  # Default neutro para não quebrar conta de %
-            cagr = 0.0
-            sharpe = 0.0
-            tag = "OK"  # Tag padrão
-
-            # Cenário 1: Dados Insuficientes (< 200 dias)
-            if data_points < 200:
-                tag = "INCOMPLETE"
-                # Calculamos um CAGR "curto" apenas para não ficar zerado se tiver pelo menos 1 mês
-                if data_points > 20:
-                    price_start = float(df_ticker.iloc[0]['close'])
-                    total_return = (current_price / price_start) - 1
-                    # Anualiza grosseiramente para ter uma noção
-                    years = data_points / 252
-                    cagr = ((1 + total_return) ** (1 / years) - 1) * 100
-
-            # Cenário 2: Dados Suficientes (Lógica Original)
-            else:
-                mm200_calc = df_ticker['close'].rolling(window=200).mean().iloc[-1]
-
-                if pd.isna(mm200_calc):
-                    tag = "INCOMPLETE"  # Falha no calculo da média
-                else:
-                    mm200 = float(mm200_calc)
-
-                    # CAGR
-                    lookback = 252 if len(df_ticker) >= 252 else len(df_ticker) - 1
-                    price_1y_ago = float(df_ticker.iloc[-lookback]['close'])
-                    cagr = ((current_price / price_1y_ago) - 1) * 100
-
-                    # Sharpe
-                    df_ticker['returns'] = df_ticker['close'].pct_change()
-                    clean_returns = df_ticker['returns'].dropna()
-
-                    if not clean_returns.empty:
-                        daily_std = clean_returns.std()
-                        if daily_std > 0:
-                            sharpe = (clean_returns.mean() / daily_std) * (252 ** 0.5)
-
-            # Asset Type Logic (Mantido igual)
-            asset_type = "STOCK"
-            t_upper = ticker.upper()
-            if t_upper.endswith("11"):
-                if t_upper in ["IVVB11", "QQQQ11", "BOVA11", "SMAL11", "XINA11", "HASH11", "GOLD11"]:
-                    asset_type = "ETF"
-                else:
-                    asset_type = "FII"
-            elif t_upper.endswith("34") or t_upper.endswith("33"):
-                asset_type = "BDR"
-
-            lookback = 252 if len(df_ticker) >= 252 else len(df_ticker) - 1
-
-            df_ticker['close'] = pd.to_numeric(df_ticker['close'])
-            if 'adjusted_close' in df_ticker.columns:
-                df_ticker['adjusted_close'] = pd.to_numeric(df_ticker['adjusted_close'])
-            else:
-                df_ticker['adjusted_close'] = df_ticker['close'] # Fallback
-
-            # Pega o registro inicial e final da janela de cálculo
-            row_start = df_ticker.iloc[-lookback]
-            row_end = df_ticker.iloc[-1]
-
-            price_start = float(row_start['close'])
-            price_end = float(row_end['close'])
-
-            start_adjusted = float(row_start['adjusted_close']) if row_start.get('adjusted_close', 0) > 0 else price_start
-            end_adjusted = float(row_end['adjusted_close']) if row_end.get('adjusted_close', 0) > 0 else price_end
-
-            adjusted_cagr = ((end_adjusted / start_adjusted) - 1) * 100
-
-            # Captura as datas exatas (string YYYY-MM-DD)
-            date_start_str = row_start['trade_date'].strftime('%Y-%m-%d')
-            date_end_str = row_end['trade_date'].strftime('%Y-%m-%d')
-
-            # Cálculo Matemático
-            cagr = ((price_end / price_start) - 1) * 100
-
-            results.append({
-                "ticker": ticker,
-                "type": asset_type,
-                "price": round(current_price, 2),
-                "adjusted_price": round(float(end_adjusted), 2),
-                "mm200": round(float(mm200), 2),
-                "cagr": round(cagr, 2),
-                "adjusted_cagr": round(adjusted_cagr, 2),
-                "sharpe": round(sharpe, 2),
-                "tag": tag,
-                "data_points": data_points,
-                "calc_window": {
-                    "start": date_start_str,
-                    "end": date_end_str,
-                    "days": int(lookback)
-                }
-            })
-
-        # Ordena: Primeiro os "OK" por CAGR, depois os "INCOMPLETE" no final
-        results.sort(key=lambda x: (x['tag'] == 'OK', x['cagr']), reverse=True)
-
-        return results
-
+        return compute_opportunities(close, adjusted)
     except Exception as e:
         print(f"PANDAS ERROR: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@analysis_bp.get("/correlation")
+def get_correlation(params: CorrelationParams = Depends(), user_id: str = Depends(get_current_user),
+                    db: Session = Depends(get_db)):
+    """
+    Correlação e covariância dos retornos diários (preço ajustado) entre os tickers da carteira
+    ou de `tickers`, por janela de pregões. Preços de todos numa consulta, matriz data x ticker.
+    """
+    if params.tickers:
+        tickers = list(dict.fromkeys(t.strip().upper() for t in params.tickers.split(",") if t.strip()))
+    else:
+        tickers = sorted(t for (t,) in db.query(AssetPurchase.ticker)
+                         .filter(AssetPurchase.user_id == user_id).distinct().all())
+    if not 2 <= len(tickers) <= MAX_CORRELATION_TICKERS:
+        raise HTTPException(status_code=400, detail=f"Informe de 2 a {MAX_CORRELATION_TICKERS} tickers")
+    if params.method not in CORRELATION_METHODS:
+        raise HTTPException(status_code=400, detail=f"method inválido. Use: {', '.join(CORRELATION_METHODS)}")
+    try:
+        windows = sorted({int(w) for w in params.windows.split(",") if w.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="windows inválido")
+    if not windows or windows[0] < 2 or windows[-1] > MAX_CORRELATION_WINDOW:
+        raise HTTPException(status_code=400, detail=f"Janelas devem estar entre 2 e {MAX_CORRELATION_WINDOW} pregões")
+
+    watermarks = price_watermarks(db, tickers)
+    found = {t for t, _ in watermarks}
+    tickers_found = [t for t in tickers if t in found]
+    if len(tickers_found) < 2:
+        raise HTTPException(status_code=404, detail="Preços insuficientes para os tickers informados")
+
+    key = ("correlation", tuple(tickers_found), tuple(windows), params.method, params.min_periods, watermarks)
+
+    def compute():
+        # Pregões ~ 5/7 dos dias corridos, com folga para feriados
+        last = max(pd.Timestamp(d) for _, d in watermarks)
+        start = (last - timedelta(days=int(windows[-1] * 7 / 5) + 30)).date()
+        close, adjusted = load_price_panel(db, tickers_found, start)
+        returns = daily_returns(close, adjusted).reindex(columns=tickers_found)
+        return {
+            "tickers": tickers_found,
+            "method": params.method,
+            "windows": compute_correlation(returns, windows, params.method, params.min_periods),
+            "missing": [t for t in tickers if t not in found]
+        }
+
+    return analysis_cache.get_or_compute(key, compute, tags=tickers_found)
+
+
+@analysis_bp.get("/risk")
+def get_wallet_risk(vol_window: int = DEFAULT_VOL_WINDOW, user_id: str = Depends(get_current_user),
+                    db: Session = Depends(get_db)):
+    """
+    Risco da carteira e de cada posição: volatilidade (total e móvel de `vol_window` pregões),
+    drawdown máximo com datas, VaR/CVaR históricos 95/99% e beta contra IBOV e IFIX.
+    Calculado em matriz sobre a mesma holdings x preço do /wallet/history.
+    """
+    if not 2 <= vol_window <= 252:
+        raise HTTPException(status_code=400, detail="vol_window deve estar entre 2 e 252 pregões")
+
+    result = compute_wallet_risk(db, user_id, vol_window)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Carteira sem histórico de preços suficiente")
+    return result
+
+
+@analysis_bp.get("/screener")
+def get_screener(filters: ScreenerFilters = Depends(), db: Session = Depends(get_db)):
+    """
+    Screener de todos os tickers da b3_prices sobre a tabela pré-calculada ticker_metrics.
+    Filtros min_/max_ por indicador, `type` e `tag`; `sort` (ex.: "-sharpe") e paginação por página.
+    """
+    if filters.sort.lstrip("-") not in SCREENER_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort inválido. Use: {', '.join(SCREENER_SORT_FIELDS)}")
+
+    ranges = {field: (getattr(filters, f"min_{field}"), getattr(filters, f"max_{field}"))
+              for field in SCREENER_RANGE_FIELDS}
+    types = [t.strip() for t in filters.type.split(",") if t.strip()] if filters.type else None
+
+    return query_screener(db, types=types, tag=filters.tag, search=filters.search, ranges=ranges,
+                          sort=filters.sort, page=filters.page, page_size=filters.page_size)
+
+
+def _require_cron_secret(x_cron_secret: Optional[str] = Header(None)):
+    # Rotinas agendadas: segredo compartilhado em SCREENER_CRON_SECRET; sem ele configurado, a rota fica fechada
+    expected = os.getenv("SCREENER_CRON_SECRET")
+    if not expected or not x_cron_secret or not secrets.compare_digest(x_cron_secret, expected):
+        raise HTTPException(status_code=403, detail="Acesso restrito à rotina agendada")
+
+
+@analysis_bp.post("/screener/refresh", dependencies=[Depends(_require_cron_secret)])
+def refresh_screener(db: Session = Depends(get_db)):
+    """
+    Recalcula ticker_metrics para todo o universo (rotina noturna; o /sync atualiza ticker a ticker).
+    Só para o agendador: exige o header X-Cron-Secret igual a SCREENER_CRON_SECRET.
+    """
+    try:
+        count = refresh_ticker_metrics(db)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"success": True, "count": count}
+
+
+@analysis_bp.get("/cache/stats")
+def get_cache_stats(user_id: str = Depends(get_current_user)):
+    """Contadores do cache de resultados da análise (zscore, simulação FII, oportunidades)."""
+    return analysis_cache.stats()
@@ -1,7 +1,73 @@
-from pydantic import BaseModel
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
 
 class SimulationRequest(BaseModel):
     ticker: str
     initial_investment: float
     monthly_deposit: float
-    months: int
\ No newline at end of file
+    months: int
+
+# POST /analysis/simulation/fii/sweep: todas as combinações das três listas
+class SimulationSweepRequest(BaseModel):
+    ticker: str
+    initial_investments: List[float]
+    monthly_deposits: List[float]
+    months: List[int]
+
+# POST /analysis/simulation/fii/portfolio: aportes divididos pelos pesos (normalizados)
+class PortfolioAsset(BaseModel):
+    ticker: str
+    weight: float = Field(1.0, gt=0)
+
+class PortfolioSimulationRequest(BaseModel):
+    assets: List[PortfolioAsset]
+    initial_investment: float
+    monthly_deposit: float
+    months: int
+
+# POST /analysis/simulation/fii/montecarlo
+class MonteCarloRequest(BaseModel):
+    ticker: str
+    initial_investment: float
+    monthly_deposit: float
+    months: int                              # horizonte simulado
+    paths: int = Field(10_000, ge=100)
+    block_months: int = Field(6, ge=1)       # tamanho do bloco do bootstrap
+    lookback_months: Optional[int] = None    # histórico amostrado (None = todo)
+    seed: Optional[int] = None               # mesma seed -> mesmo resultado
+
+# Filtros do /analysis/screener (query string)
+class ScreenerFilters(BaseModel):
+    type: Optional[str] = None          # "fii,stock"
+    tag: Optional[str] = None           # "OK" | "INCOMPLETE"
+    search: Optional[str] = None        # prefixo do ticker
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_cagr: Optional[float] = None
+    max_cagr: Optional[float] = None
+    min_adjusted_cagr: Optional[float] = None
+    max_adjusted_cagr: Optional[float] = None
+    min_sharpe: Optional[float] = None
+    max_sharpe: Optional[float] = None
+    min_zscore: Optional[float] = None
+    max_zscore: Optional[float] = None
+    min_data_points: Optional[int] = None
+    max_data_points: Optional[int] = None
+    sort: str = "-cagr"                 # campo; "-" na frente = decrescente
+    page: int = Field(1, ge=1)
+    page_size: int = Field(50, ge=1, le=500)
+
+# POST /analysis/zscore/batch
+class ZScoreBatchRequest(BaseModel):
+    tickers: List[str]
+    windows: List[int] = [12]            # janelas em meses (ex.: [3, 6, 12, 24])
+    include_series: bool = False         # z-score móvel diário (janela series_window ou a maior)
+    series_window: Optional[int] = None
+
+# GET /analysis/correlation (query string)
+class CorrelationParams(BaseModel):
+    tickers: Optional[str] = None       # "HGLG11,KNRI11"; vazio = tickers da carteira
+    windows: str = "63,252"             # janelas em pregões
+    method: str = "pearson"             # "pearson" | "spearman"
+    min_periods: int = Field(20, ge=2)  # mínimo de dias em comum por par
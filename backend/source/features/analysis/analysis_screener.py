@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import B3Price, TickerMetric
+from backend.source.features.analysis.analysis_opportunities import (
+    OPPORTUNITY_WINDOW_DAYS, load_price_panel, compute_opportunities
+)
+from backend.source.features.analysis.analysis_zscore import compute_zscores
+
+# Tickers por consulta/lote no refresh completo (limita a matriz em memória)
+SCREENER_BATCH_TICKERS = 200
+SCREENER_SORT_FIELDS = ("ticker", "price", "mm200", "cagr", "adjusted_cagr", "sharpe", "zscore", "data_points")
+# Filtros numéricos aceitos como min_<campo>/max_<campo>
+SCREENER_RANGE_FIELDS = ("price", "cagr", "adjusted_cagr", "sharpe", "zscore", "data_points")
+
+
+def refresh_ticker_metrics(db: Session, tickers: Optional[Iterable[str]] = None) -> int:
+    """
+    Recalcula ticker_metrics dos tickers pedidos (todos os da b3_prices quando None), em lotes:
+    uma consulta de preços por lote, indicadores em matriz e DELETE + INSERT das linhas do lote.
+    """
+    if tickers is None:
+        tickers = [t for (t,) in db.query(B3Price.ticker).distinct().all()]
+    tickers = sorted(set(tickers))
+    start = (datetime.now() - timedelta(days=OPPORTUNITY_WINDOW_DAYS)).date()
+
+    total = 0
+    for i in range(0, len(tickers), SCREENER_BATCH_TICKERS):
+        batch = tickers[i:i + SCREENER_BATCH_TICKERS]
+        close, adjusted = load_price_panel(db, batch, start)
+        metrics = compute_opportunities(close, adjusted)
+        zscores = compute_zscores(close)
+
+        rows = [{
+            "ticker": m["ticker"],
+            "type": m["type"],
+            "price": m["price"],
+            "adjusted_price": m["adjusted_price"],
+            "mm200": m["mm200"],
+            "cagr": m["cagr"],
+            "adjusted_cagr": m["adjusted_cagr"],
+            "sharpe": m["sharpe"],
+            "zscore": round(float(zscores[m["ticker"]]), 2),
+            "data_points": m["data_points"],
+            "tag": m["tag"],
+            "last_date": datetime.strptime(m["calc_window"]["end"], "%Y-%m-%d").date(),
+        } for m in metrics]
+
+        # Tickers sem pregão na janela saem do screener
+        db.query(TickerMetric).filter(TickerMetric.ticker.in_(batch)).delete(synchronize_session=False)
+        if rows:
+            db.execute(insert(TickerMetric), rows)
+        total += len(rows)
+
+    db.commit()
+    return total
+
+
+def query_screener(
+        db: Session,
+        types: Optional[List[str]] = None,
+        tag: Optional[str] = None,
+        search: Optional[str] = None,
+        ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        sort: str = "-cagr",
+        page: int = 1,
+        page_size: int = 50
+) -> Dict:
+    """Filtro, ordenação e paginação feitos no banco sobre ticker_metrics."""
+    query = db.query(TickerMetric)
+    if types:
+        query = query.filter(TickerMetric.type.in_([t.upper() for t in types]))
+    if tag:
+        query = query.filter(TickerMetric.tag == tag.upper())
+    if search:
+        query = query.filter(TickerMetric.ticker.like(f"{search.upper()}%"))
+    for field, (low, high) in (ranges or {}).items():
+        column = getattr(TickerMetric, field)
+        if low is not None:
+            query = query.filter(column >= low)
+        if high is not None:
+            query = query.filter(column <= high)
+
+    field = sort.lstrip("-")
+    column = getattr(TickerMetric, field)
+    order = column.desc().nulls_last() if sort.startswith("-") else column.asc().nulls_last()
+
+    total = query.count()
+    items = query.order_by(order, TickerMetric.ticker.asc()) \
+        .offset((page - 1) * page_size).limit(page_size).all()
+
+    return {
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "items": [{
+            "ticker": m.ticker,
+            "type": m.type,
+            "price": m.price,
+            "adjusted_price": m.adjusted_price,
+            "mm200": m.mm200,
+            "cagr": m.cagr,
+            "adjusted_cagr": m.adjusted_cagr,
+            "sharpe": m.sharpe,
+            "zscore": m.zscore,
+            "data_points": m.data_points,
+            "tag": m.tag,
+            "last_date": m.last_date,
+        } for m in items]
+    }
@@ -0,0 +1,348 @@
+from datetime import date
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import IpcaHistory
+
+# Combinações (meses x inicial x mensal) aceitas no /simulation/fii/sweep
+MAX_SWEEP_CELLS = 20_000
+MAX_PORTFOLIO_ASSETS = 30
+
+
+def load_fii_dividends(db: Session, ticker: str, start: date) -> pd.DataFrame:
+    """Série mensal (trade_date, price_close, dividend_value) do FII a partir de `start`, já ordenada."""
+    rows = db.execute(text(
+        "SELECT trade_date, price_close, dividend_value FROM b3_fiis_dividends "
+        "WHERE ticker = :ticker AND trade_date >= :start ORDER BY trade_date"
+    ), {"ticker": ticker, "start": start}).fetchall()
+
+    df = pd.DataFrame(rows, columns=['trade_date', 'price_close', 'dividend_value'])
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    df['price_close'] = pd.to_numeric(df['price_close']).astype(float)
+    df['dividend_value'] = pd.to_numeric(df['dividend_value']).astype(float)
+    return df
+
+
+def load_ipca_factors(db: Session, start: pd.Timestamp, end: pd.Timestamp) -> Dict[str, float]:
+    """{"AAAA-MM": 1 + ipca/100} dos meses entre `start` e `end`."""
+    rows = db.query(IpcaHistory.ref_date, IpcaHistory.ipca) \
+        .filter(IpcaHistory.ref_date >= start.replace(day=1).date(),
+                IpcaHistory.ref_date <= end.replace(day=28).date()).all()
+    return {pd.Timestamp(ref_date).strftime('%Y-%m'): 1 + (float(ipca) / 100) for ref_date, ipca in rows}
+
+
+def linear_recurrence(a: np.ndarray, b: np.ndarray, x0) -> np.ndarray:
+    """
+    x_i = a_i * x_(i-1) + b_i (i >= 1, a_0/b_0 ignorados) sem laço: com A = cumprod(a),
+    x_i = A_i * (x0 + soma_(k<=i) b_k / A_k). Funciona coluna a coluna em matrizes (eixo 0 = tempo).
+    """
+    a = np.array(a, dtype=float)
+    b = np.array(b, dtype=float)
+    a[0] = 1.0
+    b[0] = 0.0
+    growth = np.cumprod(a, axis=0)
+    return growth * (x0 + np.cumsum(b / growth, axis=0))
+
+
+def share_paths(prices: np.ndarray, dividends: np.ndarray, initial, monthly):
+    """
+    Cotas ao fim de cada mês nos dois cenários, para o aporte inicial no 1º mês e `monthly`
+    nos seguintes (preço e provento do mês i). Reinvestindo: s_i = s_(i-1) * (1 + d_i/p_i) + aporte/p_i.
+    Sacando: s_i = s_(i-1) + aporte/p_i (soma acumulada, mesma ordem do cálculo passo a passo).
+    """
+    first = initial / prices[0]
+    reinvest = linear_recurrence(1 + dividends / prices, monthly / prices, first)
+
+    buys = monthly / prices
+    buys = np.concatenate([np.broadcast_to(first, buys[:1].shape), buys[1:]])
+    no_reinvest = np.cumsum(buys, axis=0)
+    return reinvest, no_reinvest
+
+
+def _rounded(values: np.ndarray) -> list:
+    # round() do Python, não np.round: mesmo arredondamento do cálculo linha a linha
+    return [round(v, 2) for v in values.tolist()]
+
+
+def simulate_reinvestment(df_sim: pd.DataFrame, ipca_map: Dict[str, float],
+                          initial_inv: float, monthly_dep: float) -> Dict:
+    """Simulação reinvestindo x sacando os proventos sobre a série mensal `df_sim` (formato do /simulation/fii)."""
+    prices = df_sim['price_close'].to_numpy(dtype=float)
+    dividends = df_sim['dividend_value'].to_numpy(dtype=float)
+    dates = pd.DatetimeIndex(df_sim['trade_date'])
+    n = len(prices)
+
+    shares_reinvest, shares_no_reinvest = share_paths(prices, dividends, initial_inv, monthly_dep)
+
+    # Valores de cada mês i >= 1: início com as cotas de i-1, proventos, fim com as cotas de i
+    p, d = prices[1:], dividends[1:]
+    start_reinvest = shares_reinvest[:-1] * p
+    divs_reinvest = shares_reinvest[:-1] * d
+    end_reinvest = shares_reinvest[1:] * p
+    start_no_reinvest = shares_no_reinvest[:-1] * p
+    divs_no_reinvest = shares_no_reinvest[:-1] * d
+    end_no_reinvest = shares_no_reinvest[1:] * p
+
+    deposits = np.full(n, monthly_dep, dtype=float)
+    deposits[0] = initial_inv
+    # cumsum soma em sequência (np.sum é pairwise): mesmos totais do acumulado mês a mês
+    total_invested = np.cumsum(deposits)
+    total_divs_withdrawn = float(np.cumsum(np.concatenate([[0.0], divs_no_reinvest]))[-1])
+
+    # IPCA do mês anterior corrige o saldo antes do aporte do mês
+    inflation_factors = np.array([1.0] + [ipca_map.get(k, 1.0) for k in dates[:-1].strftime('%Y-%m')])
+    inflation_corrected = linear_recurrence(inflation_factors, deposits, initial_inv)
+
+    timeline = [{
+        "month": dates[0].strftime('%b/%y'),
+        "deposit": initial_inv,
+        "reinvestStart": 0,
+        "reinvestDividends": 0,
+        "reinvestEnd": initial_inv,
+        "noReinvestStart": 0,
+        "noReinvestDividends": 0,
+        "noReinvestEnd": initial_inv,
+        "difference": 0,
+        "currentPrice": float(prices[0]),
+        "totalInvested": initial_inv,
+        "inflationCorrected": initial_inv
+    }]
+
+    columns = {
+        "month": dates[1:].strftime('%d/%m/%Y').tolist(),
+        "deposit": [monthly_dep] * (n - 1),
+        "reinvestStart": _rounded(start_reinvest),
+        "reinvestDividends": _rounded(divs_reinvest),
+        "reinvestEnd": _rounded(end_reinvest),
+        "noReinvestStart": _rounded(start_no_reinvest),
+        "noReinvestDividends": _rounded(divs_no_reinvest),
+        "noReinvestEnd": _rounded(end_no_reinvest),
+        "difference": _rounded(end_reinvest - end_no_reinvest),
+        "currentPrice": p.tolist(),
+        "totalInvested": _rounded(total_invested[1:]),
+        "inflationCorrected": _rounded(inflation_corrected[1:]),
+    }
+    keys = list(columns)
+    timeline.extend(dict(zip(keys, row)) for row in zip(*columns.values()))
+
+    # Summary Stats
+    invested = float(total_invested[-1])
+    reinvest_final = float(shares_reinvest[-1] * prices[-1])
+    no_reinvest_final = float(shares_no_reinvest[-1] * prices[-1])
+
+    summary = {
+        "totalInvested": round(invested, 2),
+        "reinvestFinalValue": round(reinvest_final, 2),
+        "reinvestTotalGain": round(reinvest_final - invested, 2),
+        "noReinvestFinalValue": round(no_reinvest_final, 2),
+        "totalDividendsWithdrawn": round(total_divs_withdrawn, 2),
+        "noReinvestTotalGain": round((no_reinvest_final + total_divs_withdrawn) - invested, 2)
+    }
+
+    start_sim_date, end_sim_date = dates[0], dates[-1]
+    return {
+        "summary": summary,
+        "timeline": timeline,
+        "period_text": f"({n} meses: {start_sim_date.strftime('%d/%m/%Y')} a {end_sim_date.strftime('%d/%m/%Y')})"
+    }
+
+
+def sweep_reinvestment(df: pd.DataFrame, initial: np.ndarray, monthly: np.ndarray, months: np.ndarray) -> Dict:
+    """
+    Resumo do /simulation/fii para toda a grade meses x aporte inicial x aporte mensal de uma vez.
+
+    As cotas finais são lineares nos aportes (s = inicial * u + mensal * v), e u/v de cada janela
+    saem de somas acumuladas da série inteira: para a janela [s, e], com G = cumprod(1 + d/p),
+    reinvestindo u = G_e / (G_s * p_s) e v = G_e * (C_e - C_s), C = cumsum(1 / (p * G)).
+    Depois é só broadcasting (meses, inicial, mensal).
+    """
+    prices = df['price_close'].to_numpy(dtype=float)
+    dividends = df['dividend_value'].to_numpy(dtype=float)
+    dates = pd.DatetimeIndex(df['trade_date'])
+
+    # Início de cada janela: primeiro mês >= último mês - `months` (mesmo corte do /simulation/fii)
+    starts = np.array([dates.searchsorted(dates[-1] - pd.DateOffset(months=int(m))) for m in months])
+    end = len(prices) - 1
+
+    ratio = 1 + dividends / prices
+    ratio[0] = 1.0
+    growth = np.cumprod(ratio)
+    cost = np.cumsum(1 / (prices * growth))
+    inv_price = np.cumsum(1 / prices)
+    divs = np.cumsum(dividends)
+    # soma de d_i * (soma de 1/p_k até i-1): proventos das cotas compradas com aportes mensais
+    divs_on_buys = np.cumsum(dividends * np.concatenate([[0.0], inv_price[:-1]]))
+
+    first_price = prices[starts]
+    u_reinvest = growth[end] / (growth[starts] * first_price)
+    v_reinvest = growth[end] * (cost[end] - cost[starts])
+    u_no_reinvest = 1 / first_price
+    v_no_reinvest = inv_price[end] - inv_price[starts]
+    window_divs = divs[end] - divs[starts]
+    u_withdrawn = window_divs / first_price
+    v_withdrawn = (divs_on_buys[end] - divs_on_buys[starts]) - inv_price[starts] * window_divs
+    n_deposits = end - starts
+
+    # Grade (meses, inicial, mensal)
+    def grid(u, v):
+        return u[:, None, None] * initial[None, :, None] + v[:, None, None] * monthly[None, None, :]
+
+    last_price = prices[end]
+    invested = initial[None, :, None] + n_deposits[:, None, None] * monthly[None, None, :]
+    reinvest_final = grid(u_reinvest, v_reinvest) * last_price
+    no_reinvest_final = grid(u_no_reinvest, v_no_reinvest) * last_price
+    withdrawn = grid(u_withdrawn, v_withdrawn)
+
+    def matrix(values):
+        return np.round(values, 2).tolist()
+
+    return {
+        "axes": ["months", "initial_investment", "monthly_deposit"],
+        "months": [int(m) for m in months],
+        "initial_investment": initial.tolist(),
+        "monthly_deposit": monthly.tolist(),
+        "periods": [{
+            "months": int(m),
+            "start": dates[s].strftime('%Y-%m-%d'),
+            "end": dates[end].strftime('%Y-%m-%d'),
+            "count": int(end - s + 1)
+        } for m, s in zip(months, starts)],
+        "totalInvested": matrix(np.broadcast_to(invested, reinvest_final.shape)),
+        "reinvestFinalValue": matrix(reinvest_final),
+        "reinvestTotalGain": matrix(reinvest_final - invested),
+        "noReinvestFinalValue": matrix(no_reinvest_final),
+        "totalDividendsWithdrawn": matrix(withdrawn),
+        "noReinvestTotalGain": matrix(no_reinvest_final + withdrawn - invested)
+    }
+
+
+# ==========================================
+#  CARTEIRA DE FIIs
+# ==========================================
+
+def load_fii_dividend_panel(db: Session, tickers: List[str], start: date) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Preço e provento mensais de vários FIIs numa consulta, alinhados por mês (índice Period 'M',
+    colunas = tickers). Meses em que algum ticker não tem linha ficam NaN.
+    """
+    stmt = text(
+        "SELECT ticker, trade_date, price_close, dividend_value FROM b3_fiis_dividends "
+        "WHERE ticker IN :tickers AND trade_date >= :start"
+    ).bindparams(bindparam("tickers", expanding=True))
+    rows = db.execute(stmt, {"tickers": tickers, "start": start}).fetchall()
+
+    df = pd.DataFrame(rows, columns=['ticker', 'trade_date', 'price_close', 'dividend_value'])
+    df['month'] = pd.to_datetime(df['trade_date']).dt.to_period('M')
+    df['price_close'] = pd.to_numeric(df['price_close']).astype(float)
+    df['dividend_value'] = pd.to_numeric(df['dividend_value']).astype(float)
+    df = df.sort_values('trade_date').drop_duplicates(['ticker', 'month'], keep='last')
+
+    prices = df.pivot(index='month', columns='ticker', values='price_close').sort_index()
+    dividends = df.pivot(index='month', columns='ticker', values='dividend_value').reindex_like(prices)
+    return prices.reindex(columns=tickers), dividends.reindex(columns=tickers)
+
+
+def fill_panel_gaps(prices: pd.DataFrame, dividends: pd.DataFrame, first: pd.Period, last: pd.Period):
+    """
+    Painel mensal contínuo de `first` a `last`, começando no primeiro mês em que todos os FIIs têm
+    preço. Mês sem linha de um FII dentro do período repete o preço anterior e fica sem provento
+    (em vez de sumir da série e a recorrência pular o mês). Retorna (preços, proventos, meses
+    preenchidos por ticker) ou None se os FIIs não têm período em comum.
+    """
+    window = prices.loc[(prices.index >= first) & (prices.index <= last)]
+    first_prices = [window[t].first_valid_index() for t in window.columns]
+    if window.empty or any(m is None for m in first_prices):
+        return None
+
+    months = pd.period_range(max(first_prices), last, freq='M')
+    raw = prices.reindex(months)
+    gaps = {t: months[raw[t].isna().to_numpy()].strftime('%m/%Y').tolist() for t in raw.columns}
+    filled_prices = raw.ffill()
+    filled_dividends = dividends.reindex(months).where(raw.notna()).fillna(0.0)
+    return filled_prices, filled_dividends, {t: m for t, m in gaps.items() if m}
+
+
+def simulate_portfolio(prices: pd.DataFrame, dividends: pd.DataFrame, weights: np.ndarray,
+                       ipca_map: Dict[str, float], initial_inv: float, monthly_dep: float) -> Dict:
+    """
+    Reinvestindo x sacando para todos os FIIs de uma vez (matrizes mês x ativo), com os aportes
+    divididos pelos pesos. Mesmas contas do /simulation/fii por ativo; o agregado é a soma.
+    """
+    p = prices.to_numpy(dtype=float)
+    d = dividends.to_numpy(dtype=float)
+    months = prices.index
+    n = len(months)
+
+    shares_reinvest, shares_no_reinvest = share_paths(p, d, initial_inv * weights, monthly_dep * weights)
+
+    def previous(shares):
+        # Cotas do mês anterior (zero no 1º mês, antes do aporte inicial)
+        return np.vstack([np.zeros_like(shares[:1]), shares[:-1]])
+
+    reinvest_divs = previous(shares_reinvest) * d
+    reinvest_end = shares_reinvest * p
+    no_reinvest_divs = previous(shares_no_reinvest) * d
+    no_reinvest_end = shares_no_reinvest * p
+
+    deposits = np.full(n, monthly_dep, dtype=float)
+    deposits[0] = initial_inv
+    invested = np.cumsum(deposits[:, None] * weights[None, :], axis=0)
+    withdrawn = np.cumsum(no_reinvest_divs, axis=0)
+
+    inflation_factors = np.array([1.0] + [ipca_map.get(str(m), 1.0) for m in months[:-1]])
+    inflation_corrected = linear_recurrence(inflation_factors, deposits, initial_inv)
+
+    labels = months.strftime('%m/%Y').tolist()
+
+    def summary(invested_end, reinvest_final, no_reinvest_final, withdrawn_total):
+        return {
+            "totalInvested": round(float(invested_end), 2),
+            "reinvestFinalValue": round(float(reinvest_final), 2),
+            "reinvestTotalGain": round(float(reinvest_final - invested_end), 2),
+            "noReinvestFinalValue": round(float(no_reinvest_final), 2),
+            "totalDividendsWithdrawn": round(float(withdrawn_total), 2),
+            "noReinvestTotalGain": round(float(no_reinvest_final + withdrawn_total - invested_end), 2)
+        }
+
+    assets = []
+    for j, ticker in enumerate(prices.columns):
+        columns = {
+            "month": labels,
+            "currentPrice": p[:, j].tolist(),
+            "reinvestDividends": _rounded(reinvest_divs[:, j]),
+            "reinvestEnd": _rounded(reinvest_end[:, j]),
+            "noReinvestDividends": _rounded(no_reinvest_divs[:, j]),
+            "noReinvestEnd": _rounded(no_reinvest_end[:, j]),
+        }
+        assets.append({
+            "ticker": ticker,
+            "weight": round(float(weights[j]), 4),
+            "summary": summary(invested[-1, j], reinvest_end[-1, j], no_reinvest_end[-1, j], withdrawn[-1, j]),
+            "timeline": [dict(zip(columns, row)) for row in zip(*columns.values())]
+        })
+
+    total_reinvest = reinvest_end.sum(axis=1)
+    total_no_reinvest = no_reinvest_end.sum(axis=1)
+    total_invested = invested.sum(axis=1)
+    columns = {
+        "month": labels,
+        "deposit": deposits.tolist(),
+        "reinvestDividends": _rounded(reinvest_divs.sum(axis=1)),
+        "reinvestEnd": _rounded(total_reinvest),
+        "noReinvestDividends": _rounded(no_reinvest_divs.sum(axis=1)),
+        "noReinvestEnd": _rounded(total_no_reinvest),
+        "difference": _rounded(total_reinvest - total_no_reinvest),
+        "totalInvested": _rounded(total_invested),
+        "inflationCorrected": _rounded(inflation_corrected),
+    }
+
+    return {
+        "summary": summary(total_invested[-1], total_reinvest[-1], total_no_reinvest[-1], withdrawn[-1].sum()),
+        "timeline": [dict(zip(columns, row)) for row in zip(*columns.values())],
+        "assets": assets,
+        "period_text": f"({n} meses: {labels[0]} a {labels[-1]})"
+    }
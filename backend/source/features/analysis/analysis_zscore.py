@@ -0,0 +1,148 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import B3Price
+
+ZSCORE_WINDOW_MONTHS = 12
+ZSCORE_BATCH_WINDOWS = (3, 6, 12, 24)
+MAX_ZSCORE_TICKERS = 100
+
+
+def zscore_status(z_score: float, std_dev: float) -> str:
+    if std_dev == 0: return "Sem variação"
+    elif z_score <= -2: return "🔥 Muito barato (Z ≤ -2)"
+    elif z_score <= -1: return "✅ Barato (−2 < Z ≤ −1)"
+    elif z_score < 1: return "➖ Zona neutra (−1 < Z < 1)"
+    elif z_score < 2: return "⚠️ Caro (1 ≤ Z < 2)"
+    else: return "❌ Muito caro (Z ≥ 2)"
+
+
+def load_close_matrix(db: Session, tickers: List[str], max_window_months: int) -> pd.DataFrame:
+    """
+    Fechamentos data x ticker com histórico suficiente para a maior janela, contada a partir
+    do último pregão de cada ticker. Uma consulta para as datas finais e uma para os preços.
+    """
+    last_dates = db.query(func.max(B3Price.trade_date)).filter(B3Price.ticker.in_(tickers)) \
+        .group_by(B3Price.ticker).all()
+    if not last_dates:
+        return pd.DataFrame()
+
+    start = pd.Timestamp(min(d for (d,) in last_dates)) - pd.DateOffset(months=max_window_months)
+    rows = db.query(B3Price.ticker, B3Price.trade_date, B3Price.close) \
+        .filter(B3Price.ticker.in_(tickers), B3Price.trade_date >= start.date()).all()
+
+    df = pd.DataFrame(rows, columns=['ticker', 'trade_date', 'close'])
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    df['close'] = pd.to_numeric(df['close']).astype(float)
+    return df.pivot(index='trade_date', columns='ticker', values='close').sort_index()
+
+
+def _window_mask(close: pd.DataFrame, valid: np.ndarray, window_months: int) -> np.ndarray:
+    # Pregões de cada ticker dentro de [último pregão - janela, último pregão]
+    last_dates = pd.DatetimeIndex(close.apply(pd.Series.last_valid_index))
+    window_start = last_dates - pd.DateOffset(months=window_months)
+    return valid & (close.index.to_numpy()[:, None] >= window_start.to_numpy()[None, :])
+
+
+def zscore_window_stats(close: pd.DataFrame, window_months: int) -> pd.DataFrame:
+    """
+    Estatísticas do /analysis/zscore (média, desvio amostral, z, min/max, percentil) para todas
+    as colunas de uma vez. Retorna um DataFrame ticker x estatística.
+    """
+    values = close.to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    in_window = _window_mask(close, valid, window_months)
+
+    count = in_window.sum(axis=0)
+    last_row = np.where(valid.any(axis=0), valid.shape[0] - 1 - np.argmax(valid[::-1], axis=0), 0)
+    current = values[last_row, np.arange(values.shape[1])]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(in_window, values, 0.0).sum(axis=0) / count
+        deviations = np.where(in_window, values - mean, 0.0)
+        std = np.sqrt((deviations ** 2).sum(axis=0) / (count - 1))
+        z_score = np.where((count > 1) & (std > 0), (current - mean) / std, 0.0)
+        below = (in_window & (values <= current)).sum(axis=0)
+        percentile = np.where(count > 0, below / count * 100, 0.0)
+
+    return pd.DataFrame({
+        'current': current,
+        'mean': mean,
+        'std': std,
+        'z_score': z_score,
+        'min': np.nanmin(np.where(in_window, values, np.inf), axis=0),
+        'max': np.nanmax(np.where(in_window, values, -np.inf), axis=0),
+        'percentile': percentile,
+        'total_days': count,
+        'days_below': below,
+    }, index=close.columns)
+
+
+def compute_zscores(close: pd.DataFrame, window_months: int = ZSCORE_WINDOW_MONTHS) -> pd.Series:
+    """Só o z-score do último fechamento de cada ticker (usado pelo screener)."""
+    if close.empty:
+        return pd.Series(dtype=float)
+    return zscore_window_stats(close, window_months)['z_score']
+
+
+def rolling_zscores(close: pd.DataFrame, window_months: int) -> pd.DataFrame:
+    """
+    Z-score de cada dia contra os `window_months` meses anteriores do próprio ticker (janela
+    por calendário, ignorando dias sem pregão), para todas as colunas numa passada de rolling.
+    """
+    window = f"{int(round(window_months * 365.25 / 12))}D"
+    rolling = close.rolling(window, min_periods=2)
+    mean = rolling.mean()
+    std = rolling.std(ddof=1)
+    return ((close - mean) / std.where(std > 0)).where(close.notna())
+
+
+def format_window_stats(row: pd.Series) -> Dict:
+    # Mesmo formato de "stats" do GET /analysis/zscore/{ticker}
+    std = float(row['std']) if np.isfinite(row['std']) else 0.0
+    return {
+        "current": round(float(row['current']), 2),
+        "media": round(float(row['mean']), 2),
+        "desvio": round(std, 2),
+        "zScore": round(float(row['z_score']), 2),
+        "min": round(float(row['min']), 2),
+        "max": round(float(row['max']), 2),
+        "percentile": round(float(row['percentile']), 1),
+        "status": zscore_status(float(row['z_score']), std),
+        "totalDays": int(row['total_days']),
+        "daysBelowOrEqual": int(row['days_below'])
+    }
+
+
+def compute_zscore_batch(close: pd.DataFrame, windows: List[int], include_series: bool = False,
+                         series_window: Optional[int] = None) -> Dict[str, Dict]:
+    """{ticker: {"windows": {meses: stats}, "series": [...]?}} para todos os tickers da matriz."""
+    stats = {months: zscore_window_stats(close, months) for months in windows}
+
+    series = {}
+    if include_series:
+        months = series_window or max(windows)
+        z = rolling_zscores(close, months)
+        # Série só no trecho da maior janela pedida, como o chart_data do endpoint individual
+        for ticker in close.columns:
+            col = close[ticker].dropna()
+            start = col.index[-1] - pd.DateOffset(months=max(windows))
+            col = col[col.index >= start]
+            z_col = z[ticker].reindex(col.index)
+            series[ticker] = [{
+                "date": d.strftime('%Y-%m-%d'),
+                "close": float(c),
+                "zScore": round(float(v), 2) if np.isfinite(v) else None
+            } for d, c, v in zip(col.index, col.to_numpy(), z_col.to_numpy())]
+
+    result = {}
+    for ticker in close.columns:
+        entry = {"windows": {str(m): format_window_stats(stats[m].loc[ticker]) for m in windows}}
+        if include_series:
+            entry["series"] = series[ticker]
+        result[ticker] = entry
+    return result
@@ -5,18 +5,25 @@ import io
 import json
 import re
 import unicodedata
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Any, Dict, List, Optional
 
 import pandas as pd
 import requests
 import yfinance as yf
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
 
 # Certifique-se que estes imports existem no seu projeto
+from backend.source.core.database import get_db
 from backend.source.core.db import get_supabase
 from backend.source.features.market_data.market_data_constants import ASSET_SCHEMA
 from backend.source.features.market_data.market_data_schemas import TickerSync
+from backend.source.models.sql_models import B3Price
+from backend.source.features.wallet.wallet_positions import refresh_adjusted_costs
+from backend.source.features.wallet.wallet_history import invalidate_ticker_history
+from backend.source.features.analysis.analysis_screener import refresh_ticker_metrics
+from backend.source.features.analysis.analysis_cache import analysis_cache
 
 market_data_bp = APIRouter(prefix="/sync", tags=["Market Data"])
 
@@ -182,6 +189,47 @@ def _upsert_cache(supabase, row: Dict[str, Any]) -> None:
         print(f"⚠️ Cache upsert failed: {e}")
 
 
+def _upsert_yearly_closes(supabase, ticker: str, records: List[Dict[str, Any]]) -> None:
+    """
+    Mantém a tabela yearly_closes: guarda o último pregão de cada ano presente no lote.
+    Como o download sempre vai até hoje, o último registro de cada ano do lote é o fechamento do ano.
+    """
+    last_by_year: Dict[int, Dict[str, Any]] = {}
+    for rec in records:
+        year = int(str(rec["trade_date"])[:4])
+        prev = last_by_year.get(year)
+        if prev is None or str(rec["trade_date"]) > str(prev["trade_date"]):
+            last_by_year[year] = rec
+
+    rows = [{
+        "ticker": ticker,
+        "year": year,
+        "trade_date": rec["trade_date"],
+        "close": rec["close"],
+        "adjusted_close": rec.get("adjusted_close", rec["close"]),
+    } for year, rec in last_by_year.items()]
+
+    if not rows:
+        return
+
+    try:
+        supabase.table("yearly_closes").upsert(rows, on_conflict="ticker,year").execute()
+    except Exception as e:
+        print(f"⚠️ Yearly closes upsert failed: {e}")
+
+
+def _earliest_changed_close(db: Session, ticker: str, records: List[Dict[str, Any]]) -> Optional[date]:
+    """Primeiro pregão do lote com fechamento novo ou diferente do já gravado (None se nada mudou)."""
+    if not records:
+        return None
+    days = [str(rec["trade_date"])[:10] for rec in records]
+    stored = {d.isoformat(): float(c) for d, c in db.query(B3Price.trade_date, B3Price.close)
+              .filter(B3Price.ticker == ticker, B3Price.trade_date >= date.fromisoformat(min(days))).all()}
+    changed = [day for day, rec in zip(days, records)
+               if day not in stored or abs(stored[day] - rec["close"]) > 1e-6]
+    return date.fromisoformat(min(changed)) if changed else None
+
+
 def normalize_yahoo_robust(df: pd.DataFrame) -> pd.DataFrame:
     """
     Versão robusta: Garante Adjusted Close se disponível, mas não quebra se faltar.
@@ -256,7 +304,7 @@ def get_market_constants():
 
 
 @market_data_bp.post("/")
-def sync_ticker(payload: TickerSync):
+def sync_ticker(payload: TickerSync, db: Session = Depends(get_db)):
     ticker = payload.ticker
     force_mode = payload.force
     if not ticker:
@@ -356,12 +404,44 @@ def sync_ticker(payload: TickerSync):
 
         print(f"✅ {clean_ticker}: {len(records)} registros válidos processados.")
 
+        # Antes do upsert: a partir de quando os fechamentos do ticker mudam (histórico das carteiras)
+        try:
+            changed_from = _earliest_changed_close(db, clean_ticker, records)
+        except Exception as e:
+            db.rollback()
+            changed_from = min(date.fromisoformat(str(rec["trade_date"])[:10]) for rec in records) if records else None
+            print(f"⚠️ Falha ao comparar preços gravados: {e}")
+
         # Batch upsert
         BATCH_SIZE = 1000
         for i in range(0, len(records), BATCH_SIZE):
             batch = records[i:i + BATCH_SIZE]
             supabase.table("b3_prices").upsert(batch, on_conflict="ticker,trade_date").execute()
 
+        _upsert_yearly_closes(supabase, clean_ticker, records)
+
+        # Derivados das carteiras numa única transação: o adjusted_close histórico muda a cada
+        # provento (custo ajustado das posições) e a série salva é recalculada a partir do
+        # primeiro preço alterado
+        try:
+            refresh_adjusted_costs(db, clean_ticker)
+            if changed_from is not None:
+                invalidate_ticker_history(db, clean_ticker, changed_from)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Falha ao atualizar custo ajustado/histórico das carteiras: {e}")
+
+        # Screener: só a linha do ticker sincronizado
+        try:
+            refresh_ticker_metrics(db, [clean_ticker])
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Falha ao atualizar ticker_metrics: {e}")
+
+        # Resultados da análise em cache: um ressync no mesmo dia não muda a marca d'água
+        analysis_cache.invalidate(clean_ticker)
+
         max_date = df_norm['date'].max()
         return {"success": True, "count": len(records), "last_date": max_date}
 
@@ -0,0 +1,123 @@
+from datetime import timedelta
+from typing import List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import B3Price, CdiHistory, IfixHistory, IbovHistory, IpcaHistory
+
+# Benchmarks com tabela própria; qualquer outro nome é tratado como ticker da b3_prices
+INDEX_BENCHMARKS = ("cdi", "ifix", "ibov", "ipca")
+MAX_BENCHMARKS = 8
+
+
+def parse_benchmarks(raw: str) -> List[str]:
+    """'cdi,IFIX,ivvb11' -> ['cdi', 'ifix', 'IVVB11'] (sem duplicatas, na ordem pedida)."""
+    names = []
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name = part.lower() if part.lower() in INDEX_BENCHMARKS else part.upper()
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def _align_levels(values, index: pd.DatetimeIndex):
+    # Último valor conhecido em cada dia; antes do primeiro dado, o primeiro valor (fator 1)
+    values = values[~values.index.duplicated(keep='last')].sort_index()
+    return values.reindex(values.index.union(index)).ffill().reindex(index).bfill()
+
+
+def _rate_levels(rates: pd.Series, index: pd.DatetimeIndex) -> pd.Series:
+    # CDI: taxa diária em %; dias sem taxa (fim de semana/feriado) não rendem
+    factors = 1 + rates.reindex(index).fillna(0.0) / 100.0
+    return factors.cumprod()
+
+
+def _ipca_levels(monthly: pd.Series, index: pd.DatetimeIndex) -> pd.Series:
+    # IPCA mensal distribuído igualmente pelos dias corridos do mês
+    periods = index.to_period('M')
+    monthly_rate = monthly.groupby(monthly.index.to_period('M')).last()
+    rate = pd.Series(periods.map(monthly_rate), index=index).astype(float).fillna(0.0)
+    daily_factor = (1 + rate / 100.0) ** (1 / index.days_in_month.to_numpy())
+    return daily_factor.cumprod()
+
+
+def load_benchmark_levels(db: Session, names: List[str], index: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    Matriz data x benchmark com o nível de cada índice alinhado ao índice diário da carteira.
+    Cada fonte é lida com uma única consulta no intervalo da série; colunas sem dados ficam NaN.
+    """
+    start, end = index[0].date(), index[-1].date()
+    lookback = start - timedelta(days=10)
+    levels = pd.DataFrame(index=index, columns=names, dtype=float)
+
+    def to_series(rows) -> pd.Series:
+        if not rows:
+            return pd.Series(dtype=float)
+        df = pd.DataFrame(rows, columns=['trade_date', 'value'])
+        return pd.Series(pd.to_numeric(df['value']).to_numpy(dtype=float), index=pd.to_datetime(df['trade_date']))
+
+    if "cdi" in names:
+        rows = db.query(CdiHistory.trade_date, CdiHistory.value) \
+            .filter(CdiHistory.trade_date >= start, CdiHistory.trade_date <= end).all()
+        levels["cdi"] = _rate_levels(to_series(rows), index)
+
+    # Índices de pontos: inclui o último valor anterior ao início para o primeiro dia ter base
+    for name, model in (("ifix", IfixHistory), ("ibov", IbovHistory)):
+        if name in names:
+            rows = db.query(model.trade_date, model.close_value) \
+                .filter(model.trade_date >= lookback, model.trade_date <= end).all()
+            series = to_series(rows)
+            if not series.empty:
+                levels[name] = _align_levels(series, index)
+
+    if "ipca" in names:
+        rows = db.query(IpcaHistory.ref_date, IpcaHistory.ipca) \
+            .filter(IpcaHistory.ref_date >= start.replace(day=1), IpcaHistory.ref_date <= end).all()
+        if rows:
+            levels["ipca"] = _ipca_levels(to_series(rows), index)
+
+    tickers = [n for n in names if n not in INDEX_BENCHMARKS]
+    if tickers:
+        rows = db.query(B3Price.ticker, B3Price.trade_date, B3Price.close) \
+            .filter(B3Price.ticker.in_(tickers),
+                    B3Price.trade_date >= lookback, B3Price.trade_date <= end).all()
+        if rows:
+            df = pd.DataFrame(rows, columns=['ticker', 'trade_date', 'close'])
+            df['trade_date'] = pd.to_datetime(df['trade_date'])
+            df['close'] = pd.to_numeric(df['close']).astype(float)
+            matrix = df.pivot_table(index='trade_date', columns='ticker', values='close', aggfunc='last')
+            aligned = _align_levels(matrix, index)
+            levels[aligned.columns.tolist()] = aligned
+
+    return levels
+
+
+def benchmark_watermarks(db: Session, names: List[str]) -> List:
+    """Último dado de cada benchmark pedido (índices e tickers), para a versão (ETag) da série."""
+    sources = {"cdi": CdiHistory.trade_date, "ifix": IfixHistory.trade_date,
+               "ibov": IbovHistory.trade_date, "ipca": IpcaHistory.ref_date}
+    marks = [(name, db.query(func.max(sources[name])).scalar()) for name in names if name in sources]
+
+    tickers = [n for n in names if n not in INDEX_BENCHMARKS]
+    if tickers:
+        # inserted_at muda a cada /sync, mesmo quando o pregão é reescrito no mesmo dia
+        rows = db.query(B3Price.ticker, func.max(B3Price.trade_date), func.max(B3Price.inserted_at)) \
+            .filter(B3Price.ticker.in_(tickers)).group_by(B3Price.ticker).all()
+        marks += sorted(rows)
+    return marks
+
+
+def compound_benchmarks(levels: pd.DataFrame, cash_flows: np.ndarray) -> pd.DataFrame:
+    """
+    Curva "e se os aportes tivessem ido para o benchmark", para todas as colunas de uma vez:
+    b[t] = b[t-1] * L[t] / L[t-1] + c[t]  ->  b[t] = L[t] * cumsum(c / L)[t].
+    """
+    matrix = levels.to_numpy(dtype=float)
+    values = matrix * np.cumsum(cash_flows[:, None] / matrix, axis=0)
+    return pd.DataFrame(values, index=levels.index, columns=levels.columns)
@@ -0,0 +1,95 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, and_
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import AssetPurchase, B3Price
+from backend.source.features.wallet.wallet_benchmarks import load_benchmark_levels
+
+
+def _load_latest_prices_frame(db: Session, tickers: List[str]) -> pd.DataFrame:
+    # Último pregão de cada ticker (data, fechamento e ajustado) numa consulta
+    last_dates = db.query(B3Price.ticker, func.max(B3Price.trade_date).label("trade_date")) \
+        .filter(B3Price.ticker.in_(tickers)).group_by(B3Price.ticker).subquery()
+    rows = db.query(B3Price.ticker, B3Price.trade_date, B3Price.close, B3Price.adjusted_close) \
+        .join(last_dates, and_(B3Price.ticker == last_dates.c.ticker,
+                               B3Price.trade_date == last_dates.c.trade_date)).all()
+
+    df = pd.DataFrame(rows, columns=['ticker', 'last_date', 'close', 'adjusted_close'])
+    df['last_date'] = pd.to_datetime(df['last_date'])
+    df['close'] = pd.to_numeric(df['close']).astype(float)
+    df['adjusted_close'] = pd.to_numeric(df['adjusted_close']).astype(float)
+    df.loc[~(df['adjusted_close'] > 0), 'adjusted_close'] = df['close']
+    return df.set_index('ticker')
+
+
+def compute_contribution_performance(db: Session, user_id: str) -> List[Dict]:
+    """
+    Desempenho de cada aporte: valor atual, retorno bruto (preço de tela), retorno ajustado
+    (proventos reinvestidos, via adjusted_close) e CDI no mesmo período de posse.
+    Tudo em colunas: preços do dia da compra e atuais vêm em lote e o CDI de um único nível acumulado.
+    """
+    rows = db.query(AssetPurchase.id, AssetPurchase.ticker, AssetPurchase.type, AssetPurchase.qty,
+                    AssetPurchase.price, AssetPurchase.price_adjusted, AssetPurchase.trade_date) \
+        .filter(AssetPurchase.user_id == user_id) \
+        .order_by(AssetPurchase.trade_date.asc(), AssetPurchase.id.asc()).all()
+    if not rows:
+        return []
+
+    df = pd.DataFrame(rows, columns=['id', 'ticker', 'type', 'qty', 'price', 'price_adjusted', 'trade_date'])
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    df['qty'] = df['qty'].astype(float)
+    df['price'] = df['price'].astype(float)
+    df['price_adjusted'] = pd.to_numeric(df['price_adjusted']).astype(float).fillna(df['price'])
+
+    # Sem cotação: o aporte fica valendo o preço pago (retorno zero), como no dashboard
+    latest = _load_latest_prices_frame(db, df['ticker'].unique().tolist())
+    df = df.join(latest, on='ticker')
+    no_price = df['close'].isna()
+    df.loc[no_price, 'close'] = df['price']
+    df.loc[no_price, 'adjusted_close'] = df['price_adjusted']
+    df['last_date'] = df['last_date'].fillna(df['trade_date'])
+    df['last_date'] = df[['last_date', 'trade_date']].max(axis=1)
+
+    price = df['price'].to_numpy()
+    price_adj = df['price_adjusted'].to_numpy()
+    current_value = df['qty'].to_numpy() * df['close'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return_raw = np.where(price > 0, df['close'].to_numpy() / price - 1, 0.0)
+        return_adj = np.where(price_adj > 0, df['adjusted_close'].to_numpy() / price_adj - 1, 0.0)
+
+    # CDI acumulado: nível diário L; rende de (compra, última cotação] -> L[fim] / L[compra] - 1
+    index = pd.date_range(df['trade_date'].min(), df['last_date'].max(), freq='D')
+    cdi_level = load_benchmark_levels(db, ["cdi"], index)["cdi"].to_numpy(dtype=float)
+    has_cdi = not np.isnan(cdi_level).all()
+    if has_cdi:
+        start_pos = index.get_indexer(df['trade_date'])
+        end_pos = index.get_indexer(df['last_date'])
+        cdi_return = cdi_level[end_pos] / cdi_level[start_pos] - 1
+    else:
+        cdi_return = np.full(len(df), np.nan)
+
+    holding_days = (df['last_date'] - df['trade_date']).dt.days.to_numpy()
+
+    result = []
+    for i, r in enumerate(df.itertuples(index=False)):
+        cdi = float(cdi_return[i]) if np.isfinite(cdi_return[i]) else None
+        result.append({
+            "id": r.id,
+            "ticker": r.ticker,
+            "type": r.type,
+            "trade_date": r.trade_date.date(),
+            "qty": r.qty,
+            "price": r.price,
+            "current_price": round(float(r.close), 2),
+            "invested_value": round(r.qty * r.price, 2),
+            "current_value": round(float(current_value[i]), 2),
+            "holding_days": int(holding_days[i]),
+            "return_raw": round(float(return_raw[i]) * 100, 2),
+            "return_adjusted": round(float(return_adj[i]) * 100, 2),
+            "cdi_return": round(cdi * 100, 2) if cdi is not None else None,
+            "vs_cdi": round((float(return_adj[i]) - cdi) * 100, 2) if cdi is not None else None,
+        })
+    return result
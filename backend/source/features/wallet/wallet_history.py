@@ -0,0 +1,485 @@
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, and_, insert
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import AssetPurchase, B3Price, CdiHistory, WalletHistory, WalletHistoryPosition
+
+# Quantos dias antes do último ponto salvo são recalculados a cada leitura.
+# Cobre preços/CDI que chegam atrasados (sync de um ticker feito dias depois dos outros).
+HISTORY_REWIND_DAYS = 7
+
+HISTORY_COLUMNS = ['portfolio_value', 'invested_value', 'benchmark_value']
+
+
+# ==========================================
+#  CARGA DE DADOS
+# ==========================================
+
+def load_purchases_frame(db: Session, user_id: str) -> pd.DataFrame:
+    purchases = db.query(AssetPurchase.ticker, AssetPurchase.type, AssetPurchase.qty,
+                         AssetPurchase.price, AssetPurchase.trade_date, AssetPurchase.price_adjusted) \
+        .filter(AssetPurchase.user_id == user_id).order_by(AssetPurchase.trade_date.asc()).all()
+
+    df = pd.DataFrame(purchases, columns=['ticker', 'type', 'qty', 'price', 'trade_date', 'price_adjusted'])
+    if df.empty:
+        return df
+
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    df['qty'] = df['qty'].astype(float)
+    df['price'] = df['price'].astype(float)
+    df['price_adjusted'] = pd.to_numeric(df['price_adjusted']).astype(float).fillna(df['price'])
+    df['cash_flow'] = df['qty'] * df['price']
+    return df
+
+
+def _load_price_matrix(db: Session, tickers: list, start: pd.Timestamp, seeded: bool) -> pd.DataFrame:
+    """
+    Matriz data x ticker de fechamentos, diária (ffill), a partir de `start`.
+    Quando `seeded`, inclui o último preço anterior a `start` de cada ticker para o ffill não começar vazio.
+    """
+    rows = db.query(B3Price.ticker, B3Price.trade_date, B3Price.close) \
+        .filter(B3Price.ticker.in_(tickers), B3Price.trade_date >= start.date()).all()
+
+    if seeded:
+        last_before = db.query(B3Price.ticker, func.max(B3Price.trade_date).label('trade_date')) \
+            .filter(B3Price.ticker.in_(tickers), B3Price.trade_date < start.date()) \
+            .group_by(B3Price.ticker).subquery()
+        rows += db.query(B3Price.ticker, B3Price.trade_date, B3Price.close) \
+            .join(last_before, and_(B3Price.ticker == last_before.c.ticker,
+                                    B3Price.trade_date == last_before.c.trade_date)).all()
+
+    if not rows:
+        return pd.DataFrame()
+
+    df_prices = pd.DataFrame(rows, columns=['ticker', 'trade_date', 'close'])
+    df_prices['trade_date'] = pd.to_datetime(df_prices['trade_date'])
+    df_prices['close'] = pd.to_numeric(df_prices['close'])
+
+    price_matrix = df_prices.pivot(index='trade_date', columns='ticker', values='close').resample('D').ffill()
+    price_matrix = price_matrix.reindex(columns=tickers)
+    return price_matrix.loc[price_matrix.index >= start]
+
+
+def _load_cdi_factors(db: Session, index: pd.DatetimeIndex) -> np.ndarray:
+    rows = db.query(CdiHistory.trade_date, CdiHistory.value) \
+        .filter(CdiHistory.trade_date >= index[0].date(), CdiHistory.trade_date <= index[-1].date()).all()
+
+    if not rows:
+        return np.ones(len(index))
+
+    df_cdi = pd.DataFrame(rows, columns=['trade_date', 'value'])
+    df_cdi['trade_date'] = pd.to_datetime(df_cdi['trade_date'])
+    aligned = df_cdi.set_index('trade_date')['value'].reindex(index).fillna(0.0)
+    return (1 + aligned / 100.0).to_numpy()
+
+
+# ==========================================
+#  MOTOR DE HISTÓRICO
+# ==========================================
+
+def build_holdings_matrix(df_purchases: pd.DataFrame, index: pd.DatetimeIndex, tickers: list) -> pd.DataFrame:
+    """Quantidade acumulada de cada ticker em cada dia do índice (compras com trade_date <= dia)."""
+    daily_qty = df_purchases.pivot_table(index='trade_date', columns='ticker', values='qty', aggfunc='sum')
+    cumulative = daily_qty.reindex(columns=tickers, fill_value=0.0).fillna(0.0).cumsum()
+    return cumulative.reindex(index, method='ffill').fillna(0.0)
+
+
+def align_cash_flows(df_purchases: pd.DataFrame, index: pd.DatetimeIndex, start: pd.Timestamp) -> pd.Series:
+    """
+    Aportes por dia do índice. Aportes entre `start` e o primeiro dia com preço
+    são somados ao primeiro dia, para o benchmark e o investido não perderem dinheiro.
+    """
+    daily = df_purchases.groupby('trade_date')['cash_flow'].sum()
+    daily = daily[daily.index >= start]
+    aligned = daily.reindex(index, fill_value=0.0)
+    aligned.iloc[0] += daily[daily.index < index[0]].sum()
+    return aligned
+
+
+def compound_benchmark(cash_flows: np.ndarray, factors: np.ndarray, seed_value: float = 0.0) -> np.ndarray:
+    """
+    Resolve b[i] = b[i-1] * f[i] + c[i] sem loop:
+    b[i] = P[i] * (seed + sum_{k<=i} c[k] / P[k]), com P = cumprod(f).
+    """
+    growth = np.cumprod(factors)
+    return growth * (seed_value + np.cumsum(cash_flows / growth))
+
+
+def build_cost_matrix(df_purchases: pd.DataFrame, index: pd.DatetimeIndex, tickers: list) -> pd.DataFrame:
+    """Valor aportado acumulado de cada ticker em cada dia do índice."""
+    daily_cost = df_purchases.pivot_table(index='trade_date', columns='ticker', values='cash_flow', aggfunc='sum')
+    cumulative = daily_cost.reindex(columns=tickers, fill_value=0.0).fillna(0.0).cumsum()
+    return cumulative.reindex(index, method='ffill').fillna(0.0)
+
+
+def build_value_matrices(
+        db: Session,
+        df_purchases: pd.DataFrame,
+        start: Optional[pd.Timestamp] = None,
+        seeded: bool = False
+):
+    """
+    (price_matrix, holdings_matrix) data x ticker a partir de `start`, sobre o mesmo índice diário.
+    Retorna (None, None) quando não há preços no período.
+    """
+    tickers = df_purchases['ticker'].unique().tolist()
+    if start is None:
+        start = df_purchases['trade_date'].min()
+
+    price_matrix = _load_price_matrix(db, tickers, start, seeded=seeded)
+    if price_matrix.empty:
+        return None, None
+
+    return price_matrix, build_holdings_matrix(df_purchases, price_matrix.index, tickers)
+
+
+def _compute_history(
+        db: Session,
+        df_purchases: pd.DataFrame,
+        start: Optional[pd.Timestamp] = None,
+        seed: Optional[dict] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Série diária (portfolio, investido, benchmark CDI) a partir de `start` e, no mesmo índice,
+    as matrizes data x ticker de valor e de investido que a compõem.
+    `seed` carrega o estado do dia anterior a `start` (invested_value, benchmark_value).
+    """
+    if df_purchases.empty:
+        return pd.DataFrame(columns=HISTORY_COLUMNS), pd.DataFrame(), pd.DataFrame()
+
+    if start is None:
+        start = df_purchases['trade_date'].min()
+
+    price_matrix, holdings_matrix = build_value_matrices(db, df_purchases, start, seeded=seed is not None)
+    if price_matrix is None:
+        return pd.DataFrame(columns=HISTORY_COLUMNS), pd.DataFrame(), pd.DataFrame()
+
+    index = price_matrix.index
+    value_matrix = (holdings_matrix * price_matrix).fillna(0.0)
+    cost_matrix = build_cost_matrix(df_purchases, index, value_matrix.columns.tolist())
+
+    seed = seed or {}
+    cash_flows = align_cash_flows(df_purchases, index, start).to_numpy()
+    factors = _load_cdi_factors(db, index)
+
+    frame = pd.DataFrame({
+        'portfolio_value': value_matrix.sum(axis=1).to_numpy(),
+        'invested_value': seed.get('invested_value', 0.0) + np.cumsum(cash_flows),
+        'benchmark_value': compound_benchmark(cash_flows, factors, seed.get('benchmark_value', 0.0)),
+    }, index=index)
+    return frame, value_matrix, cost_matrix
+
+
+def compute_history_frame(
+        db: Session,
+        df_purchases: pd.DataFrame,
+        start: Optional[pd.Timestamp] = None,
+        seed: Optional[dict] = None
+) -> pd.DataFrame:
+    """Calcula a série diária (portfolio, investido, benchmark CDI) a partir de `start`."""
+    return _compute_history(db, df_purchases, start, seed)[0]
+
+
+def compute_breakdown_series(
+        value_matrix: pd.DataFrame,
+        cost_matrix: pd.DataFrame,
+        type_of: pd.Series,
+        types: Optional[List[str]] = None,
+        tickers: Optional[List[str]] = None
+) -> Dict[str, Tuple[pd.DataFrame, pd.DataFrame]]:
+    """
+    Séries (valor, investido) por tipo e/ou por ticker, como agrupamentos de colunas das
+    matrizes por ticker da série salva (get_history_frames): nenhum preço é recarregado.
+    `type_of` mapeia ticker -> tipo. Listas vazias significam "todos"; None significa "não calcular".
+    """
+    if value_matrix.empty or (types is None and tickers is None):
+        return {}
+
+    all_tickers = value_matrix.columns.tolist()
+
+    result = {}
+    if types is not None:
+        groups = type_of.reindex(all_tickers)
+        values = value_matrix.T.groupby(groups).sum().T
+        invested = cost_matrix.T.groupby(groups).sum().T
+        keys = types or values.columns.tolist()
+        result['by_type'] = (values.reindex(columns=keys, fill_value=0.0),
+                             invested.reindex(columns=keys, fill_value=0.0))
+
+    if tickers is not None:
+        keys = tickers or all_tickers
+        result['by_ticker'] = (value_matrix.reindex(columns=keys, fill_value=0.0),
+                               cost_matrix.reindex(columns=keys, fill_value=0.0))
+
+    return result
+
+
+# ==========================================
+#  SÉRIE PERSISTIDA (wallet_history)
+# ==========================================
+
+def _load_stored_history(db: Session, user_id: str) -> pd.DataFrame:
+    rows = db.query(WalletHistory.trade_date, WalletHistory.portfolio_value,
+                    WalletHistory.invested_value, WalletHistory.benchmark_value) \
+        .filter(WalletHistory.user_id == user_id).order_by(WalletHistory.trade_date.asc()).all()
+
+    df = pd.DataFrame(rows, columns=['trade_date'] + HISTORY_COLUMNS)
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    return df.set_index('trade_date')
+
+
+def _load_stored_positions(db: Session, user_id: str, index: pd.DatetimeIndex) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    # Matrizes data x ticker (valor, investido) do trecho salvo; dia sem linha = sem posição
+    if index.empty:
+        return pd.DataFrame(index=index), pd.DataFrame(index=index)
+
+    rows = db.query(WalletHistoryPosition.trade_date, WalletHistoryPosition.ticker,
+                    WalletHistoryPosition.value, WalletHistoryPosition.invested) \
+        .filter(WalletHistoryPosition.user_id == user_id,
+                WalletHistoryPosition.trade_date >= index[0].date(),
+                WalletHistoryPosition.trade_date <= index[-1].date()).all()
+
+    df = pd.DataFrame(rows, columns=['trade_date', 'ticker', 'value', 'invested'])
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    values = df.pivot(index='trade_date', columns='ticker', values='value').reindex(index).fillna(0.0)
+    invested = df.pivot(index='trade_date', columns='ticker', values='invested').reindex(index).fillna(0.0)
+    return values, invested
+
+
+def _persist_history(db: Session, user_id: str, frame: pd.DataFrame, value_matrix: pd.DataFrame,
+                     cost_matrix: pd.DataFrame, from_date: date) -> None:
+    try:
+        for model in (WalletHistory, WalletHistoryPosition):
+            db.query(model) \
+                .filter(model.user_id == user_id, model.trade_date >= from_date) \
+                .delete(synchronize_session=False)
+        rows = [{
+            "user_id": user_id,
+            "trade_date": ts.date(),
+            "portfolio_value": float(r.portfolio_value),
+            "invested_value": float(r.invested_value),
+            "benchmark_value": float(r.benchmark_value),
+        } for ts, r in zip(frame.index, frame.itertuples(index=False))]
+        if rows:
+            db.execute(insert(WalletHistory), rows)
+
+        # Posições em formato longo, só onde o ticker tem valor ou investido
+        positions = pd.DataFrame({'value': value_matrix.stack(), 'invested': cost_matrix.stack()})
+        positions = positions[(positions['value'] != 0) | (positions['invested'] != 0)]
+        position_rows = [{
+            "user_id": user_id,
+            "trade_date": ts.date(),
+            "ticker": ticker,
+            "value": float(value),
+            "invested": float(invested),
+        } for (ts, ticker), value, invested in zip(positions.index, positions['value'], positions['invested'])]
+        if position_rows:
+            db.execute(insert(WalletHistoryPosition), position_rows)
+        db.commit()
+    except Exception as e:
+        # Outra requisição pode ter gravado o mesmo trecho; a próxima leitura recalcula.
+        db.rollback()
+        print(f"⚠️ Erro ao salvar histórico da carteira: {e}")
+
+
+def _concat_matrices(kept: pd.DataFrame, fresh: pd.DataFrame) -> pd.DataFrame:
+    # Trecho salvo + recalculado; ticker ausente num dos trechos = sem posição
+    columns = list(dict.fromkeys(kept.columns.tolist() + fresh.columns.tolist()))
+    return pd.concat([kept.reindex(columns=columns, fill_value=0.0),
+                      fresh.reindex(columns=columns, fill_value=0.0)])
+
+
+def get_history_frames(
+        db: Session,
+        user_id: str,
+        df_purchases: Optional[pd.DataFrame] = None,
+        with_positions: bool = True
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+    """
+    Série diária da carteira e, com `with_positions`, as matrizes data x ticker de valor e de
+    investido no mesmo índice. Lê o trecho salvo (wallet_history e wallet_history_positions) e
+    recalcula apenas os últimos HISTORY_REWIND_DAYS dias mais os dias novos; o trecho novo é salvo.
+    """
+    if df_purchases is None:
+        df_purchases = load_purchases_frame(db, user_id)
+    if df_purchases.empty:
+        empty = pd.DataFrame() if with_positions else None
+        return pd.DataFrame(columns=HISTORY_COLUMNS), empty, empty
+
+    stored = _load_stored_history(db, user_id)
+
+    start, seed = None, None
+    if not stored.empty:
+        rewind_start = stored.index[-1] - timedelta(days=HISTORY_REWIND_DAYS)
+        before = stored[stored.index < rewind_start]
+        if not before.empty:
+            start = rewind_start
+            seed = before.iloc[-1].to_dict()
+
+    fresh, fresh_values, fresh_costs = _compute_history(db, df_purchases, start, seed)
+    if fresh.empty:
+        kept = stored
+    else:
+        kept = stored[stored.index < fresh.index[0]] if start is not None else stored.iloc[0:0]
+        if stored.empty or fresh.index[-1] > stored.index[-1]:
+            _persist_history(db, user_id, fresh, fresh_values, fresh_costs, fresh.index[0].date())
+
+    series = pd.concat([kept, fresh]) if not fresh.empty else kept
+    if not with_positions:
+        return series, None, None
+
+    kept_values, kept_costs = _load_stored_positions(db, user_id, kept.index)
+    if fresh.empty:
+        return series, kept_values, kept_costs
+    return series, _concat_matrices(kept_values, fresh_values), _concat_matrices(kept_costs, fresh_costs)
+
+
+def get_history_series(db: Session, user_id: str, df_purchases: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Série diária da carteira (ver get_history_frames), sem as matrizes por ticker."""
+    return get_history_frames(db, user_id, df_purchases, with_positions=False)[0]
+
+
+def invalidate_history(db: Session, user_id: str, from_date: date) -> None:
+    """
+    Descarta a série salva (e as posições por ticker) a partir de `from_date` (compra
+    criada/alterada/removida). Não faz commit: roda na mesma transação da alteração da compra.
+    """
+    for model in (WalletHistory, WalletHistoryPosition):
+        db.query(model) \
+            .filter(model.user_id == user_id, model.trade_date >= from_date) \
+            .delete(synchronize_session=False)
+
+
+def invalidate_ticker_history(db: Session, ticker: str, from_date: date) -> int:
+    """
+    Preços do ticker gravados/reescritos a partir de `from_date` (sync, backfill): descarta a série
+    salva de quem tem o ticker, a partir dessa data ou da primeira compra dele, o que for depois.
+    O rewind de HISTORY_REWIND_DAYS não cobre backfills antigos. Não faz commit.
+    """
+    holders = db.query(AssetPurchase.user_id, func.min(AssetPurchase.trade_date)) \
+        .filter(AssetPurchase.ticker == ticker).group_by(AssetPurchase.user_id).all()
+    for user_id, first_purchase in holders:
+        invalidate_history(db, user_id, max(from_date, first_purchase))
+    return len(holders)
+
+
+def purchases_frame_from_rows(rows: List[dict], adjusted: Optional[dict] = None) -> pd.DataFrame:
+    """Mesmo formato de load_purchases_frame para compras que não estão no banco (what-if)."""
+    df = pd.DataFrame(rows, columns=['ticker', 'type', 'qty', 'price', 'trade_date'])
+    if df.empty:
+        return df
+
+    adjusted = adjusted or {}
+    df['price_adjusted'] = [adjusted.get((r.ticker, r.trade_date), float(r.price)) for r in df.itertuples()]
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    df['qty'] = df['qty'].astype(float)
+    df['price'] = df['price'].astype(float)
+    df['cash_flow'] = df['qty'] * df['price']
+    return df
+
+
+def apply_purchase_deltas(
+        db: Session,
+        series: pd.DataFrame,
+        df_extra: pd.DataFrame,
+        value_matrix: Optional[pd.DataFrame] = None,
+        cost_matrix: Optional[pd.DataFrame] = None
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+    """
+    Soma à série salva (e às matrizes por ticker, se passadas) o efeito de compras extras.
+    A série é linear nas compras (valor, investido e benchmark), então basta calcular a série
+    só das extras e somar, sem refazer a carteira inteira.
+    Compras depois do último dia da série entram no último dia.
+    """
+    if df_extra.empty:
+        return series, value_matrix, cost_matrix
+    if series.empty:
+        delta, delta_values, delta_costs = _compute_history(db, df_extra)
+        if value_matrix is None:
+            return delta, None, None
+        return delta, delta_values, delta_costs
+
+    df_extra = df_extra.assign(trade_date=df_extra['trade_date'].clip(upper=series.index[-1]))
+    delta, delta_values, delta_costs = _compute_history(db, df_extra)
+    if delta.empty:
+        return series, value_matrix, cost_matrix
+
+    def aligned(frame: pd.DataFrame) -> pd.DataFrame:
+        return frame.reindex(series.index, method='ffill').fillna(0.0)
+
+    series = series.add(aligned(delta), fill_value=0.0)
+    if value_matrix is not None:
+        value_matrix = value_matrix.add(aligned(delta_values), fill_value=0.0)
+        cost_matrix = cost_matrix.add(aligned(delta_costs), fill_value=0.0)
+    return series, value_matrix, cost_matrix
+
+
+# ==========================================
+#  RECORTE / RESOLUÇÃO / DOWNSAMPLING
+# ==========================================
+
+RESOLUTION_PERIODS = {'weekly': 'W', 'monthly': 'M'}
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: escolhe `n_out` pontos que preservam o formato da curva.
+    Sempre mantém o primeiro e o último ponto. Cada bucket é avaliado de forma vetorizada.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Buckets internos (o primeiro e o último ponto ficam de fora)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+
+    prev = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        next_lo, next_hi = edges[b + 1], (edges[b + 2] if b + 2 < len(edges) else n)
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+
+        areas = np.abs((x[prev] - avg_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (avg_y - y[prev]))
+        prev = lo + int(np.argmax(areas))
+        selected[b + 1] = prev
+
+    return selected
+
+
+def shape_history(
+        series: pd.DataFrame,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        resolution: str = 'daily',
+        max_points: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Recorta a série em [start, end], reduz para semanal/mensal (último ponto de cada período,
+    com a data real) e aplica LTTB se `max_points` for menor que o número de pontos.
+    O primeiro e o último ponto do recorte são sempre preservados.
+    """
+    if start is not None:
+        series = series[series.index >= pd.Timestamp(start)]
+    if end is not None:
+        series = series[series.index <= pd.Timestamp(end)]
+    if series.empty:
+        return series
+
+    if resolution in RESOLUTION_PERIODS:
+        period_ends = series.groupby(series.index.to_period(RESOLUTION_PERIODS[resolution])).tail(1)
+        series = pd.concat([series.iloc[:1], period_ends])
+        series = series[~series.index.duplicated(keep='first')]
+
+    if max_points and len(series) > max_points:
+        x = series.index.asi8.astype(float)
+        y = series['portfolio_value'].to_numpy(dtype=float)
+        series = series.iloc[lttb_indices(x, y, max_points)]
+
+    return series
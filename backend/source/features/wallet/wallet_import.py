@@ -0,0 +1,255 @@
+import csv
+import hashlib
+import io
+import json
+import re
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import AssetPurchase
+from backend.source.features.wallet.wallet_positions import lookup_adjusted_prices
+
+# Linhas validadas e gravadas por vez (lookup de preço ajustado + dedupe + INSERT em lote)
+IMPORT_CHUNK_ROWS = 2000
+MAX_IMPORT_ERRORS = 50
+
+# Cabeçalhos aceitos para cada campo (formato da API e exportação "Negociação" do portal do investidor B3)
+COLUMN_ALIASES = {
+    "ticker": ("ticker", "código de negociação", "codigo de negociacao", "código", "codigo"),
+    "trade_date": ("trade_date", "data do negócio", "data do negocio", "data"),
+    "qty": ("qty", "quantidade"),
+    "price": ("price", "preço", "preco", "preço unitário", "preco unitario"),
+    "type": ("type", "tipo"),
+    "name": ("name", "nome"),
+    "side": ("side", "tipo de movimentação", "tipo de movimentacao"),
+}
+
+# Mesma heurística do importador do frontend (AssetsManager)
+KNOWN_ETFS = {"IVVB11", "BOVA11", "SMAL11", "QQQQ11", "XINA11", "HASH11"}
+# Tipos que o dashboard agrupa; BDR (final 33/34) e nomes em português entram como ação
+ASSET_TYPES = ("stock", "fii", "etf")
+TYPE_ALIASES = {"bdr": "stock", "acao": "stock", "ação": "stock", "acoes": "stock", "ações": "stock"}
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+# ==========================================
+#  HASH DE CONTEÚDO (IDEMPOTÊNCIA)
+# ==========================================
+
+def purchase_content_hash(ticker: str, asset_type: str, trade_date: date, qty: float, price: float) -> str:
+    """Hash do conteúdo de uma compra; igual para a mesma compra importada de novo."""
+    key = f"{ticker.upper()}|{asset_type.lower()}|{trade_date.isoformat()}|{float(qty):.6f}|{float(price):.2f}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def set_content_hashes(purchases: Iterable[AssetPurchase]) -> None:
+    for p in purchases:
+        p.content_hash = purchase_content_hash(p.ticker, p.type, p.trade_date, p.qty, p.price)
+
+
+# ==========================================
+#  PARSE / VALIDAÇÃO
+# ==========================================
+
+# "1.000", "12.345.678": milhar no formato brasileiro ou decimal no americano
+_GROUPED_THOUSANDS = re.compile(r"^\d{1,3}(\.\d{3})+$")
+
+
+def _parse_number(raw, brazilian: bool = False) -> float:
+    """
+    Número do arquivo. Com vírgula, o formato é brasileiro (1.234,56). Só com pontos em grupos de
+    três ("1.000"), é milhar em arquivo com cabeçalhos em português (`brazilian`) e ambíguo
+    (recusado) fora dele. Qualquer outro ponto é decimal (35.5).
+    """
+    if isinstance(raw, (int, float)):
+        return float(raw)
+    text = str(raw).replace("R$", "").strip()
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    elif _GROUPED_THOUSANDS.match(text):
+        if not brazilian:
+            raise ImportRowError(f"número ambíguo: {text!r} (use 1000 ou 1.000,00)")
+        text = text.replace(".", "")
+    return float(text)
+
+
+def _parse_date(raw) -> date:
+    text = str(raw).strip()
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d/%m/%y"):
+        try:
+            return datetime.strptime(text[:10], fmt).date()
+        except ValueError:
+            continue
+    raise ImportRowError(f"data inválida: {raw!r}")
+
+
+def _infer_type(ticker: str) -> str:
+    if ticker in KNOWN_ETFS:
+        return "etf"
+    if ticker.endswith("11"):
+        return "fii"
+    return "stock"
+
+
+def normalize_row(row: Dict) -> Optional[Dict]:
+    """
+    Linha crua (CSV ou JSON) -> dict pronto para asset_purchases, ou None se não for compra.
+    Lança ImportRowError quando a linha é uma compra inválida.
+    """
+    if not isinstance(row, dict):
+        raise ImportRowError("linha não é um objeto")
+
+    fields = {}
+    brazilian = False
+    lowered = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if lowered.get(alias) not in (None, ""):
+                fields[field] = lowered[alias]
+                # Cabeçalho em português (exportação da B3): números no formato brasileiro
+                brazilian = brazilian or alias != aliases[0]
+                break
+
+    side = str(fields.get("side", "")).strip().lower()
+    if side and side not in ("compra", "buy", "c"):
+        return None
+
+    missing = [f for f in ("ticker", "trade_date", "qty", "price") if f not in fields]
+    if missing:
+        raise ImportRowError(f"campos ausentes: {', '.join(missing)}")
+
+    ticker = str(fields["ticker"]).strip().upper()
+    # Mercado fracionário (PETR4F) entra como o ticker cheio
+    if ticker.endswith("F") and len(ticker) > 5:
+        ticker = ticker[:-1]
+
+    try:
+        qty = _parse_number(fields["qty"], brazilian)
+        price = _parse_number(fields["price"], brazilian)
+    except ImportRowError:
+        raise
+    except ValueError:
+        raise ImportRowError("quantidade/preço inválidos")
+    if qty <= 0 or price <= 0:
+        raise ImportRowError("quantidade e preço devem ser positivos")
+
+    asset_type = str(fields.get("type") or _infer_type(ticker)).strip().lower()
+    asset_type = TYPE_ALIASES.get(asset_type, asset_type)
+    if asset_type not in ASSET_TYPES:
+        raise ImportRowError(f"tipo inválido: {asset_type!r} (use {', '.join(ASSET_TYPES)})")
+
+    # Preço como veio no arquivo; o arredondamento fica só no hash de dedupe
+    return {
+        "ticker": ticker,
+        "name": str(fields.get("name") or ticker).strip(),
+        "type": asset_type,
+        "qty": qty,
+        "price": price,
+        "trade_date": _parse_date(fields["trade_date"]),
+    }
+
+
+def iter_rows(stream: io.TextIOBase, fmt: str) -> Iterator:
+    """
+    Linhas do arquivo, uma a uma (CSV com cabeçalho, ';' ou ',', ou JSON lines).
+    No JSON lines o texto é devolvido cru; o parse fica com quem consome (erro por linha).
+    """
+    if fmt == "jsonl":
+        for line in stream:
+            if line.strip():
+                yield line
+        return
+
+    header = stream.readline()
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    columns = next(csv.reader([header], delimiter=delimiter))
+    for values in csv.reader(stream, delimiter=delimiter):
+        if any(v.strip() for v in values):
+            yield dict(zip(columns, values))
+
+
+# ==========================================
+#  IMPORTAÇÃO EM LOTES
+# ==========================================
+
+def _existing_hash_counts(db: Session, user_id: str, hashes: List[str]) -> Dict[str, int]:
+    rows = db.query(AssetPurchase.content_hash, func.count()) \
+        .filter(AssetPurchase.user_id == user_id, AssetPurchase.content_hash.in_(hashes)) \
+        .group_by(AssetPurchase.content_hash).all()
+    return {h: n for h, n in rows}
+
+
+def import_purchase_stream(db: Session, user_id: str, stream: io.TextIOBase, fmt: str) -> Dict:
+    """
+    Importa compras de um arquivo em lotes de IMPORT_CHUNK_ROWS, numa única transação (sem commit).
+
+    Dedupe por hash de conteúdo: a k-ésima ocorrência de uma compra no arquivo é descartada
+    se já existem k compras iguais gravadas. Reimportar o mesmo arquivo não duplica nada, e
+    compras idênticas legítimas (mesmo dia, qtd e preço) continuam entrando.
+    Memória: só o lote atual e um contador por hash distinto.
+    """
+    existing_counts: Dict[str, int] = {}
+    seen_counts: Dict[str, int] = {}
+    stats = {"inserted": 0, "duplicates": 0, "skipped": 0, "errors": []}
+    tickers, min_date = set(), None
+
+    def flush(chunk: List[Dict]) -> None:
+        nonlocal min_date
+        unknown = list({r["content_hash"] for r in chunk} - existing_counts.keys())
+        if unknown:
+            existing_counts.update(dict.fromkeys(unknown, 0))
+            existing_counts.update(_existing_hash_counts(db, user_id, unknown))
+
+        fresh = []
+        for r in chunk:
+            h = r["content_hash"]
+            seen_counts[h] = seen_counts.get(h, 0) + 1
+            if seen_counts[h] <= existing_counts[h]:
+                stats["duplicates"] += 1
+            else:
+                fresh.append(r)
+        if not fresh:
+            return
+
+        adjusted = lookup_adjusted_prices(db, [(r["ticker"], r["trade_date"]) for r in fresh])
+        for r in fresh:
+            r["user_id"] = user_id
+            r["price_adjusted"] = adjusted.get((r["ticker"], r["trade_date"]), r["price"])
+        db.execute(insert(AssetPurchase), fresh)
+
+        stats["inserted"] += len(fresh)
+        tickers.update(r["ticker"] for r in fresh)
+        chunk_min = min(r["trade_date"] for r in fresh)
+        min_date = chunk_min if min_date is None else min(min_date, chunk_min)
+
+    chunk = []
+    for line_no, raw in enumerate(iter_rows(stream, fmt), start=2 if fmt == "csv" else 1):
+        try:
+            row = normalize_row(json.loads(raw) if isinstance(raw, str) else raw)
+        except (ImportRowError, ValueError) as e:
+            stats["skipped"] += 1
+            if len(stats["errors"]) < MAX_IMPORT_ERRORS:
+                stats["errors"].append({"line": line_no, "error": str(e)})
+            continue
+        if row is None:
+            stats["skipped"] += 1
+            continue
+
+        row["content_hash"] = purchase_content_hash(row["ticker"], row["type"], row["trade_date"],
+                                                    row["qty"], row["price"])
+        chunk.append(row)
+        if len(chunk) >= IMPORT_CHUNK_ROWS:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    stats["tickers"] = tickers
+    stats["min_date"] = min_date
+    return stats
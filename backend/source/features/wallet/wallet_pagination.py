@@ -0,0 +1,62 @@
+import base64
+from datetime import date
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+from backend.source.models.sql_models import AssetPurchase
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(trade_date: date, purchase_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{trade_date.isoformat()}:{purchase_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        day, purchase_id = raw.split(":")
+        return date.fromisoformat(day), int(purchase_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def filter_purchases(
+        query: Query,
+        tickers: Optional[str] = None,
+        types: Optional[str] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None
+) -> Query:
+    """Filtros do servidor: tickers/tipos em lista separada por vírgula e intervalo de datas (inclusivo)."""
+    if tickers:
+        query = query.filter(AssetPurchase.ticker.in_([t.strip().upper() for t in tickers.split(",") if t.strip()]))
+    if types:
+        query = query.filter(AssetPurchase.type.in_([t.strip().lower() for t in types.split(",") if t.strip()]))
+    if start:
+        query = query.filter(AssetPurchase.trade_date >= start)
+    if end:
+        query = query.filter(AssetPurchase.trade_date <= end)
+    return query
+
+
+def paginate_purchases(query: Query, limit: int, cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """
+    Página por keyset em (trade_date, id), do mais recente para o mais antigo. Percorre o índice
+    (user_id, trade_date, id) a partir do cursor, então o custo não cresce com o número da página.
+    A query precisa selecionar trade_date e id. Retorna (linhas, próximo cursor ou None).
+    """
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        query = query.filter(tuple_(AssetPurchase.trade_date, AssetPurchase.id) < tuple_(last_date, last_id))
+
+    rows = query.order_by(AssetPurchase.trade_date.desc(), AssetPurchase.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].trade_date, rows[-1].id)
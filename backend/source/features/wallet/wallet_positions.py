@@ -0,0 +1,151 @@
+from datetime import date
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from sqlalchemy import func, insert, select, tuple_, update, and_
+from sqlalchemy.orm import Session
+
+from backend.source.models.sql_models import AssetPurchase, B3Price, WalletPosition
+
+
+def lookup_adjusted_prices(db: Session, keys: Iterable[Tuple[str, object]]) -> Dict[Tuple[str, object], float]:
+    """adjusted_close de cada (ticker, trade_date) pedido, numa única consulta."""
+    keys = list(set(keys))
+    if not keys:
+        return {}
+
+    rows = db.query(B3Price.ticker, B3Price.trade_date, B3Price.adjusted_close) \
+        .filter(tuple_(B3Price.ticker, B3Price.trade_date).in_(keys)).all()
+
+    return {(r.ticker, r.trade_date): float(r.adjusted_close)
+            for r in rows if r.adjusted_close and r.adjusted_close > 0}
+
+
+def capture_adjusted_prices(db: Session, purchases: List[AssetPurchase]) -> None:
+    """Preenche price_adjusted das compras (fallback: preço pago), antes de gravar."""
+    adjusted = lookup_adjusted_prices(db, [(p.ticker, p.trade_date) for p in purchases])
+    for p in purchases:
+        p.price_adjusted = adjusted.get((p.ticker, p.trade_date), float(p.price))
+
+
+def rebuild_positions(db: Session, user_id: str, tickers: Iterable[str]) -> None:
+    """
+    Recalcula as linhas de wallet_positions dos tickers afetados a partir de asset_purchases,
+    com um DELETE + INSERT ... SELECT GROUP BY. Não faz commit (mesma transação da compra).
+    """
+    tickers = list(set(tickers))
+    if not tickers:
+        return
+
+    db.flush()
+    db.query(WalletPosition) \
+        .filter(WalletPosition.user_id == user_id, WalletPosition.ticker.in_(tickers)) \
+        .delete(synchronize_session=False)
+
+    aggregate = select(
+        AssetPurchase.user_id,
+        AssetPurchase.ticker,
+        func.min(AssetPurchase.type),
+        func.sum(AssetPurchase.qty),
+        func.sum(AssetPurchase.qty * AssetPurchase.price),
+        func.sum(AssetPurchase.qty * func.coalesce(AssetPurchase.price_adjusted, AssetPurchase.price)),
+        func.min(AssetPurchase.trade_date),
+    ).where(AssetPurchase.user_id == user_id, AssetPurchase.ticker.in_(tickers)) \
+        .group_by(AssetPurchase.user_id, AssetPurchase.ticker)
+
+    db.execute(insert(WalletPosition).from_select(
+        ['user_id', 'ticker', 'type', 'qty', 'cost_raw', 'cost_adjusted', 'min_date'], aggregate))
+
+
+def refresh_adjusted_costs(db: Session, ticker: str) -> None:
+    """
+    O Yahoo reescreve o adjusted_close histórico a cada provento. Depois de um /sync,
+    atualiza price_adjusted das compras do ticker e o cost_adjusted de todas as posições dele.
+    Não faz commit (mesma transação do restante do /sync).
+    """
+    db.execute(
+        update(AssetPurchase)
+        .where(AssetPurchase.ticker == ticker,
+               B3Price.ticker == AssetPurchase.ticker,
+               B3Price.trade_date == AssetPurchase.trade_date,
+               B3Price.adjusted_close > 0)
+        .values(price_adjusted=B3Price.adjusted_close)
+        .execution_options(synchronize_session=False)
+    )
+
+    new_cost = select(func.sum(AssetPurchase.qty * func.coalesce(AssetPurchase.price_adjusted, AssetPurchase.price))) \
+        .where(and_(AssetPurchase.user_id == WalletPosition.user_id, AssetPurchase.ticker == WalletPosition.ticker)) \
+        .scalar_subquery()
+
+    db.execute(
+        update(WalletPosition)
+        .where(WalletPosition.ticker == ticker)
+        .values(cost_adjusted=new_cost)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def load_positions(db: Session, user_id: str) -> Dict[str, Dict]:
+    """pos_map do dashboard: ticker -> {qty, cost_raw, cost_adjusted, type, min_date}."""
+    rows = db.query(WalletPosition).filter(WalletPosition.user_id == user_id).all()
+    return {r.ticker: {
+        'qty': r.qty,
+        'cost_raw': r.cost_raw,
+        'cost_adjusted': r.cost_adjusted,
+        'type': r.type,
+        'min_date': r.min_date
+    } for r in rows}
+
+
+def positions_as_of(df_purchases: pd.DataFrame, as_of: date) -> Dict[str, Dict]:
+    """
+    pos_map como estava em `as_of`: quantidade e custos acumulados por ticker (arrays ordenados
+    por data) com busca binária da última compra <= as_of, em vez de refazer a agregação filtrada.
+    """
+    if df_purchases.empty:
+        return {}
+
+    df = df_purchases.sort_values(['ticker', 'trade_date'], kind='stable')
+    grouped = df.groupby('ticker', sort=False)
+    cum_qty = grouped['qty'].cumsum().to_numpy()
+    cum_raw = grouped['cash_flow'].cumsum().to_numpy()
+    cum_adj = (df['qty'] * df['price_adjusted']).groupby(df['ticker'], sort=False).cumsum().to_numpy()
+    dates = df['trade_date'].to_numpy()
+    types = df['type'].to_numpy()
+
+    sizes = grouped.size()
+    target = np.datetime64(pd.Timestamp(as_of))
+    pos_map = {}
+    for ticker, (lo, hi) in zip(sizes.index, _segments(sizes.to_numpy())):
+        idx = lo + np.searchsorted(dates[lo:hi], target, side='right') - 1
+        if idx < lo:
+            continue
+        pos_map[ticker] = {
+            'qty': float(cum_qty[idx]),
+            'cost_raw': float(cum_raw[idx]),
+            'cost_adjusted': float(cum_adj[idx]),
+            'type': min(types[lo:idx + 1]),
+            'min_date': pd.Timestamp(dates[lo]).date()
+        }
+    return pos_map
+
+
+def _segments(sizes: np.ndarray):
+    ends = np.cumsum(sizes)
+    return zip(ends - sizes, ends)
+
+
+def apply_position_deltas(pos_map: Dict[str, Dict], df_extra: pd.DataFrame) -> Dict[str, Dict]:
+    """Novo pos_map com compras extras (what-if) somadas às posições; o original não é alterado."""
+    result = {ticker: dict(data) for ticker, data in pos_map.items()}
+    for r in df_extra.itertuples():
+        trade_date = r.trade_date.date()
+        data = result.setdefault(r.ticker, {'qty': 0.0, 'cost_raw': 0.0, 'cost_adjusted': 0.0,
+                                            'type': r.type, 'min_date': trade_date})
+        data['qty'] += r.qty
+        data['cost_raw'] += r.qty * r.price
+        data['cost_adjusted'] += r.qty * r.price_adjusted
+        data['min_date'] = min(data['min_date'], trade_date)
+    return result
@@ -0,0 +1,177 @@
+from datetime import date
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# Limites de busca para log(1 + taxa anual): de -99,99% a +10.000% a.a.
+XIRR_LOG_BOUNDS = (np.log(1e-4), np.log(101.0))
+XIRR_MAX_ITER = 100
+XIRR_TOL = 1e-10
+# Abaixo de um ano, XIRR/TWR saem como retorno do período (anualizar poucos dias só amplia ruído)
+MIN_ANNUALIZED_DAYS = 365
+
+
+# ==========================================
+#  SOLVER EM LOTE
+# ==========================================
+
+def solve_xirr(amounts: np.ndarray, years_to_end: np.ndarray) -> np.ndarray:
+    """
+    Resolve a XIRR de várias carteiras de uma vez (uma linha de `amounts` por carteira).
+
+    `amounts` é grupos x datas (aportes negativos, valor final positivo) e `years_to_end` é o
+    prazo de cada data até a data final, em anos. Com x = log(1 + r), o valor futuro
+    f(x) = sum(a * exp(x * tau)) é decrescente quando só o valor final é positivo, então
+    Newton protegido por bisseção converge para a raiz única. Linhas sem raiz no intervalo -> NaN.
+    """
+    amounts = np.atleast_2d(np.asarray(amounts, dtype=float))
+    tau = np.asarray(years_to_end, dtype=float)[None, :]
+
+    def npv(x):
+        growth = np.exp(x[:, None] * tau)
+        return (amounts * growth).sum(axis=1), (amounts * tau * growth).sum(axis=1)
+
+    n = amounts.shape[0]
+    lo = np.full(n, XIRR_LOG_BOUNDS[0])
+    hi = np.full(n, XIRR_LOG_BOUNDS[1])
+    f_lo, _ = npv(lo)
+    f_hi, _ = npv(hi)
+    valid = (np.sign(f_lo) != np.sign(f_hi)) & (np.abs(amounts).sum(axis=1) > 0)
+
+    x = np.zeros(n)
+    for _ in range(XIRR_MAX_ITER):
+        f, df = npv(x)
+        done = np.abs(f) <= XIRR_TOL * np.maximum(1.0, np.abs(amounts).sum(axis=1))
+        if np.all(done | ~valid):
+            break
+
+        # Encolhe o intervalo mantendo a troca de sinal entre lo e hi
+        same_as_lo = np.sign(f) == np.sign(f_lo)
+        lo = np.where(same_as_lo, x, lo)
+        f_lo = np.where(same_as_lo, f, f_lo)
+        hi = np.where(same_as_lo, hi, x)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = x - f / df
+        inside = np.isfinite(newton) & (newton > lo) & (newton < hi)
+        x = np.where(done, x, np.where(inside, newton, (lo + hi) / 2))
+
+    return np.where(valid, np.expm1(x), np.nan)
+
+
+def _twr_from_values(values: np.ndarray, flows: np.ndarray) -> np.ndarray:
+    """
+    TWR acumulado por coluna: produto dos retornos diários (V[t] - aporte[t]) / V[t-1].
+    Dias com carteira vazia na véspera não contam (retorno neutro).
+    """
+    previous = np.vstack([np.zeros((1, values.shape[1])), values[:-1]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily = np.where(previous > 0, (values - flows) / previous, 1.0)
+    return np.prod(daily, axis=0) - 1
+
+
+def _annualize(total_return: np.ndarray, days: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(days > 0, (1 + total_return) ** (365.0 / np.maximum(days, 1)) - 1, np.nan)
+
+
+def _modified_dietz(amounts: np.ndarray, days_to_end: np.ndarray, held_days: np.ndarray) -> np.ndarray:
+    """
+    Retorno ponderado pelo dinheiro do período, sem anualizar e sem solver: lucro sobre o capital
+    médio, cada aporte pesando a fração do período em que ficou investido.
+    `amounts` é grupos x datas como em solve_xirr (aportes negativos, valor final na última coluna).
+    """
+    flows = -amounts[:, :-1]
+    weights = np.clip(days_to_end[None, :-1] / np.maximum(held_days, 1)[:, None], 0.0, 1.0)
+    capital = (flows * weights).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(capital > 0, (amounts[:, -1] - flows.sum(axis=1)) / capital, np.nan)
+
+
+# ==========================================
+#  RETORNOS DA CARTEIRA
+# ==========================================
+
+def compute_returns(
+        df_purchases: pd.DataFrame,
+        current_values: Dict[str, float],
+        value_matrix: Optional[pd.DataFrame],
+        cost_matrix: Optional[pd.DataFrame],
+        as_of: Optional[date] = None
+) -> Dict[str, Dict[str, Dict[str, Optional[float]]]]:
+    """
+    XIRR (ponderado pelo dinheiro) e TWR (ponderado pelo tempo) por ticker, por tipo e do total,
+    num único lote: os grupos são somas de linhas da mesma matriz de fluxos. Grupos com menos de
+    MIN_ANNUALIZED_DAYS desde o primeiro aporte recebem o retorno do período (Modified Dietz e TWR
+    acumulado), com 'annualized': False; os demais, as taxas anualizadas.
+
+    `current_values` é o valor atual de cada ticker (o mesmo usado no resumo do dashboard).
+    `value_matrix`/`cost_matrix` são as matrizes data x ticker da série salva (get_history_frames);
+    com `as_of`, compras e matrizes são recortadas na data, sem recalcular nada.
+    Retorna {'by_ticker': {...}, 'by_type': {...}, 'total': {'xirr', 'twr', 'annualized', 'days'}}.
+    """
+    empty = {'by_ticker': {}, 'by_type': {}, 'total': {'xirr': None, 'twr': None, 'annualized': False, 'days': 0}}
+    end = pd.Timestamp(as_of or date.today())
+    if not df_purchases.empty:
+        df_purchases = df_purchases[df_purchases['trade_date'] <= end]
+    tickers = [t for t in current_values if t in set(df_purchases['ticker'])] if not df_purchases.empty else []
+    if not tickers:
+        return empty
+
+    df = df_purchases[df_purchases['ticker'].isin(tickers)]
+    type_of = df.groupby('ticker')['type'].first().reindex(tickers)
+    types = sorted(type_of.unique().tolist())
+
+    # Matriz de agregação grupos x tickers: cada ticker, cada tipo e o total
+    groups = tickers + [f"type:{t}" for t in types] + ["total"]
+    membership = np.vstack([
+        np.eye(len(tickers)),
+        np.array([(type_of == t).to_numpy(dtype=float) for t in types]),
+        np.ones((1, len(tickers))),
+    ])
+
+    # --- XIRR: fluxos por data (aportes negativos) + valor atual na data final ---
+    flows = df.pivot_table(index='ticker', columns='trade_date', values='cash_flow', aggfunc='sum') \
+        .reindex(index=tickers).fillna(0.0)
+    flow_dates = flows.columns
+    amounts = np.hstack([
+        -flows.to_numpy(dtype=float),
+        np.array([[current_values[t]] for t in tickers], dtype=float),
+    ])
+    days_to_end = np.append((end - flow_dates).days.to_numpy(dtype=float), 0.0)
+    group_amounts = membership @ amounts
+    # Dias desde o primeiro aporte de cada grupo
+    held_days = np.where(group_amounts[:, :-1] != 0, days_to_end[None, :-1], 0.0).max(axis=1)
+    annualized = held_days >= MIN_ANNUALIZED_DAYS
+    xirr = np.where(annualized, solve_xirr(group_amounts, days_to_end / 365.0),
+                    _modified_dietz(group_amounts, days_to_end, held_days))
+
+    # --- TWR: retornos diários das matrizes valor/investido por ticker, agregadas pelos mesmos grupos ---
+    twr = np.full(len(groups), np.nan)
+    if value_matrix is not None and not value_matrix.empty:
+        # Dias posteriores à data final não entram (dashboard com as_of)
+        value_matrix, cost_matrix = value_matrix.loc[:end], cost_matrix.loc[:end]
+    if value_matrix is not None and not value_matrix.empty:
+        index = value_matrix.index
+        values = value_matrix.reindex(columns=tickers, fill_value=0.0).to_numpy()
+        cost = cost_matrix.reindex(columns=tickers, fill_value=0.0).to_numpy()
+        daily_flows = np.diff(cost, axis=0, prepend=0.0)
+        group_values = values @ membership.T
+        group_flows = daily_flows @ membership.T
+
+        first_flow = (group_flows != 0).argmax(axis=0)
+        days = (end - index[first_flow]).days.to_numpy(dtype=float)
+        period_twr = _twr_from_values(group_values, group_flows)
+        twr = np.where(annualized, _annualize(period_twr, days), period_twr)
+
+    def pct(v) -> Optional[float]:
+        return round(float(v) * 100, 2) if np.isfinite(v) else None
+
+    stats = {g: {'xirr': pct(xirr[i]), 'twr': pct(twr[i]), 'annualized': bool(annualized[i]),
+                 'days': int(held_days[i])} for i, g in enumerate(groups)}
+    return {
+        'by_ticker': {t: stats[t] for t in tickers},
+        'by_type': {t: stats[f"type:{t}"] for t in types},
+        'total': stats['total'],
+    }
@@ -1,64 +1,91 @@
-from typing import List, Dict, Optional
+import hashlib
+import io
+import tempfile
+from typing import List, Dict, Optional, Literal
+import numpy as np
 import pandas as pd
 from datetime import datetime, date
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text, bindparam, tuple_
+from sqlalchemy import func, text, bindparam, select, and_, update, delete
 
 from backend.source.core.database import get_db
 from backend.source.features.auth.jwt_identity_extraction import get_current_user
-from backend.source.models.sql_models import AssetPurchase, CdiHistory, B3Price
+from backend.source.models.sql_models import AssetPurchase, B3Price, YearlyClose, WalletPosition, CdiHistory
 from backend.source.features.wallet.wallet_schema import (
     ImportPurchasesRequest,
     AssetPurchaseResponse,
     AssetPurchaseInput,
-    HistoryPoint
+    HistoryPoint,
+    WhatIfRequest,
+    ContributionPerformance,
+    BulkUpdatePurchasesRequest,
+    BulkDeletePurchasesRequest
+)
+from backend.source.features.wallet.wallet_history import (
+    get_history_frames, invalidate_history, shape_history, load_purchases_frame, compute_breakdown_series,
+    purchases_frame_from_rows, apply_purchase_deltas
+)
+from backend.source.features.wallet.wallet_benchmarks import (
+    parse_benchmarks, load_benchmark_levels, compound_benchmarks, benchmark_watermarks, MAX_BENCHMARKS
+)
+from backend.source.features.wallet.wallet_returns import compute_returns
+from backend.source.features.wallet.wallet_contributions import compute_contribution_performance
+from backend.source.features.wallet.wallet_pagination import (
+    filter_purchases, paginate_purchases, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+)
+from backend.source.features.wallet.wallet_import import (
+    import_purchase_stream, set_content_hashes, purchase_content_hash
+)
+from backend.source.features.wallet.wallet_positions import (
+    capture_adjusted_prices, rebuild_positions, load_positions, positions_as_of, apply_position_deltas,
+    lookup_adjusted_prices
 )
 
 wallet_bp = APIRouter(prefix="/wallet", tags=["Wallet"])
 
+DASHBOARD_SECTIONS = ("summary", "period_projections", "positions", "history", "transactions", "allocation")
+# Seções que dependem das posições e dos preços atuais (history e transactions não)
+POSITION_SECTIONS = ("summary", "period_projections", "positions", "allocation")
+MAX_WHAT_IF_PURCHASES = 200
+MAX_BULK_PURCHASES = 1000
+# Upload do import em streaming fica em memória até este tamanho; acima disso vai para disco
+IMPORT_SPOOL_BYTES = 1024 * 1024
+
 # ==========================================
 #  LÓGICA INTERNA (SERVICE) - AUXILIARES
 # ==========================================
 
-def _calculate_period_stats(profit: float, yield_pct: float, start_date: Optional[date]) -> Dict:
-    if not start_date:
-        return {
-            "total": {"profit": profit, "yield": yield_pct},
-            "day": {"profit": 0, "yield": 0},
-            "month": {"profit": 0, "yield": 0},
-            "year": {"profit": 0, "yield": 0}
-        }
-
-    today = datetime.now().date()
-    if isinstance(start_date, datetime):
-        start_date = start_date.date()
-
-    diff_days = (today - start_date).days
-    days = max(1, diff_days)
+def _calculate_period_stats(profit: float, yield_pct: float, current_value: float = 0.0,
+                            returns: Optional[Dict] = None) -> Dict:
+    # Projeções dia/mês/ano pela XIRR (considera quando cada aporte foi feito); sem XIRR, pelo TWR.
+    # Com menos de um ano (annualized False) a taxa é do período e não é extrapolada além dele.
+    returns = returns or {}
+    xirr = returns.get("xirr")
+    twr = returns.get("twr")
+    annualized = returns.get("annualized", True)
+    held_days = returns.get("days") or 0
+    stats = {
+        "total": {"profit": round(profit, 2), "yield": round(yield_pct, 2)},
+        "xirr": xirr,
+        "twr": twr,
+        "annualized": annualized,
+    }
 
-    avg_day_profit = profit / days
-    avg_day_yield = yield_pct / days
+    base = xirr if xirr is not None else twr
+    for period, days, digits in (("day", 1, 4), ("month", 30, 2), ("year", 365, 2)):
+        if base is None or (not annualized and held_days <= 0):
+            stats[period] = {"profit": 0, "yield": 0}
+            continue
+        if annualized:
+            rate = (1 + base / 100) ** (days / 365) - 1
+        else:
+            rate = (1 + base / 100) ** (min(days, held_days) / held_days) - 1
+        stats[period] = {"profit": round(current_value * rate, 2), "yield": round(rate * 100, digits)}
 
-    return {
-        "total": {
-            "profit": round(profit, 2),
-            "yield": round(yield_pct, 2)
-        },
-        "day": {
-            "profit": round(avg_day_profit, 2),
-            "yield": round(avg_day_yield, 4)
-        },
-        "month": {
-            "profit": round(avg_day_profit * 30, 2),
-            "yield": round(avg_day_yield * 30, 2)
-        },
-        "year": {
-            "profit": round(avg_day_profit * 365, 2),
-            "yield": round(avg_day_yield * 365, 2)
-        }
-    }
+    return stats
 
 def _format_asset_age(first_purchase_date) -> str:
     if not first_purchase_date:
@@ -80,214 +107,337 @@ def _format_asset_age(first_purchase_date) -> str:
     if days > 0 or (years == 0 and months == 0): parts.append(f"{days}d")
     return " ".join(parts)
 
-def _calculate_history_logic(user_id: str, db: Session) -> List[Dict]:
-    purchases = db.query(AssetPurchase.ticker, AssetPurchase.qty, AssetPurchase.price, AssetPurchase.trade_date) \
-        .filter(AssetPurchase.user_id == user_id).order_by(AssetPurchase.trade_date.asc()).all()
-    if not purchases: return []
-
-    df_purchases = pd.DataFrame(purchases, columns=['ticker', 'qty', 'price', 'trade_date'])
-    df_purchases['trade_date'] = pd.to_datetime(df_purchases['trade_date'])
-    df_purchases['price'] = df_purchases['price'].astype(float)
-    df_purchases['cash_flow'] = df_purchases['qty'] * df_purchases['price']
-
-    start_date = df_purchases['trade_date'].min()
-    unique_tickers = df_purchases['ticker'].unique().tolist()
-
-    prices_query = db.query(B3Price.ticker, B3Price.trade_date, B3Price.close) \
-        .filter(B3Price.ticker.in_(unique_tickers), B3Price.trade_date >= start_date).all()
-    cdi_query = db.query(CdiHistory.trade_date, CdiHistory.value) \
-        .filter(CdiHistory.trade_date >= start_date).all()
-
-    if not prices_query: return []
-
-    df_prices = pd.DataFrame(prices_query, columns=['ticker', 'trade_date', 'close'])
-    df_prices['trade_date'] = pd.to_datetime(df_prices['trade_date'])
-    df_prices['close'] = pd.to_numeric(df_prices['close'])
-
-    price_matrix = df_prices.pivot(index='trade_date', columns='ticker', values='close').resample('D').ffill()
-    holdings_matrix = pd.DataFrame(0.0, index=price_matrix.index, columns=unique_tickers)
-    daily_cash_flow = df_purchases.groupby('trade_date')['cash_flow'].sum()
-
-    for _, row in df_purchases.iterrows():
-        try:
-            holdings_matrix.loc[row['trade_date']:, row['ticker']] += row['qty']
-        except KeyError: pass
-
-    common_idx = price_matrix.index.intersection(holdings_matrix.index)
-    price_matrix = price_matrix.loc[common_idx]
-    holdings_matrix = holdings_matrix.loc[common_idx]
-    daily_portfolio = (holdings_matrix * price_matrix).sum(axis=1)
-
-    aligned_cash_flow = daily_cash_flow.reindex(common_idx, fill_value=0.0)
-    df_cdi = pd.DataFrame(cdi_query, columns=['trade_date', 'value'])
-    cdi_factors_vals = [1.0] * len(common_idx)
-    if not df_cdi.empty:
-        df_cdi['trade_date'] = pd.to_datetime(df_cdi['trade_date'])
-        df_cdi.set_index('trade_date', inplace=True)
-        aligned_cdi = df_cdi.reindex(common_idx).fillna(0.0)
-        cdi_factors_series = 1 + (aligned_cdi['value'] / 100.0)
-        cdi_factors_vals = cdi_factors_series.values
-
-    benchmark_values = []
-    curr_bench = 0.0
-    cash_flows_vals = aligned_cash_flow.values
-    limit = min(len(common_idx), len(cash_flows_vals), len(cdi_factors_vals))
-    for i in range(limit):
-        curr_bench = (curr_bench * cdi_factors_vals[i]) + cash_flows_vals[i]
-        benchmark_values.append(curr_bench)
-
-    return [{"trade_date": common_idx[i].strftime("%Y-%m-%d"),
-             "portfolio_value": round(float(daily_portfolio.iloc[i]), 2),
-             "benchmark_value": round(float(benchmark_values[i]), 2)} for i in range(limit)]
+def _refresh_derived_data(db: Session, user_id: str, tickers, from_date: date) -> None:
+    # Mantém as tabelas derivadas na mesma transação da alteração das compras (sem commit aqui)
+    db.flush()
+    invalidate_history(db, user_id, from_date)
+    rebuild_positions(db, user_id, tickers)
+
+def _wallet_etag(db: Session, user_id: str, scope: str, with_prices: bool = True, daily: bool = False,
+                 benchmarks: Optional[List[str]] = None) -> str:
+    """
+    Versão dos dados do usuário, calculada com consultas de agregação (sem pandas).
+    Toda escrita de compras reconstrói wallet_positions, então (count, max(updated_at)) muda a cada alteração.
+    Preços entram por último pregão e último upsert (inserted_at, gravado a cada /sync); com
+    `benchmarks`, entra também o último dado de cada benchmark pedido.
+    """
+    pos_count, pos_changed = db.query(func.count(WalletPosition.ticker), func.max(WalletPosition.updated_at)) \
+        .filter(WalletPosition.user_id == user_id).one()
+    parts = [scope, user_id, pos_count, pos_changed]
+
+    if with_prices:
+        user_tickers = select(WalletPosition.ticker).where(WalletPosition.user_id == user_id)
+        parts.extend(db.query(func.max(B3Price.trade_date), func.max(B3Price.inserted_at))
+                     .filter(B3Price.ticker.in_(user_tickers)).one())
+        parts.append(db.query(func.max(CdiHistory.trade_date)).scalar())
+
+    # Idade dos ativos e projeções diárias dependem da data de hoje
+    if daily:
+        parts.append(date.today())
+
+    if benchmarks:
+        parts.extend(benchmark_watermarks(db, benchmarks))
+
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def _not_modified_or_tag(response: Response, if_none_match: Optional[str], etag: str) -> Optional[Response]:
+    # Retorna um 304 pronto se o cliente já tem essa versão; senão marca a resposta com o ETag
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def _load_history_frames(
+        db: Session,
+        user_id: str,
+        df_purchases: Optional[pd.DataFrame] = None,
+        extra_purchases: Optional[pd.DataFrame] = None,
+        with_positions: bool = True
+) -> tuple:
+    """
+    Uma única carga para as seções que usam a série: (compras, série, valor por ticker, investido
+    por ticker). Série persistida em wallet_history, estendida só com os dias novos (ver
+    wallet_history.py); compras hipotéticas (what-if) entram uma vez, como delta sobre ela.
+    """
+    if df_purchases is None:
+        df_purchases = load_purchases_frame(db, user_id)
+    series, values, costs = get_history_frames(db, user_id, df_purchases, with_positions=with_positions)
+
+    if extra_purchases is not None and not extra_purchases.empty:
+        series, values, costs = apply_purchase_deltas(db, series, extra_purchases, values, costs)
+        df_purchases = pd.concat([df_purchases, extra_purchases], ignore_index=True)
+    return df_purchases, series, values, costs
+
+def _calculate_history_logic(
+        db: Session,
+        df_purchases: pd.DataFrame,
+        series: pd.DataFrame,
+        values: Optional[pd.DataFrame],
+        costs: Optional[pd.DataFrame],
+        benchmarks: Optional[List[str]] = None,
+        types: Optional[List[str]] = None,
+        tickers: Optional[List[str]] = None,
+        **shape
+) -> List[Dict]:
+    # Pontos da série já carregada (_load_history_frames)
+    # `shape` aceita start, end, resolution e max_points (ver shape_history)
+    # Recortes por tipo/ticker saem das matrizes por ticker salvas junto com a série
+    want_breakdown = types is not None or tickers is not None
+
+    bench_curves = None
+    if benchmarks and not series.empty:
+        # Todos os benchmarks numa passada, sobre o mesmo índice diário e os mesmos aportes
+        levels = load_benchmark_levels(db, benchmarks, series.index)
+        missing = [name for name in benchmarks if levels[name].isna().all()]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Benchmark sem dados: {', '.join(missing)}")
+        cash_flows = np.diff(series['invested_value'].to_numpy(dtype=float), prepend=0.0)
+        bench_curves = compound_benchmarks(levels, cash_flows)
+
+    breakdowns = {}
+    if want_breakdown and values is not None and not df_purchases.empty:
+        type_of = df_purchases.groupby('ticker')['type'].first()
+        breakdowns = compute_breakdown_series(values, costs, type_of, types, tickers)
+
+    series = shape_history(series, **shape)
+    if bench_curves is not None:
+        bench_curves = bench_curves.reindex(series.index)
+    breakdowns = {field: (values.reindex(series.index).fillna(0.0), invested.reindex(series.index).fillna(0.0))
+                  for field, (values, invested) in breakdowns.items()}
+
+    points = []
+    for i, (ts, r) in enumerate(zip(series.index, series.itertuples(index=False))):
+        point = {"trade_date": ts.strftime("%Y-%m-%d"),
+                 "portfolio_value": round(float(r.portfolio_value), 2),
+                 "invested_value": round(float(r.invested_value), 2),
+                 "benchmark_value": round(float(r.benchmark_value), 2)}
+        if bench_curves is not None:
+            point["benchmarks"] = {name: round(float(v), 2) for name, v in bench_curves.iloc[i].items()}
+        for field, (values, invested) in breakdowns.items():
+            point[field] = {key: {"value": round(float(values.iat[i, j]), 2),
+                                  "invested": round(float(invested.iat[i, j]), 2)}
+                            for j, key in enumerate(values.columns)}
+        points.append(point)
+    return points
+
+def _parse_group_param(raw: Optional[str], upper: bool) -> Optional[List[str]]:
+    # None: não calcular; "all": todos; "a,b": só os pedidos
+    if raw is None:
+        return None
+    keys = [k.strip() for k in raw.split(",") if k.strip()]
+    if not keys or [k.lower() for k in keys] == ["all"]:
+        return []
+    return list(dict.fromkeys(k.upper() if upper else k.lower() for k in keys))
 
 # Função auxiliar para calcular rentabilidade anual do ativo (ano fechado)
 def _get_yearly_prices(db: Session, tickers: List[str], start_year: int) -> Dict[str, Dict[int, float]]:
-    # 1. Estratégia: Pegar preços de Dezembro (após dia 20) de todos os anos relevantes
-    current_year = datetime.now().year
-
-    # Query SQL eficiente usando Window Function (PostgreSQL) ou filtragem simples
-    # Vamos usar filtragem simples para compatibilidade e simplicidade:
-    # Pegamos todas as cotações de Dezembro para os tickers alvo a partir do ano de início
-    sql = text("""
-               SELECT ticker, trade_date, adjusted_close
-               FROM b3_prices
-               WHERE ticker IN :tickers
-                 AND EXTRACT(YEAR FROM trade_date) >= :start_year
-                 AND EXTRACT(MONTH FROM trade_date) = 12
-                 AND EXTRACT(DAY FROM trade_date) > 20
-               ORDER BY trade_date ASC
-               """)
-
-    # Executa query
-    rows = db.execute(sql.bindparams(bindparam("tickers", expanding=True)),
-                      {"tickers": tickers, "start_year": start_year - 1}).fetchall()
-
-    # Processa para pegar apenas a ÚLTIMA data de cada ano para cada ticker
+    # Lê a tabela yearly_closes (último pregão de cada ano, mantida pelo /sync)
+    # Uma única busca pela PK (ticker, year), independente do tamanho do histórico.
+    # Busca desde o ano anterior ao início da carteira (base para a variação do primeiro ano)
+    rows = db.query(YearlyClose.ticker, YearlyClose.year, YearlyClose.adjusted_close) \
+        .filter(YearlyClose.ticker.in_(tickers), YearlyClose.year >= start_year - 1).all()
+
     # map: ticker -> { 2021: 15.50, 2022: 18.20 }
     yearly_closes = {}
 
     for r in rows:
-        tck = r.ticker
         if not r.adjusted_close: continue
-
-        y = r.trade_date.year
-        val = float(r.adjusted_close)
-
-        if tck not in yearly_closes: yearly_closes[tck] = {}
-        # Como ordenamos ASC, o último valor sobrescreve os anteriores, ficando o último de Dezembro
-        yearly_closes[tck][y] = val
+        yearly_closes.setdefault(r.ticker, {})[r.year] = float(r.adjusted_close)
 
     return yearly_closes
 
+def _get_latest_prices(db: Session, tickers: List[str], as_of: Optional[date] = None):
+    # Último pregão de cada ticker (até as_of) via MAX(trade_date) por ticker (usa o índice único ticker+trade_date)
+    last_dates = db.query(B3Price.ticker, func.max(B3Price.trade_date).label("trade_date")) \
+        .filter(B3Price.ticker.in_(tickers))
+    if as_of:
+        last_dates = last_dates.filter(B3Price.trade_date <= as_of)
+    last_dates = last_dates.group_by(B3Price.ticker).subquery()
+    rows = db.query(B3Price.ticker, B3Price.close, B3Price.adjusted_close, B3Price.name) \
+        .join(last_dates, and_(B3Price.ticker == last_dates.c.ticker,
+                               B3Price.trade_date == last_dates.c.trade_date)).all()
+
+    price_map_raw, price_map_adj, name_map = {}, {}, {}
+    for row in rows:
+        raw_val = float(row.close)
+        adj_val = float(row.adjusted_close) if row.adjusted_close and row.adjusted_close > 0 else raw_val
+        price_map_raw[row.ticker] = raw_val
+        price_map_adj[row.ticker] = adj_val
+        name_map[row.ticker] = row.name
+
+    return price_map_raw, price_map_adj, name_map
+
+def _build_yearly_breakdown(ticker_yearly_closes: Dict[int, float], curr_price_adj: float,
+                            current_year: int, start_year_portfolio: int) -> List[Dict]:
+    # Performance ano a ano: o "Start Date" de cada ano é o fechamento do ano anterior.
+    # O preço atual entra como fechamento do ano corrente (YTD).
+    closes = {**{y: c for y, c in ticker_yearly_closes.items() if y < current_year}, current_year: curr_price_adj}
+    sorted_years = sorted(closes.keys())
+
+    yearly_breakdown = []
+    for prev_year, curr_loop_year in zip(sorted_years, sorted_years[1:]):
+        # Só calculamos se o ano estiver dentro do horizonte da carteira (ou 1 antes pra base)
+        if curr_loop_year < start_year_portfolio:
+            continue
+
+        v_start = closes[prev_year]
+        v_end = closes[curr_loop_year]
+
+        if v_start > 0:
+            y_perf = ((v_end - v_start) / v_start) * 100
+            yearly_breakdown.append({
+                "year": curr_loop_year,
+                "value": round(y_perf, 2),
+                "start_price": v_start,
+                "end_price": v_end
+            })
+
+    return yearly_breakdown
+
+def _format_transactions(purchases) -> List[Dict]:
+    return [{
+        "ticker": p.ticker, "price": float(p.price), "qty": p.qty,
+        "trade_date": p.trade_date, "type": "buy", "asset_type": p.type
+    } for p in purchases]
+
+def _transactions_query(db: Session, user_id: str):
+    return db.query(AssetPurchase.id, AssetPurchase.ticker, AssetPurchase.price, AssetPurchase.qty,
+                    AssetPurchase.trade_date, AssetPurchase.type) \
+        .filter(AssetPurchase.user_id == user_id)
+
+def _get_transactions(db: Session, user_id: str, as_of: Optional[date] = None,
+                      limit: Optional[int] = None) -> tuple:
+    # (transações, cursor da próxima página); sem limit, a lista inteira
+    query = _transactions_query(db, user_id)
+    if as_of:
+        query = query.filter(AssetPurchase.trade_date <= as_of)
+    if limit:
+        purchases, next_cursor = paginate_purchases(query, limit)
+        return _format_transactions(purchases), next_cursor
+    return _format_transactions(query.all()), None
+
+def _parse_sections(include: Optional[str]) -> tuple:
+    if not include:
+        return DASHBOARD_SECTIONS
+    sections = tuple(dict.fromkeys(part.strip() for part in include.split(",") if part.strip()))
+    invalid = [sec for sec in sections if sec not in DASHBOARD_SECTIONS]
+    if invalid:
+        raise HTTPException(status_code=400,
+                            detail=f"Seções inválidas: {', '.join(invalid)}. Use: {', '.join(DASHBOARD_SECTIONS)}")
+    return sections
+
 # ==========================================
 #  DASHBOARD COMPLETO (RAW + ADJUSTED)
 # ==========================================
 
 @wallet_bp.get("/dashboard")
 def get_dashboard_data(
+        response: Response,
+        include: Optional[str] = None,
+        as_of: Optional[date] = None,
+        transactions_limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        if_none_match: Optional[str] = Header(None),
         db: Session = Depends(get_db),
         current_user: str = Depends(get_current_user)
 ):
-    # 1. Buscar todas as compras
-    purchases = db.query(AssetPurchase).filter(AssetPurchase.user_id == current_user).all()
+    """
+    Dashboard da carteira. `include` (ex.: "summary,allocation") limita as seções calculadas;
+    sem ele, todas são retornadas. `as_of` (YYYY-MM-DD) devolve a carteira como estava naquela data.
+    `transactions_limit` traz só as N transações mais recentes; as seguintes saem de /transactions
+    com o cursor do header X-Next-Cursor.
+    """
+    sections = _parse_sections(include)
+    if as_of and as_of >= datetime.now().date():
+        as_of = None
+
+    scope = "dashboard:" + ",".join(sections) + (f":{as_of}" if as_of else "") + f":{transactions_limit}"
+    # Uma data passada não muda com o dia; só com novos dados
+    not_modified = _not_modified_or_tag(response, if_none_match,
+                                        _wallet_etag(db, current_user, scope, daily=as_of is None))
+    if not_modified:
+        return not_modified
+
+    result = _build_dashboard(db, current_user, sections, as_of, transactions_limit=transactions_limit)
+    next_cursor = result.pop("_transactions_cursor", None)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return result
+
+def _build_dashboard(db: Session, current_user: str, sections=DASHBOARD_SECTIONS,
+                     as_of: Optional[date] = None, extra_purchases: Optional[pd.DataFrame] = None,
+                     transactions_limit: Optional[int] = None) -> Dict:
+    # Seções não pedidas não são consultadas nem calculadas
+    want_positions = "positions" in sections
+    want_values = any(sec in sections for sec in POSITION_SECTIONS)
+    has_extra = extra_purchases is not None and not extra_purchases.empty
+
+    # 1. Posições consolidadas (wallet_positions, mantida pelos endpoints de compras).
+    #    Com as_of, a posição sai dos acumulados de todas as compras (busca binária da data).
+    df_saved = None
+    pos_map = {}
+    if want_values:
+        if as_of:
+            df_saved = load_purchases_frame(db, current_user)
+            pos_map = positions_as_of(df_saved, as_of)
+        else:
+            pos_map = load_positions(db, current_user)
+
+        # What-if: compras hipotéticas somadas em memória, sem gravar em asset_purchases
+        if has_extra:
+            pos_map = apply_position_deltas(pos_map, extra_purchases)
 
     # Estrutura vazia
     empty_response = {
         "summary": {"total_invested": 0, "total_current": 0, "total_profit": 0, "total_profit_percent": 0},
-        "period_projections": {k: _calculate_period_stats(0, 0, None) for k in ["total", "stock", "fii", "etf"]},
+        "period_projections": {k: _calculate_period_stats(0, 0) for k in ["total", "stock", "fii", "etf"]},
         "positions": [], "history": [], "transactions": [], "allocation": {"stock": 0, "fii": 0, "etf": 0}
     }
+    empty_response = {k: v for k, v in empty_response.items() if k in sections}
 
-    if not purchases:
-        return empty_response
-
-    # Identificar Data Inicial Global da Carteira para buscar histórico anual
-    min_trade_date = min([p.trade_date for p in purchases])
-    start_year_portfolio = min_trade_date.year if isinstance(min_trade_date, date) else min_trade_date.year
-
-    # 2. Buscar Histórico de Preços Ajustados (Para cálculo de Total Return da posição)
-    purchase_keys = list({(p.ticker, p.trade_date) for p in purchases})
-    history_map = {}
-
-    if purchase_keys:
-        try:
-            hist_rows = db.query(B3Price.ticker, B3Price.trade_date, B3Price.adjusted_close) \
-                .filter(tuple_(B3Price.ticker, B3Price.trade_date).in_(purchase_keys)).all()
-
-            for r in hist_rows:
-                key = f"{r.ticker}_{r.trade_date}"
-                history_map[key] = float(r.adjusted_close) if r.adjusted_close else None
-        except Exception as e:
-            print(f"⚠️ Erro ao buscar histórico ajustado: {e}")
-
-    # 3. Consolidar Posições
-    pos_map = {}
-    transactions_list = []
-
-    for p in purchases:
-        # Adiciona à lista de transações
-        transactions_list.append({
-            "ticker": p.ticker, "price": float(p.price), "qty": p.qty,
-            "trade_date": p.trade_date, "type": "buy", "asset_type": p.type
-        })
-
-        price_raw = float(p.price)
-        hist_key = f"{p.ticker}_{p.trade_date}"
-        price_adj = history_map.get(hist_key, price_raw)
-        if not price_adj or price_adj <= 0: price_adj = price_raw
-
-        if p.ticker not in pos_map:
-            pos_map[p.ticker] = {
-                'qty': 0.0,
-                'cost_raw': 0.0,
-                'cost_adjusted': 0.0,
-                'type': p.type,
-                'min_date': p.trade_date
-            }
+    active_tickers = []
+    price_map_raw, price_map_adj, name_map = {}, {}, {}
+    start_year_portfolio = None
+    if want_values:
+        if not pos_map:
+            return empty_response
 
-        pos = pos_map[p.ticker]
-        pos['qty'] += p.qty
-        pos['cost_raw'] += (p.qty * price_raw)
-        pos['cost_adjusted'] += (p.qty * price_adj)
-        if p.trade_date < pos['min_date']:
-            pos['min_date'] = p.trade_date
+        # Identificar Data Inicial Global da Carteira para buscar histórico anual
+        min_trade_date = min(d['min_date'] for d in pos_map.values())
+        start_year_portfolio = min_trade_date.year
 
-    active_tickers = [t for t, d in pos_map.items() if d['qty'] > 0.0001]
+        active_tickers = [t for t, d in pos_map.items() if d['qty'] > 0.0001]
 
-    if not active_tickers:
-        return empty_response
+        if not active_tickers:
+            return empty_response
 
-    # 4. Buscar Preços Atuais (Raw e Adjusted)
-    latest_prices = db.query(B3Price.ticker, B3Price.close, B3Price.adjusted_close, B3Price.name) \
-        .filter(B3Price.ticker.in_(active_tickers)) \
-        .order_by(B3Price.trade_date.desc()).all()
+        # 2. Buscar Preços Atuais (Raw e Adjusted)
+        price_map_raw, price_map_adj, name_map = _get_latest_prices(db, active_tickers, as_of)
 
-    price_map_raw = {}
-    price_map_adj = {}
-    name_map = {}
+    classification_map = {}
+    yearly_closes_map = {}
+    current_year = (as_of or datetime.now()).year
 
-    for row in latest_prices:
-        if row.ticker not in price_map_raw:
-            raw_val = float(row.close)
-            adj_val = float(row.adjusted_close) if row.adjusted_close and row.adjusted_close > 0 else raw_val
-            price_map_raw[row.ticker] = raw_val
-            price_map_adj[row.ticker] = adj_val
-            name_map[row.ticker] = row.name
+    if want_positions:
+        # 2.1 Buscar Classificações
+        try:
+            stmt = text("SELECT ticker, detected_type, sector FROM asset_classification_cache WHERE ticker IN :tickers")
+            stmt = stmt.bindparams(bindparam("tickers", expanding=True))
+            cls_rows = db.execute(stmt, {"tickers": active_tickers}).fetchall()
+            for r in cls_rows:
+                classification_map[r.ticker] = {"subtype": r.detected_type, "sector": r.sector}
+        except Exception: pass
 
-    # 4.1 Buscar Classificações
-    classification_map = {}
-    try:
-        stmt = text("SELECT ticker, detected_type, sector FROM asset_classification_cache WHERE ticker IN :tickers")
-        stmt = stmt.bindparams(bindparam("tickers", expanding=True))
-        cls_rows = db.execute(stmt, {"tickers": active_tickers}).fetchall()
-        for r in cls_rows:
-            classification_map[r.ticker] = {"subtype": r.detected_type, "sector": r.sector}
-    except Exception: pass
-
-    # --- NOVO: BUSCAR PREÇOS ANUAIS (FECHAMENTO DE DEZEMBRO) PARA TOOLTIP ---
-    # Busca desde o ano anterior ao início da carteira (para calcular a variação do primeiro ano)
-    yearly_closes_map = _get_yearly_prices(db, active_tickers, start_year_portfolio)
-    current_year = datetime.now().year
+        # --- BUSCAR PREÇOS ANUAIS (TABELA yearly_closes) PARA TOOLTIP ---
+        # Busca desde o ano anterior ao início da carteira (para calcular a variação do primeiro ano)
+        yearly_closes_map = _get_yearly_prices(db, active_tickers, start_year_portfolio)
 
     # 5. Montar Lista Final e Totais
     positions_list = []
@@ -296,7 +446,8 @@ def get_dashboard_data(
     total_current_global = 0.0
     allocation_by_type = {"stock": 0.0, "fii": 0.0, "etf": 0.0}
 
-    cat_stats = {k: {'invested': 0.0, 'current': 0.0, 'start_date': None} for k in ['stock', 'fii', 'etf']}
+    cat_stats = {k: {'invested': 0.0, 'current': 0.0} for k in ['stock', 'fii', 'etf']}
+    current_values = {}
 
     for ticker in active_tickers:
         data = pos_map[ticker]
@@ -321,6 +472,7 @@ def get_dashboard_data(
 
         total_invested_global += data['cost_raw']
         total_current_global += val_total_raw
+        current_values[ticker] = val_total_raw
 
         atype = data['type']
         allocation_by_type[atype] = allocation_by_type.get(atype, 0) + val_total_raw
@@ -328,42 +480,13 @@ def get_dashboard_data(
         if atype in cat_stats:
             cat_stats[atype]['invested'] += data['cost_raw']
             cat_stats[atype]['current'] += val_total_raw
-            if not cat_stats[atype]['start_date'] or data['min_date'] < cat_stats[atype]['start_date']:
-                cat_stats[atype]['start_date'] = data['min_date']
-
-        # --- CALCULA BREAKDOWN ANUAL DO ATIVO ---
-        yearly_breakdown = []
-        ticker_yearly_closes = yearly_closes_map.get(ticker, {})
-
-        # Se temos dados anuais, calculamos a performance ano a ano
-        # Começamos do ano de início da carteira até o ano atual
-        # O "Start Date" do cálculo de um ano é o fechamento do ano anterior.
-
-        # Considerar preço atual como fechamento do ano corrente (YTD)
-        # Adiciona o ano corrente no mapa temporariamente para o calculo
-        ticker_yearly_closes[current_year] = curr_price_adj
-
-        sorted_years = sorted(ticker_yearly_closes.keys())
-
-        for i in range(1, len(sorted_years)):
-            prev_year = sorted_years[i-1]
-            curr_loop_year = sorted_years[i]
-
-            # Só calculamos se o ano estiver dentro do horizonte da carteira (ou 1 antes pra base)
-            if curr_loop_year < start_year_portfolio:
-                continue
 
-            v_start = ticker_yearly_closes[prev_year]
-            v_end = ticker_yearly_closes[curr_loop_year]
+        if not want_positions:
+            continue
 
-            if v_start > 0:
-                y_perf = ((v_end - v_start) / v_start) * 100
-                yearly_breakdown.append({
-                    "year": curr_loop_year,
-                    "value": round(y_perf, 2),
-                    "start_price": v_start,
-                    "end_price": v_end
-                })
+        yearly_breakdown = _build_yearly_breakdown(
+            yearly_closes_map.get(ticker, {}), curr_price_adj, current_year, start_year_portfolio
+        )
 
         cls = classification_map.get(ticker, {})
 
@@ -398,25 +521,39 @@ def get_dashboard_data(
     # 6. Finalização
     positions_list.sort(key=lambda x: x['total_value'], reverse=True)
 
+    # Compras e série carregadas uma vez para os retornos e o histórico
+    want_returns = want_positions or "period_projections" in sections
+    frames = None
+    if want_returns or "history" in sections:
+        frames = _load_history_frames(db, current_user, df_saved, extra_purchases, with_positions=want_returns)
+
+    # XIRR/TWR de todas as posições, tipos e do total num único lote, sobre a série salva por ticker
+    # (com as_of, recortada na data)
+    returns = {'by_ticker': {}, 'by_type': {}, 'total': {}}
+    if want_returns:
+        df_purchases, _, values, costs = frames
+        returns = compute_returns(df_purchases, current_values, values, costs, as_of)
+
     for p in positions_list:
         if total_current_global > 0:
             p['allocation_percent'] = round((p['total_value'] / total_current_global) * 100, 2)
+        p.update(returns['by_ticker'].get(p['ticker'], {"xirr": None, "twr": None}))
 
     total_profit_global = total_current_global - total_invested_global
     total_profit_pct_global = (total_profit_global / total_invested_global * 100) if total_invested_global > 0 else 0
 
-    start_date_global = min([p['min_date'] for p in pos_map.values()]) if pos_map else None
-
     projections = {
-        "total": _calculate_period_stats(total_profit_global, total_profit_pct_global, start_date_global)
+        "total": _calculate_period_stats(total_profit_global, total_profit_pct_global,
+                                         total_current_global, returns['total'])
     }
 
     for cat, stats in cat_stats.items():
         c_profit = stats['current'] - stats['invested']
         c_yield = (c_profit / stats['invested'] * 100) if stats['invested'] > 0 else 0
-        projections[cat] = _calculate_period_stats(c_profit, c_yield, stats['start_date'])
+        projections[cat] = _calculate_period_stats(c_profit, c_yield, stats['current'],
+                                                   returns['by_type'].get(cat))
 
-    return {
+    result = {
         "summary": {
             "total_invested": round(total_invested_global, 2),
             "total_current": round(total_current_global, 2),
@@ -425,18 +562,95 @@ def get_dashboard_data(
         },
         "period_projections": projections,
         "positions": positions_list,
-        "history": _calculate_history_logic(current_user, db),
-        "transactions": transactions_list,
         "allocation": {k: round(v, 2) for k, v in allocation_by_type.items()}
     }
+    if "history" in sections:
+        result["history"] = _calculate_history_logic(db, *frames, end=as_of)
+    if "transactions" in sections:
+        result["transactions"], next_cursor = _get_transactions(db, current_user, as_of, transactions_limit)
+        if has_extra:
+            result["transactions"] += [{
+                "ticker": r.ticker, "price": r.price, "qty": r.qty, "trade_date": r.trade_date.date(),
+                "type": "buy", "asset_type": r.type, "hypothetical": True
+            } for r in extra_purchases.itertuples()]
+
+    output = {k: result[k] for k in DASHBOARD_SECTIONS if k in sections}
+    if "transactions" in sections and next_cursor:
+        output["_transactions_cursor"] = next_cursor
+    return output
+
+@wallet_bp.post("/what-if")
+def simulate_purchases(
+        payload: WhatIfRequest,
+        db: Session = Depends(get_db),
+        current_user: str = Depends(get_current_user)
+):
+    """
+    Dashboard como ficaria com as compras hipotéticas do payload. As compras são aplicadas
+    em memória sobre as posições e a série salvas; nada é gravado.
+    """
+    sections = _parse_sections(",".join(payload.include)) if payload.include else DASHBOARD_SECTIONS
+    if len(payload.purchases) > MAX_WHAT_IF_PURCHASES:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_WHAT_IF_PURCHASES} compras por simulação")
+
+    rows = [{"ticker": p.ticker.upper(), "type": p.type.lower(), "qty": p.qty,
+             "price": p.price, "trade_date": p.trade_date} for p in payload.purchases]
+    adjusted = lookup_adjusted_prices(db, [(r["ticker"], r["trade_date"]) for r in rows])
+    extra = purchases_frame_from_rows(rows, adjusted)
+
+    return _build_dashboard(db, current_user, sections, extra_purchases=extra)
+
+@wallet_bp.get("/contributions/performance", response_model=List[ContributionPerformance])
+def get_contributions_performance(
+        response: Response,
+        if_none_match: Optional[str] = Header(None),
+        db: Session = Depends(get_db),
+        current_user: str = Depends(get_current_user)
+):
+    """Para cada aporte: valor atual, retorno bruto e ajustado e o CDI no mesmo período."""
+    not_modified = _not_modified_or_tag(response, if_none_match, _wallet_etag(db, current_user, "contributions"))
+    if not_modified:
+        return not_modified
+
+    return compute_contribution_performance(db, current_user)
 
 # --- OUTROS ENDPOINTS (CRUD) PERMANECEM IGUAIS ---
-@wallet_bp.get("/performance/history", response_model=List[HistoryPoint])
+@wallet_bp.get("/performance/history", response_model=List[HistoryPoint], response_model_exclude_none=True)
 def get_wallet_history(
+        response: Response,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        resolution: Literal["daily", "weekly", "monthly"] = "daily",
+        max_points: Optional[int] = Query(None, ge=3),
+        benchmarks: Optional[str] = None,
+        types: Optional[str] = None,
+        tickers: Optional[str] = None,
+        if_none_match: Optional[str] = Header(None),
         db: Session = Depends(get_db),
         current_user: str = Depends(get_current_user)
 ):
-    return _calculate_history_logic(current_user, db)
+    """
+    Série diária da carteira. `start`/`end` recortam o período, `resolution` agrega por
+    semana/mês e `max_points` aplica downsampling LTTB (primeiro e último ponto exatos).
+    `benchmarks` (ex.: "cdi,ifix,ibov,ipca,IVVB11") adiciona a curva dos aportes em cada benchmark.
+    `types` (ex.: "fii,stock" ou "all") e `tickers` (ex.: "HGLG11" ou "all") adicionam
+    valor/investido por tipo e por ativo.
+    """
+    bench_list = parse_benchmarks(benchmarks) if benchmarks else []
+    if len(bench_list) > MAX_BENCHMARKS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BENCHMARKS} benchmarks por requisição")
+    type_list = _parse_group_param(types, upper=False)
+    ticker_list = _parse_group_param(tickers, upper=True)
+
+    scope = f"history:{start}:{end}:{resolution}:{max_points}:{','.join(bench_list)}:{type_list}:{ticker_list}"
+    not_modified = _not_modified_or_tag(response, if_none_match,
+                                        _wallet_etag(db, current_user, scope, benchmarks=bench_list))
+    if not_modified:
+        return not_modified
+
+    frames = _load_history_frames(db, current_user, with_positions=type_list is not None or ticker_list is not None)
+    return _calculate_history_logic(db, *frames, benchmarks=bench_list, types=type_list, tickers=ticker_list,
+                                    start=start, end=end, resolution=resolution, max_points=max_points)
 
 @wallet_bp.post("/import")
 def import_purchases(
@@ -458,21 +672,124 @@ def import_purchases(
             )
             new_records.append(record)
         if new_records:
+            capture_adjusted_prices(db, new_records)
+            set_content_hashes(new_records)
             db.add_all(new_records)
+            _refresh_derived_data(db, current_user, {r.ticker for r in new_records},
+                                  min(r.trade_date for r in new_records))
             db.commit()
         return {"success": True, "count": len(new_records), "message": "Import successful"}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _import_stream_sync(db: Session, user_id: str, stream: io.TextIOBase, fmt: str) -> Dict:
+    try:
+        stats = import_purchase_stream(db, user_id, stream, fmt)
+        if stats["inserted"]:
+            _refresh_derived_data(db, user_id, stats["tickers"], stats["min_date"])
+        db.commit()
+    except UnicodeDecodeError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Arquivo precisa estar em UTF-8")
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "success": True,
+        "count": stats["inserted"],
+        "duplicates": stats["duplicates"],
+        "skipped": stats["skipped"],
+        "errors": stats["errors"],
+        "message": "Import successful"
+    }
+
+@wallet_bp.post("/import/stream")
+async def import_purchases_stream(
+        request: Request,
+        fmt: Optional[Literal["csv", "jsonl"]] = Query(None, alias="format"),
+        db: Session = Depends(get_db),
+        current_user: str = Depends(get_current_user)
+):
+    """
+    Importação de arquivo grande enviado como corpo da requisição (text/csv ou application/x-ndjson,
+    ou ?format=csv|jsonl). Aceita a exportação de negociações do portal do investidor B3.
+    Linhas repetidas de importações anteriores são ignoradas (hash de conteúdo); tudo numa transação.
+    """
+    if fmt is None:
+        fmt = "jsonl" if "json" in request.headers.get("content-type", "") else "csv"
+
+    # O corpo vai para um arquivo temporário em vez de um bytes inteiro em memória
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        stream = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        try:
+            return await run_in_threadpool(_import_stream_sync, db, current_user, stream, fmt)
+        finally:
+            stream.detach()
+
 @wallet_bp.get("/purchases", response_model=List[AssetPurchaseResponse])
 def get_user_purchases(
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        ticker: Optional[str] = None,
+        type: Optional[str] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        if_none_match: Optional[str] = Header(None),
         db: Session = Depends(get_db),
         current_user: str = Depends(get_current_user)
 ):
-    purchases = db.query(AssetPurchase).filter(AssetPurchase.user_id == current_user).all()
+    """
+    Aportes do usuário. Com `limit`/`cursor`, pagina do mais recente para o mais antigo
+    (próximo cursor no header X-Next-Cursor). `ticker`/`type` aceitam listas separadas por vírgula.
+    """
+    scope = f"purchases:{limit}:{cursor}:{ticker}:{type}:{start}:{end}"
+    not_modified = _not_modified_or_tag(response, if_none_match,
+                                        _wallet_etag(db, current_user, scope, with_prices=False))
+    if not_modified:
+        return not_modified
+
+    query = filter_purchases(db.query(AssetPurchase).filter(AssetPurchase.user_id == current_user),
+                             ticker, type, start, end)
+    if not (limit or cursor):
+        return query.all()
+
+    purchases, next_cursor = paginate_purchases(query, limit or DEFAULT_PAGE_SIZE, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return purchases
 
+@wallet_bp.get("/transactions")
+def get_transactions(
+        response: Response,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        ticker: Optional[str] = None,
+        type: Optional[str] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        if_none_match: Optional[str] = Header(None),
+        db: Session = Depends(get_db),
+        current_user: str = Depends(get_current_user)
+):
+    """Transações no formato do dashboard, paginadas por cursor (header X-Next-Cursor)."""
+    scope = f"transactions:{limit}:{cursor}:{ticker}:{type}:{start}:{end}"
+    not_modified = _not_modified_or_tag(response, if_none_match,
+                                        _wallet_etag(db, current_user, scope, with_prices=False))
+    if not_modified:
+        return not_modified
+
+    query = filter_purchases(_transactions_query(db, current_user), ticker, type, start, end)
+    purchases, next_cursor = paginate_purchases(query, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return _format_transactions(purchases)
+
 @wallet_bp.post("/purchases", response_model=AssetPurchaseResponse, status_code=status.HTTP_201_CREATED)
 def create_purchase(
         payload: AssetPurchaseInput,
@@ -489,7 +806,10 @@ def create_purchase(
             price=payload.price,
             trade_date=payload.trade_date
         )
+        capture_adjusted_prices(db, [new_purchase])
+        set_content_hashes([new_purchase])
         db.add(new_purchase)
+        _refresh_derived_data(db, current_user, {new_purchase.ticker}, new_purchase.trade_date)
         db.commit()
         db.refresh(new_purchase)
         return new_purchase
@@ -497,6 +817,93 @@ def create_purchase(
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _load_owned_purchases(db: Session, user_id: str, ids: List[int]) -> Dict[int, AssetPurchase]:
+    # Posse de todo o conjunto verificada numa consulta; 404/403 antes de qualquer alteração
+    if len(ids) > MAX_BULK_PURCHASES:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BULK_PURCHASES} aportes por requisição")
+
+    rows = {p.id: p for p in db.query(AssetPurchase).filter(AssetPurchase.id.in_(ids)).all()}
+    missing = [i for i in ids if i not in rows]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Aportes não encontrados: {missing}")
+    if any(p.user_id != user_id for p in rows.values()):
+        raise HTTPException(status_code=403, detail="Não autorizado a alterar estes registros")
+    return rows
+
+# Rotas /purchases/bulk antes de /purchases/{purchase_id}, senão "bulk" cai no parâmetro
+@wallet_bp.patch("/purchases/bulk", response_model=List[AssetPurchaseResponse])
+def bulk_update_purchases(
+        payload: BulkUpdatePurchasesRequest,
+        db: Session = Depends(get_db),
+        current_user: str = Depends(get_current_user)
+):
+    """Altera vários aportes numa transação: um UPDATE em lote e uma única atualização dos derivados."""
+    ids = [p.id for p in payload.purchases]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="IDs repetidos na requisição")
+    if not ids:
+        return []
+
+    current = _load_owned_purchases(db, current_user, ids)
+    try:
+        rows, tickers, dates = [], set(), []
+        for patch in payload.purchases:
+            old = current[patch.id]
+            changes = patch.model_dump(exclude_unset=True, exclude={"id"})
+            row = {
+                "id": old.id,
+                "ticker": (changes.get("ticker") or old.ticker).upper(),
+                "type": (changes.get("type") or old.type).lower(),
+                "qty": changes.get("qty", old.qty),
+                "price": changes.get("price", old.price),
+                "trade_date": changes.get("trade_date") or old.trade_date,
+            }
+            row["name"] = changes.get("name") or (row["ticker"] if "ticker" in changes else old.name)
+            row["content_hash"] = purchase_content_hash(row["ticker"], row["type"], row["trade_date"],
+                                                        row["qty"], row["price"])
+            rows.append(row)
+            tickers.update({old.ticker, row["ticker"]})
+            dates += [old.trade_date, row["trade_date"]]
+
+        adjusted = lookup_adjusted_prices(db, [(r["ticker"], r["trade_date"]) for r in rows])
+        for r in rows:
+            r["price_adjusted"] = adjusted.get((r["ticker"], r["trade_date"]), float(r["price"]))
+
+        # UPDATE ... WHERE id = :id em executemany (bulk update por chave primária do SQLAlchemy 2)
+        db.execute(update(AssetPurchase), rows)
+        _refresh_derived_data(db, current_user, tickers, min(dates))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    db.expire_all()
+    return db.query(AssetPurchase).filter(AssetPurchase.id.in_(ids)).order_by(AssetPurchase.id).all()
+
+@wallet_bp.delete("/purchases/bulk")
+def bulk_delete_purchases(
+        payload: BulkDeletePurchasesRequest,
+        db: Session = Depends(get_db),
+        current_user: str = Depends(get_current_user)
+):
+    """Remove vários aportes com um único DELETE e uma única atualização dos derivados."""
+    ids = list(dict.fromkeys(payload.ids))
+    if not ids:
+        return {"success": True, "count": 0}
+
+    current = _load_owned_purchases(db, current_user, ids)
+    try:
+        db.execute(delete(AssetPurchase)
+                   .where(AssetPurchase.user_id == current_user, AssetPurchase.id.in_(ids))
+                   .execution_options(synchronize_session=False))
+        _refresh_derived_data(db, current_user, {p.ticker for p in current.values()},
+                              min(p.trade_date for p in current.values()))
+        db.commit()
+        return {"success": True, "count": len(ids)}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @wallet_bp.put("/purchases/{purchase_id}", response_model=AssetPurchaseResponse)
 def update_purchase(
         purchase_id: int,
@@ -510,12 +917,16 @@ def update_purchase(
     if purchase.user_id != current_user:
         raise HTTPException(status_code=403, detail="Não autorizado a alterar este registro")
     try:
+        old_ticker, old_date = purchase.ticker, purchase.trade_date
         purchase.ticker = payload.ticker.upper()
         purchase.name = payload.name or payload.ticker.upper()
         purchase.type = payload.type.lower()
         purchase.qty = payload.qty
         purchase.price = payload.price
         purchase.trade_date = payload.trade_date
+        capture_adjusted_prices(db, [purchase])
+        set_content_hashes([purchase])
+        _refresh_derived_data(db, current_user, {old_ticker, purchase.ticker}, min(old_date, purchase.trade_date))
         db.commit()
         db.refresh(purchase)
         return purchase
@@ -536,6 +947,7 @@ def delete_purchase(
         raise HTTPException(status_code=403, detail="Não autorizado a deletar este registro")
     try:
         db.delete(purchase)
+        _refresh_derived_data(db, current_user, {purchase.ticker}, purchase.trade_date)
         db.commit()
         return None
     except Exception as e:
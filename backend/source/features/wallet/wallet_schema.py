@@ -24,15 +24,63 @@ class AssetPurchaseInput(AssetPurchaseBase):
 class ImportPurchasesRequest(BaseModel):
     purchases: List[AssetPurchaseCreate]
 
+# Alteração parcial de um aporte no PATCH em lote (campos omitidos ficam como estão)
+class AssetPurchasePatch(BaseModel):
+    id: int
+    ticker: Optional[str] = None
+    name: Optional[str] = None
+    type: Optional[str] = None
+    qty: Optional[float] = None
+    price: Optional[float] = None
+    trade_date: Optional[date] = None
+
+class BulkUpdatePurchasesRequest(BaseModel):
+    purchases: List[AssetPurchasePatch]
+
+class BulkDeletePurchasesRequest(BaseModel):
+    ids: List[int]
+
+# Simulação de compras sem gravar (POST /wallet/what-if)
+class WhatIfRequest(BaseModel):
+    purchases: List[AssetPurchaseCreate]
+    include: Optional[List[str]] = None
+
 # Resposta para o frontend
 class AssetPurchaseResponse(AssetPurchaseBase):
     id: int
     model_config = ConfigDict(from_attributes=True)
 
+class GroupValue(BaseModel):
+    value: float
+    invested: float
+
 class HistoryPoint(BaseModel):
     trade_date: str
     portfolio_value: float
+    invested_value: float = 0.0
     benchmark_value: float
+    # Curvas pedidas via ?benchmarks= (nome -> valor)
+    benchmarks: Optional[Dict[str, float]] = None
+    # Recortes pedidos via ?types= / ?tickers=
+    by_type: Optional[Dict[str, GroupValue]] = None
+    by_ticker: Optional[Dict[str, GroupValue]] = None
+
+# Desempenho de cada aporte (GET /wallet/contributions/performance). Retornos em %.
+class ContributionPerformance(BaseModel):
+    id: int
+    ticker: str
+    type: str
+    trade_date: date
+    qty: float
+    price: float
+    current_price: float
+    invested_value: float
+    current_value: float
+    holding_days: int
+    return_raw: float
+    return_adjusted: float
+    cdi_return: Optional[float] = None
+    vs_cdi: Optional[float] = None    # return_adjusted - cdi_return (p.p.)
 
 # [NOVO] Modelo para o detalhamento anual
 class YearlyPerformance(BaseModel):
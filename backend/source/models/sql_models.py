@@ -1,5 +1,5 @@
 from sqlalchemy import Column, Integer, String, Float, DateTime, UniqueConstraint, Date, Boolean, Numeric, Text, \
-    BigInteger, Identity, UUID, ForeignKey, Table, JSON, CheckConstraint
+    BigInteger, Identity, UUID, ForeignKey, Table, JSON, CheckConstraint, Index
 from sqlalchemy.sql import func
 from backend.source.core.database import Base
 
@@ -47,6 +47,39 @@ class B3Price(Base):
     )
 
 
+class YearlyClose(Base):
+    __tablename__ = "yearly_closes"
+
+    # Último pregão de cada ano por ticker (alimenta o yearly_breakdown do dashboard)
+    ticker = Column(Text, primary_key=True)
+    year = Column(Integer, primary_key=True)
+    trade_date = Column(Date, nullable=False)
+
+    close = Column(Numeric)
+    adjusted_close = Column(Numeric)
+
+
+class TickerMetric(Base):
+    __tablename__ = "ticker_metrics"
+
+    # Indicadores pré-calculados de cada ticker da b3_prices (screener); atualizados a cada /sync
+    ticker = Column(Text, primary_key=True)
+    type = Column(Text, nullable=False)
+
+    price = Column(Float)
+    adjusted_price = Column(Float)
+    mm200 = Column(Float)
+    cagr = Column(Float)
+    adjusted_cagr = Column(Float)
+    sharpe = Column(Float)
+    zscore = Column(Float)
+    data_points = Column(Integer, nullable=False)
+    tag = Column(Text, nullable=False)
+    last_date = Column(Date)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 class IfixHistory(Base):
     __tablename__ = "ifix_history"
 
@@ -99,9 +132,60 @@ class AssetPurchase(Base):
     price = Column(Numeric(10, 2), nullable=False)
     trade_date = Column(Date, nullable=False)
 
+    # Preço ajustado (adjusted_close) do dia da compra, capturado na escrita
+    price_adjusted = Column(Numeric, nullable=True)
+
+    # Hash do conteúdo (ticker, tipo, data, qtd, preço) para importações idempotentes
+    content_hash = Column(String, nullable=True)
+
     # Audit fields
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index('ix_asset_purchases_user_content_hash', 'user_id', 'content_hash'),
+        # Paginação por keyset (trade_date, id) dentro do usuário
+        Index('ix_asset_purchases_user_date_id', 'user_id', 'trade_date', 'id'),
+    )
+
+class WalletPosition(Base):
+    __tablename__ = "wallet_positions"
+
+    # Agregado por (usuário, ticker), mantido pelos endpoints de compras do /wallet
+    user_id = Column(String, primary_key=True)
+    ticker = Column(String, primary_key=True)
+    type = Column(String, nullable=False)
+
+    qty = Column(Float, nullable=False)
+    cost_raw = Column(Float, nullable=False)
+    cost_adjusted = Column(Float, nullable=False)
+    min_date = Column(Date, nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class WalletHistory(Base):
+    __tablename__ = "wallet_history"
+
+    # Série diária persistida da carteira (estendida incrementalmente pelo /wallet)
+    user_id = Column(String, primary_key=True)
+    trade_date = Column(Date, primary_key=True)
+
+    portfolio_value = Column(Float, nullable=False)
+    invested_value = Column(Float, nullable=False)
+    benchmark_value = Column(Float, nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class WalletHistoryPosition(Base):
+    __tablename__ = "wallet_history_positions"
+
+    # Valor e investido de cada ticker por dia, gravados junto com wallet_history (só dias com posição)
+    user_id = Column(String, primary_key=True)
+    trade_date = Column(Date, primary_key=True)
+    ticker = Column(String, primary_key=True)
+
+    value = Column(Float, nullable=False)
+    invested = Column(Float, nullable=False)
+
 class User(Base):
     __tablename__ = "users"
     # O schema padrão geralmente é 'public', mas se precisar ser explícito: